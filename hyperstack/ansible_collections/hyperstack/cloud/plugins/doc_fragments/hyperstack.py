@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+
+class ModuleDocFragment(object):
+
+    # Options selecting the mock state backend or the API, shared by every module
+    DOCUMENTATION = r"""
+options:
+    state_backend:
+        description:
+            - Backend used to persist the mock cloud state.
+            - C(json) keeps one JSON file per environment; C(sqlite) uses an indexed SQLite database in WAL mode.
+            - If not set, the value of the E(HYPERSTACK_STATE_BACKEND) environment variable is used, then C(json).
+        type: str
+        choices: [ json, sqlite ]
+    api_url:
+        description:
+            - Base URL of an API serving the REST schema of this collection's mock backend (C(/environments),
+              C(/environments/<name>/vms) and C(/vms) routes), for example a stand-in server in front of a shared
+              state store.
+            - This is not the Hyperstack Infrahub API; its endpoints are not supported.
+            - If not set, the value of the E(HYPERSTACK_API_URL) environment variable is used; without either, the
+              local mock state selected by O(state_backend) is used.
+        type: str
+    api_key:
+        description:
+            - API key sent with every request to O(api_url).
+            - If not set, the value of the E(HYPERSTACK_API_KEY) environment variable is used.
+        type: str
+    api_timeout:
+        description:
+            - Timeout for each API request (in seconds).
+        type: float
+        default: 30.0
+    api_pool_size:
+        description:
+            - Number of idle keep-alive connections to O(api_url) kept open for reuse.
+        type: int
+        default: 4
+    validate_certs:
+        description:
+            - Whether to validate the TLS certificate of O(api_url).
+        type: bool
+        default: true
+    api_rate_limit:
+        description:
+            - Maximum number of requests per second sent to O(api_url).
+            - The limit is shared by every task on the controller host that talks to the same O(api_url), so it
+              holds for the whole play regardless of the number of forks.
+            - If not set, requests are not limited, but a V(429) or V(503) response still pauses every task
+              talking to that API for the delay given in its C(Retry-After) header.
+        type: float
+    api_max_retries:
+        description:
+            - Number of times a request answered with V(429) or V(503) is retried, waiting for the C(Retry-After)
+              delay (or a growing, jittered delay without one) before each attempt.
+        type: int
+        default: 5
+"""
+
+    # The same options for the inventory plugin, which also reads them from environment variables
+    INVENTORY = r"""
+options:
+    state_backend:
+        description:
+            - Backend used to persist the mock cloud state.
+            - C(json) keeps one JSON file per environment; C(sqlite) uses an indexed SQLite database in WAL mode.
+        type: str
+        choices: [ json, sqlite ]
+        env:
+            - name: HYPERSTACK_STATE_BACKEND
+    api_url:
+        description:
+            - Base URL of an API serving the REST schema of this collection's mock backend (C(/environments),
+              C(/environments/<name>/vms) and C(/vms) routes), for example a stand-in server in front of a shared
+              state store.
+            - This is not the Hyperstack Infrahub API; its endpoints are not supported.
+            - Without it, the local mock state selected by O(state_backend) is used.
+        type: str
+        env:
+            - name: HYPERSTACK_API_URL
+    api_key:
+        description:
+            - API key sent with every request to O(api_url).
+        type: str
+        env:
+            - name: HYPERSTACK_API_KEY
+    api_timeout:
+        description:
+            - Timeout for each API request (in seconds).
+        type: float
+        default: 30.0
+    api_pool_size:
+        description:
+            - Number of idle keep-alive connections to O(api_url) kept open for reuse.
+        type: int
+        default: 4
+    validate_certs:
+        description:
+            - Whether to validate the TLS certificate of O(api_url).
+        type: bool
+        default: true
+    api_rate_limit:
+        description:
+            - Maximum number of requests per second sent to O(api_url).
+            - The limit is shared by every task on the controller host that talks to the same O(api_url), so it
+              holds for the whole play regardless of the number of forks.
+            - If not set, requests are not limited, but a V(429) or V(503) response still pauses every task
+              talking to that API for the delay given in its C(Retry-After) header.
+        type: float
+    api_max_retries:
+        description:
+            - Number of times a request answered with V(429) or V(503) is retried, waiting for the C(Retry-After)
+              delay (or a growing, jittered delay without one) before each attempt.
+        type: int
+        default: 5
+"""
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+DOCUMENTATION = r"""
+name: hyperstack
+short_description: Hyperstack Cloud inventory source
+version_added: "1.0.0"
+description:
+    - Builds an inventory of the VM instances in Hyperstack Cloud.
+    - All environments are read once and every instance is added and grouped in a single pass, instead of calling
+      M(hyperstack.cloud.instance_info) and C(add_host) in every play.
+    - Instances are grouped by environment (C(env_<environment>)), status (C(status_<status>)), size
+      (C(size_<size>)) and image (C(image_<image>)). Further groups can be built with O(keyed_groups) and
+      O(groups).
+    - Hosts are named after their VM. A name used in more than one environment is qualified as
+      C(<environment>.<name>).
+    - The instance details are available as host variables prefixed with C(hyperstack_), for example
+      C(hyperstack_state) and C(hyperstack_environment).
+    - The configuration file must end in C(hyperstack.yml) or C(hyperstack.yaml).
+extends_documentation_fragment:
+    - constructed
+    - inventory_cache
+    - hyperstack.cloud.hyperstack.inventory
+options:
+    plugin:
+        description: Marks this as an instance of the C(hyperstack) plugin.
+        required: true
+        choices: [ hyperstack.cloud.hyperstack ]
+    environments:
+        description:
+            - Only add the instances of these environments.
+            - By default instances of all environments are added.
+        type: list
+        elements: str
+        default: []
+    instance_states:
+        description:
+            - Only add instances in one of these states.
+        type: list
+        elements: str
+        choices: [ running, stopped, hibernated, pending, terminated ]
+        default: []
+    ansible_host:
+        description:
+            - Which address of the instance is used as C(ansible_host).
+            - Instances without an address of that kind fall back to the other one.
+        type: str
+        choices: [ public_ip, private_ip ]
+        default: public_ip
+author:
+    - Your Name (@yourgithubhandle)
+"""
+
+EXAMPLES = r"""
+# hyperstack.yml
+plugin: hyperstack.cloud.hyperstack
+
+# Only running production instances, cached for an hour
+plugin: hyperstack.cloud.hyperstack
+environments:
+  - production
+instance_states:
+  - running
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_connection: /tmp/hyperstack_inventory
+cache_timeout: 3600
+
+# Extra groups from the host variables
+plugin: hyperstack.cloud.hyperstack
+ansible_host: private_ip
+keyed_groups:
+  - key: hyperstack_created_at[:4]
+    prefix: created
+groups:
+  gpu: hyperstack_size.startswith('gpu')
+"""
+
+from ansible.errors import AnsibleError
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable, Constructable
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.api_client import (
+    ApiError,
+    configure_client_from_params,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.instances import (
+    iter_instance_details,
+    run_timestamp,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.state_store import (
+    StateStoreError,
+    configure_store,
+)
+
+# Instance details that become groups, and the prefix of each group
+GROUP_BY = (
+    ("environment", "env"),
+    ("state", "status"),
+    ("size", "size"),
+    ("image", "image"),
+)
+
+HOSTVAR_PREFIX = "hyperstack_"
+
+_CLIENT_OPTIONS = (
+    "api_url", "api_key", "api_timeout", "api_pool_size", "validate_certs", "api_rate_limit", "api_max_retries",
+)
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = "hyperstack.cloud.hyperstack"
+
+    def verify_file(self, path):
+        """Accept only configuration files meant for this plugin."""
+        return super(InventoryModule, self).verify_file(path) and path.endswith(("hyperstack.yml", "hyperstack.yaml"))
+
+    def _fetch_instances(self):
+        """Read the details of every selected instance from the backend."""
+        try:
+            configure_store(self.get_option("state_backend"))
+            client = configure_client_from_params(dict((name, self.get_option(name)) for name in _CLIENT_OPTIONS))
+            statuses = self.get_option("instance_states") or None
+            # The controller outlives a single inventory refresh
+            run_timestamp(refresh=True)
+            environments = self.get_option("environments") or [None]
+            return [
+                instance
+                for env_name in environments
+                for instance in iter_instance_details(client, env_name, statuses=statuses)
+            ]
+        except (StateStoreError, ApiError, ValueError) as e:
+            raise AnsibleError(f"Failed to read Hyperstack instances: {e}")
+
+    def _hostnames(self, instances):
+        """Return the inventory hostname of each instance, qualifying names used in several environments."""
+        counts = {}
+        for instance in instances:
+            counts[instance["name"]] = counts.get(instance["name"], 0) + 1
+        return [
+            instance["name"] if counts[instance["name"]] == 1 else f"{instance['environment']}.{instance['name']}"
+            for instance in instances
+        ]
+
+    def _populate(self, instances):
+        """Add every instance with its groups and host variables in one pass."""
+        address = self.get_option("ansible_host")
+        fallback = "private_ip" if address == "public_ip" else "public_ip"
+        strict = self.get_option("strict")
+
+        for hostname, instance in zip(self._hostnames(instances), instances):
+            self.inventory.add_host(hostname)
+            hostvars = dict((HOSTVAR_PREFIX + key, value) for key, value in instance.items())
+            for key, value in hostvars.items():
+                self.inventory.set_variable(hostname, key, value)
+            ansible_host = instance.get(address) or instance.get(fallback)
+            if ansible_host:
+                self.inventory.set_variable(hostname, "ansible_host", ansible_host)
+
+            for key, prefix in GROUP_BY:
+                group = self.inventory.add_group(self._sanitize_group_name(f"{prefix}_{instance[key]}"))
+                self.inventory.add_child(group, hostname)
+
+            self._set_composite_vars(self.get_option("compose"), hostvars, hostname, strict=strict)
+            self._add_host_to_composed_groups(self.get_option("groups"), hostvars, hostname, strict=strict)
+            self._add_host_to_keyed_groups(self.get_option("keyed_groups"), hostvars, hostname, strict=strict)
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path, cache=cache)
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+        user_cache_setting = self.get_option("cache")
+        attempt_to_read_cache = user_cache_setting and cache
+        cache_needs_update = user_cache_setting and not cache
+
+        instances = None
+        if attempt_to_read_cache:
+            try:
+                instances = self._cache[cache_key]
+            except KeyError:
+                cache_needs_update = True
+        if instances is None:
+            instances = self._fetch_instances()
+        if cache_needs_update:
+            self._cache[cache_key] = instances
+
+        self._populate(instances)
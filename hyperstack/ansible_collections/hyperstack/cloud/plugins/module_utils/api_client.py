@@ -0,0 +1,532 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Hyperstack Cloud API client shared by the modules.
+
+The client speaks a small REST API and hands every request to a pluggable
+transport:
+
+- StoreTransport answers requests from the local state store (the mock
+  backend). It is used when no API URL is configured.
+- HTTPTransport sends requests to an HTTP(S) endpoint serving the same
+  REST schema, for example a local stand-in server. The schema is the
+  collection's own (see StoreTransport.request for the routes), not the
+  Hyperstack Infrahub API. It keeps a pool of
+  persistent keep-alive connections, so a module run pays for the TCP and
+  TLS handshakes once instead of on every call. Requests are paced by a
+  token bucket shared with the other forks (see rate_limit), and 429 or
+  503 responses are retried after their Retry-After delay.
+
+One client is shared per process, like the state store, so every lookup
+and change made during a module run reuses the same connections.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import http.client
+import json
+import queue
+import ssl
+import threading
+from urllib.parse import quote, unquote, urlencode, urlsplit
+
+from ansible.module_utils.basic import env_fallback
+from ansible_collections.hyperstack.cloud.plugins.module_utils.backoff import Backoff
+from ansible_collections.hyperstack.cloud.plugins.module_utils.change_watch import ChangeWatcher
+from ansible_collections.hyperstack.cloud.plugins.module_utils.rate_limit import (
+    DEFAULT_MAX_RETRIES,
+    RETRY_STATUSES,
+    TokenBucket,
+    bucket_path,
+    parse_retry_after,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.read_cache import invalidate
+from ansible_collections.hyperstack.cloud.plugins.module_utils.state_store import (
+    STATE_BACKEND_ENV,
+    STATE_BACKENDS,
+    get_store,
+)
+
+# Environment variables that configure the API endpoint
+API_URL_ENV = "HYPERSTACK_API_URL"
+API_KEY_ENV = "HYPERSTACK_API_KEY"
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_POOL_SIZE = 4
+
+
+class ApiError(Exception):
+    """Raised when an API request fails. status is the HTTP status, or None if no response was received."""
+
+    def __init__(self, msg, status=None):
+        super(ApiError, self).__init__(msg)
+        self.status = status
+
+
+def _path(*parts):
+    """Join URL path segments, quoting each one."""
+    return "/" + "/".join(quote(str(part), safe="") for part in parts)
+
+
+class StoreTransport(object):
+    """
+    Serves the API from the shared state store.
+
+    The store is looked up on every request, so configure_store() and
+    set_store() take effect immediately.
+    """
+
+    def request(self, method, path, query=None, body=None):
+        """Handle one request and return (status, payload)."""
+        parts = [unquote(part) for part in path.strip("/").split("/")]
+        store = get_store()
+        query = query or {}
+
+        if parts == ["vms"] and method == "GET":
+            if query.get("name"):
+                found = store.find_vms(query["name"])
+            elif query.get("ip"):
+                found = store.find_vms_by_ip(query["ip"])
+            else:
+                statuses = query.get("status", "").split(",") if query.get("status") else None
+                found = store.iter_vms(query.get("environment"), statuses=statuses)
+            return 200, {"vms": [{"environment": env, "name": name, "data": data} for env, name, data in found]}
+
+        if len(parts) == 2 and parts[0] == "environments":
+            env_name = parts[1]
+            if method == "GET":
+                env = store.get_environment(env_name)
+                return (404, None) if env is None else (200, env)
+            if method == "PUT":
+                store.put_environment(env_name, body)
+                return 200, {}
+            if method == "DELETE":
+                return 200, {"deleted": store.delete_environment(env_name)}
+
+        if len(parts) == 3 and parts[0] == "environments":
+            env_name = parts[1]
+            if parts[2] == "rules" and method == "PATCH":
+                return 200, {"updated": store.update_rules(env_name, body["added"], body["removed"])}
+            if parts[2] == "converged" and method == "PUT":
+                return 200, {"updated": store.mark_converged(env_name, body["spec"])}
+
+        if len(parts) == 4 and parts[0] == "environments" and parts[2] == "vms":
+            env_name, vm_name = parts[1], parts[3]
+            if method == "GET":
+                vm_data = store.get_vm(env_name, vm_name)
+                return (404, None) if vm_data is None else (200, vm_data)
+            if method == "PUT":
+                return 200, {"updated": store.put_vm(env_name, vm_name, body)}
+            if method == "PATCH":
+                return 200, {"updated": store.update_vm(env_name, vm_name, **body)}
+            if method == "DELETE":
+                return 200, {"deleted": store.delete_vm(env_name, vm_name)}
+
+        return 404, {"message": f"No route for {method} {path}"}
+
+    @property
+    def scope(self):
+        """Identifies the state this transport serves, for cache keys."""
+        store = get_store()
+        return f"store:{store.backend}:{store.location}"
+
+    def flush(self):
+        """Persist the changes made through this transport."""
+        get_store().flush()
+
+    def refresh(self):
+        """Drop cached state so the next request sees changes made by other tasks."""
+        get_store().reload()
+
+    def watch(self):
+        """Return a ChangeWatcher for the state behind this transport."""
+        return get_store().watch()
+
+    def lock_stats(self):
+        """Return the lock contention counters of the state store."""
+        return get_store().lock_stats()
+
+    def close(self):
+        """Nothing to release."""
+
+
+class HTTPTransport(object):
+    """
+    Sends requests to an HTTP(S) API over pooled keep-alive connections.
+
+    Up to pool_size idle connections are kept open and reused; more may be
+    opened while several threads send requests at once. A request that
+    fails because the server closed an idle connection is retried once on
+    a new connection.
+
+    Every request first takes a token from bucket. A 429 or 503 response
+    pauses the bucket for its Retry-After delay (or a growing backoff
+    without one) and is retried up to max_retries times.
+    """
+
+    def __init__(self, base_url, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, headers=None,
+                 validate_certs=True, bucket=None, max_retries=DEFAULT_MAX_RETRIES):
+        url = urlsplit(base_url)
+        if url.scheme not in ("http", "https") or not url.hostname:
+            raise ValueError(f"invalid API URL '{base_url}'")
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        if max_retries < 0:
+            raise ValueError("max_retries must not be negative")
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.base_path = url.path.rstrip("/")
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self.pool_size = pool_size
+        self.bucket = bucket or TokenBucket()
+        self.max_retries = max_retries
+        self._context = None
+        if self.scheme == "https":
+            self._context = ssl.create_default_context()
+            if not validate_certs:
+                self._context.check_hostname = False
+                self._context.verify_mode = ssl.CERT_NONE
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "connections": 0, "reused": 0, "throttled": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _connect(self):
+        """Open a new connection."""
+        self._count("connections")
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self._context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        """Return (connection, reused), reusing an idle connection if there is one."""
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect(), False
+        self._count("reused")
+        return connection, True
+
+    def _release(self, connection):
+        """Return a connection to the pool, or close it if the pool is full."""
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, method, path, query=None, body=None):
+        """Send one request and return (status, payload)."""
+        url = self.base_path + path
+        if query:
+            url += "?" + urlencode(query)
+        headers = {"Accept": "application/json"}
+        headers.update(self.headers)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        self._count("requests")
+        backoff = None
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            response, data = self._send(method, url, payload, headers)
+            if response.status not in RETRY_STATUSES or attempt >= self.max_retries:
+                break
+            attempt += 1
+            self._count("throttled")
+            delay = parse_retry_after(response.getheader("Retry-After"))
+            if delay is None:
+                backoff = backoff or Backoff()
+                delay = backoff.next_delay()
+            # Every fork sharing the bucket holds off, not just this request
+            self.bucket.pause(delay)
+
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            raise ApiError(f"{method} {url} returned invalid JSON", status=response.status)
+
+    def _send(self, method, url, payload, headers):
+        """Send one request over a pooled connection and return (response, body)."""
+        retried = False
+        while True:
+            connection, reused = self._acquire()
+            try:
+                connection.request(method, url, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                connection.close()
+                # The server closed an idle keep-alive connection; try once more on a new one
+                if reused and not retried:
+                    retried = True
+                    continue
+                raise ApiError(f"{method} {url} failed: {e}")
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                raise ApiError(f"{method} {url} failed: {e}")
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+        return response, data
+
+    @property
+    def scope(self):
+        """Identifies the API this transport talks to, for cache keys."""
+        port = f":{self.port}" if self.port else ""
+        return f"api:{self.scheme}://{self.host}{port}{self.base_path}"
+
+    def flush(self):
+        """Changes are applied by the server as they are made."""
+
+    def refresh(self):
+        """Every request already reads the current state."""
+
+    def watch(self):
+        """Change notifications are not available over HTTP; waiting falls back to sleeping."""
+        return ChangeWatcher(None)
+
+    def lock_stats(self):
+        """The server's locks are not visible over HTTP."""
+        return None
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class HyperstackClient(object):
+    """
+    Typed calls to the Hyperstack Cloud API.
+
+    Lookups return None for missing resources; other failures raise
+    ApiError. VM listings are (env_name, vm_name, vm_data) tuples, like the
+    state store's.
+
+    flush() after any change also invalidates the cached instance_info
+    results (see read_cache).
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self._changed = False
+
+    @property
+    def scope(self):
+        """Identifies the backend behind this client, for cache keys."""
+        return self.transport.scope
+
+    def _call(self, method, path, query=None, body=None, missing_ok=False):
+        if method != "GET":
+            self._changed = True
+        status, payload = self.transport.request(method, path, query=query, body=body)
+        if status == 404 and missing_ok:
+            return None
+        if status >= 400:
+            message = payload.get("message") if isinstance(payload, dict) else None
+            raise ApiError(f"{method} {path} failed with status {status}: {message or 'no details'}", status=status)
+        return payload
+
+    def _vms(self, query):
+        payload = self._call("GET", "/vms", query=query)
+        return [(vm["environment"], vm["name"], vm["data"]) for vm in payload["vms"]]
+
+    # Environments
+
+    def get_environment(self, name):
+        """Return the data for an environment, or None if it does not exist."""
+        return self._call("GET", _path("environments", name), missing_ok=True)
+
+    def create_environment(self, name, data):
+        """Create or replace an environment."""
+        self._call("PUT", _path("environments", name), body=data)
+
+    def delete_environment(self, name):
+        """Delete an environment. Returns True if it existed."""
+        return self._call("DELETE", _path("environments", name))["deleted"]
+
+    def update_rules(self, env_name, added=(), removed=()):
+        """Open the ports of the added rules and close those of the removed ones."""
+        body = {"added": list(added), "removed": list(removed)}
+        return self._call("PATCH", _path("environments", env_name, "rules"), body=body)["updated"]
+
+    def mark_converged(self, env_name, spec_hash):
+        """
+        Record that the environment matches the desired spec with the given
+        hash. The mark only enables a fast path, so it is best-effort: returns
+        False if the server does not offer the route (404 or 405).
+        """
+        try:
+            payload = self._call("PUT", _path("environments", env_name, "converged"), body={"spec": spec_hash})
+        except ApiError as e:
+            if e.status in (404, 405):
+                return False
+            raise
+        return payload["updated"]
+
+    # Virtual machines
+
+    def iter_vms(self, env_name=None, statuses=None):
+        """Return the VMs, optionally limited to one environment and/or to the given statuses."""
+        query = {}
+        if env_name is not None:
+            query["environment"] = env_name
+        if statuses:
+            query["status"] = ",".join(statuses)
+        return self._vms(query)
+
+    def find_vms(self, vm_name):
+        """Return every VM called vm_name, ordered by environment."""
+        return self._vms({"name": vm_name})
+
+    def find_vms_by_ip(self, ip_address):
+        """Return every VM whose public or private IP is ip_address."""
+        return self._vms({"ip": ip_address})
+
+    def get_vm(self, env_name, vm_name):
+        """Return the data for a VM, or None if it does not exist."""
+        return self._call("GET", _path("environments", env_name, "vms", vm_name), missing_ok=True)
+
+    def put_vm(self, env_name, vm_name, data):
+        """Create or replace a VM. Returns True if the environment exists."""
+        return self._call("PUT", _path("environments", env_name, "vms", vm_name), body=data)["updated"]
+
+    def update_vm(self, env_name, vm_name, **fields):
+        """Update fields of an existing VM. Returns True if the VM exists."""
+        return self._call("PATCH", _path("environments", env_name, "vms", vm_name), body=fields)["updated"]
+
+    def delete_vm(self, env_name, vm_name):
+        """Delete a VM. Returns True if it existed."""
+        return self._call("DELETE", _path("environments", env_name, "vms", vm_name))["deleted"]
+
+    # Session
+
+    def flush(self):
+        """Persist the changes made in this run (a no-op for remote APIs) and invalidate cached reads."""
+        self.transport.flush()
+        if self._changed:
+            self._changed = False
+            invalidate()
+
+    def refresh(self):
+        """Make the next calls see changes made by other tasks."""
+        self.transport.refresh()
+
+    def watch(self):
+        """Return a ChangeWatcher that wakes when the state changes, where the transport supports it."""
+        return self.transport.watch()
+
+    def lock_stats(self):
+        """Return the lock contention counters of the state behind the transport, or None if it has none."""
+        return self.transport.lock_stats()
+
+    def close(self):
+        """Release the transport's connections."""
+        self.transport.close()
+
+
+_client = None
+_client_config = None
+
+
+def open_client(api_url=None, api_key=None, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE,
+                validate_certs=True, rate_limit=None, max_retries=DEFAULT_MAX_RETRIES):
+    """
+    Return a new client: over HTTP when api_url is set, otherwise served
+    from the state store. HTTP clients for the same api_url share one
+    token bucket of rate_limit requests per second (unlimited if None).
+    """
+    if not api_url:
+        return HyperstackClient(StoreTransport())
+    headers = {"api_key": api_key} if api_key else None
+    bucket = TokenBucket(rate_limit, path=bucket_path(api_url))
+    return HyperstackClient(HTTPTransport(
+        api_url, pool_size=pool_size, timeout=timeout, headers=headers, validate_certs=validate_certs,
+        bucket=bucket, max_retries=max_retries,
+    ))
+
+
+def get_client():
+    """Return the client shared by this process, served from the state store unless configured otherwise."""
+    global _client
+    if _client is None:
+        _client = open_client()
+    return _client
+
+
+def configure_client(api_url=None, api_key=None, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE,
+                     validate_certs=True, rate_limit=None, max_retries=DEFAULT_MAX_RETRIES):
+    """
+    Make the shared client talk to api_url (or the state store if it is
+    empty). The current client, and its open connections, is kept if it
+    already has the same settings.
+    """
+    global _client_config
+    config = (api_url or None, api_key, timeout, pool_size, validate_certs, rate_limit, max_retries)
+    if _client is None or config != _client_config:
+        set_client(open_client(api_url, api_key, timeout, pool_size, validate_certs, rate_limit, max_retries))
+        _client_config = config
+    return _client
+
+
+def hyperstack_argument_spec():
+    """Return the argument_spec of the state_backend, api_* and validate_certs options shared by the modules."""
+    return dict(
+        state_backend=dict(type="str", choices=STATE_BACKENDS, fallback=(env_fallback, [STATE_BACKEND_ENV])),
+        api_url=dict(type="str", fallback=(env_fallback, [API_URL_ENV])),
+        api_key=dict(type="str", no_log=True, fallback=(env_fallback, [API_KEY_ENV])),
+        api_timeout=dict(type="float", default=DEFAULT_TIMEOUT),
+        api_pool_size=dict(type="int", default=DEFAULT_POOL_SIZE),
+        validate_certs=dict(type="bool", default=True),
+        api_rate_limit=dict(type="float"),
+        api_max_retries=dict(type="int", default=DEFAULT_MAX_RETRIES),
+    )
+
+
+def configure_client_from_params(params):
+    """Configure the shared client from the api_* and validate_certs module options."""
+    return configure_client(
+        params.get("api_url"),
+        params.get("api_key"),
+        params.get("api_timeout", DEFAULT_TIMEOUT),
+        params.get("api_pool_size", DEFAULT_POOL_SIZE),
+        params.get("validate_certs", True),
+        params.get("api_rate_limit"),
+        params.get("api_max_retries", DEFAULT_MAX_RETRIES),
+    )
+
+
+def set_client(client):
+    """Replace the shared client, closing the previous one. Returns the new client."""
+    global _client, _client_config
+    if _client is not None and _client is not client:
+        _client.close()
+    _client = client
+    _client_config = None
+    return client
+
+
+def add_lock_stats(result):
+    """Report the state store's lock contention counters in result, when the local mock state is used."""
+    stats = get_client().lock_stats()
+    if stats is not None:
+        result["lock_stats"] = stats
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Exponential backoff with jitter for polling loops.
+
+The first poll follows a state change quickly; later polls spread out up
+to a ceiling. Jitter keeps many tasks waiting on the same state from
+polling in lockstep.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import random
+
+DEFAULT_INITIAL_INTERVAL = 0.5
+DEFAULT_MAX_INTERVAL = 10.0
+DEFAULT_MULTIPLIER = 2.0
+
+
+class Backoff(object):
+    """
+    Produces the delays between polls and counts the polls made.
+
+    Each delay is drawn uniformly from the upper half of the current
+    interval ("equal jitter"), then the interval grows by multiplier until
+    it reaches max_interval.
+    """
+
+    def __init__(self, initial_interval=DEFAULT_INITIAL_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 multiplier=DEFAULT_MULTIPLIER):
+        if initial_interval <= 0:
+            raise ValueError("initial_interval must be greater than 0")
+        if max_interval < initial_interval:
+            raise ValueError("max_interval must not be smaller than initial_interval")
+        if multiplier < 1:
+            raise ValueError("multiplier must be at least 1")
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.interval = initial_interval
+        self.polls = 0
+
+    def poll(self):
+        """Record one poll."""
+        self.polls += 1
+
+    def next_delay(self):
+        """Return how long to sleep before the next poll and grow the interval."""
+        delay = random.uniform(self.interval / 2, self.interval)
+        self.interval = min(self.interval * self.multiplier, self.max_interval)
+        return delay
+
+    def reset(self):
+        """Start again from the initial interval."""
+        self.interval = self.initial_interval
+        self.polls = 0
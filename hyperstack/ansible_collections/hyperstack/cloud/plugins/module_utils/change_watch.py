@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Block until the state store changes on disk.
+
+On Linux the watcher uses inotify on the state directory, so waiters wake
+as soon as another task writes the state and use no CPU or I/O while
+nothing changes. Elsewhere, or when inotify cannot be set up, waiting
+falls back to sleeping for the requested time.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import errno
+import os
+import select
+import struct
+import time
+
+try:
+    import ctypes
+    import ctypes.util
+
+    _LIBC = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+    HAS_INOTIFY = hasattr(_LIBC, "inotify_init1") and hasattr(_LIBC, "inotify_add_watch")
+except (ImportError, OSError):
+    HAS_INOTIFY = False
+
+# Flags and event masks from <sys/inotify.h>
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+
+WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class ChangeWatcher(object):
+    """
+    Watches a directory for changes to the files accepted by match(name).
+    A directory of None, or one that does not exist yet, always sleeps.
+
+    Create the watcher before checking the state, then call wait(): changes
+    made in between are queued by the kernel and wake the next wait().
+    """
+
+    def __init__(self, directory, match=None):
+        self.directory = directory
+        self.match = match or (lambda name: True)
+        self._fd = None
+        if HAS_INOTIFY and directory and os.path.isdir(directory):
+            self._fd = _inotify_open(directory)
+
+    @property
+    def notifying(self):
+        """Whether change notifications are available, as opposed to sleeping."""
+        return self._fd is not None
+
+    def wait(self, timeout):
+        """
+        Wait up to timeout seconds for a matching change.
+
+        Returns True when woken by a change, False when the timeout passed.
+        Without notifications this sleeps for the whole timeout and returns
+        False.
+        """
+        if self._fd is None:
+            time.sleep(timeout)
+            return False
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                ready, _, _ = select.select([self._fd], [], [], remaining)
+            except (OSError, ValueError):
+                time.sleep(remaining)
+                return False
+            if ready and self._drain():
+                return True
+
+    def _drain(self):
+        """Read the queued events and return True if any matches."""
+        matched = False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return matched
+                raise
+            if not data:
+                return matched
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].split(b"\0", 1)[0].decode("utf-8", "replace")
+                offset += length
+                # An overflowed queue may have dropped a matching event
+                if mask & _IN_Q_OVERFLOW or self.match(name):
+                    matched = True
+
+    def close(self):
+        """Stop watching."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def _inotify_open(directory):
+    """Return an inotify descriptor watching directory, or None if that is not possible."""
+    fd = _LIBC.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    if fd < 0:
+        return None
+    if _LIBC.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+        os.close(fd)
+        return None
+    return fd
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Advisory file locks shared between forks.
+
+Readers take a shared lock and writers an exclusive one, so any number of
+tasks can read the state concurrently while writes are serialized. Waiting
+is bounded, and every lock keeps contention counters that callers can
+report.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+# Default number of seconds to wait for a lock before giving up
+DEFAULT_LOCK_TIMEOUT = 30.0
+
+# Interval between attempts while a lock is contended
+_RETRY_INTERVAL = 0.01
+_MAX_RETRY_INTERVAL = 0.2
+
+
+class LockTimeout(Exception):
+    """Raised when a lock cannot be acquired within the timeout."""
+
+
+class LockStats(object):
+    """Contention counters for a FileLock."""
+
+    __slots__ = ("acquired", "contended", "timeouts", "wait_time", "max_wait")
+
+    def __init__(self):
+        self.acquired = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def record(self, waited, contended):
+        """Record one successful acquisition."""
+        self.acquired += 1
+        if contended:
+            self.contended += 1
+        self.wait_time += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def as_dict(self):
+        """Return the counters as a plain dictionary."""
+        return {
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "timeouts": self.timeouts,
+            "wait_time": round(self.wait_time, 4),
+            "max_wait": round(self.max_wait, 4),
+        }
+
+
+class FileLock(object):
+    """
+    Shared/exclusive advisory lock on a lock file.
+
+    Locks are not re-entrant. On platforms without fcntl the lock is a no-op.
+    """
+
+    def __init__(self, path, timeout=DEFAULT_LOCK_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.stats = LockStats()
+
+    @contextmanager
+    def shared(self):
+        """Hold the lock in shared (reader) mode."""
+        with self._locked(exclusive=False):
+            yield
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the lock in exclusive (writer) mode."""
+        with self._locked(exclusive=True):
+            yield
+
+    @contextmanager
+    def _locked(self, exclusive):
+        if not HAS_FCNTL:
+            yield
+            return
+
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        except OSError:
+            # The directory is not writable; writes will fail on their own, reads need no lock
+            yield
+            return
+
+        try:
+            self._acquire(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _acquire(self, fd, mode):
+        """Acquire the lock, retrying with a growing interval until the timeout expires."""
+        start = time.monotonic()
+        interval = _RETRY_INTERVAL
+        contended = False
+        while True:
+            try:
+                fcntl.flock(fd, mode | fcntl.LOCK_NB)
+                self.stats.record(time.monotonic() - start, contended)
+                return
+            except (IOError, OSError):
+                contended = True
+            waited = time.monotonic() - start
+            if waited >= self.timeout:
+                self.stats.timeouts += 1
+                raise LockTimeout(f"Timed out after {waited:.2f}s waiting for lock '{self.path}'")
+            time.sleep(min(interval, self.timeout - waited))
+            interval = min(interval * 2, _MAX_RETRY_INTERVAL)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Firewall rules as merged port intervals.
+
+A rule opens a single port or a port range for one protocol, optionally
+only from one source CIDR. Rules are stored in canonical form: for every
+(protocol, source_cidr) pair the ports are kept as sorted, non-overlapping
+intervals, with overlapping and adjacent rules coalesced. A single port is
+written as "port", a range as "port_range": "low-high".
+
+Diffs are computed on the intervals, so narrowing 30000-32767 to
+30000-32000 removes 32001-32767 instead of replacing the whole range.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import ipaddress
+
+MIN_PORT = 1
+MAX_PORT = 65535
+
+
+def parse_port_range(value):
+    """Return (low, high) for a "low-high" or single port string. Raises ValueError if it is invalid."""
+    text = str(value).strip()
+    low, sep, high = text.partition("-")
+    try:
+        low = int(low)
+        high = int(high) if sep else low
+    except ValueError:
+        raise ValueError(f"invalid port range '{value}', expected 'low-high'")
+    if not MIN_PORT <= low <= high <= MAX_PORT:
+        raise ValueError(f"invalid port range '{value}', ports must be {MIN_PORT}-{MAX_PORT} with low <= high")
+    return low, high
+
+
+def _port_interval(rule):
+    """Return the (low, high) ports of a rule."""
+    if rule.get("port_range") is not None:
+        if rule.get("port") is not None:
+            raise ValueError("port and port_range are mutually exclusive")
+        return parse_port_range(rule["port_range"])
+    if rule.get("port") is None:
+        raise ValueError("one of port or port_range is required")
+    return parse_port_range(rule["port"])
+
+
+def _source(rule):
+    """Return the normalized source CIDR of a rule, or None for any source."""
+    cidr = rule.get("source_cidr")
+    if cidr is None:
+        return None
+    try:
+        return str(ipaddress.ip_network(str(cidr), strict=False))
+    except ValueError:
+        raise ValueError(f"invalid source_cidr '{cidr}'")
+
+
+def _merge(intervals):
+    """Sort intervals and coalesce overlapping and adjacent ones."""
+    merged = []
+    for low, high in sorted(intervals):
+        if merged and low <= merged[-1][1] + 1:
+            if high > merged[-1][1]:
+                merged[-1] = (merged[-1][0], high)
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def _subtract(intervals, removed):
+    """Return the parts of the merged intervals not covered by the merged removed intervals."""
+    result = []
+    start = 0
+    for low, high in intervals:
+        while start < len(removed) and removed[start][1] < low:
+            start += 1
+        for removed_low, removed_high in removed[start:]:
+            if removed_low > high:
+                break
+            if removed_low > low:
+                result.append((low, removed_low - 1))
+            low = max(low, removed_high + 1)
+        if low <= high:
+            result.append((low, high))
+    return result
+
+
+def to_intervals(rules):
+    """Group rules by (protocol, source_cidr) into merged port intervals. Raises ValueError on invalid rules."""
+    groups = {}
+    for rule in rules or []:
+        key = (rule["protocol"], _source(rule))
+        groups.setdefault(key, []).append(_port_interval(rule))
+    return dict((key, _merge(intervals)) for key, intervals in groups.items())
+
+
+def from_intervals(groups):
+    """Return the canonical rule list for grouped intervals."""
+    rules = []
+    for (protocol, source), intervals in sorted(groups.items(), key=lambda item: (item[0][0], item[0][1] or "")):
+        for low, high in intervals:
+            rule = {"protocol": protocol}
+            if low == high:
+                rule["port"] = low
+            else:
+                rule["port_range"] = f"{low}-{high}"
+            if source is not None:
+                rule["source_cidr"] = source
+            rules.append(rule)
+    return rules
+
+
+def merge_rules(rules):
+    """Return rules in canonical form: merged intervals, sorted by protocol, source and port."""
+    return from_intervals(to_intervals(rules))
+
+
+def diff_rules(current, desired):
+    """
+    Compare two rule lists as port intervals.
+
+    Returns (added, removed) in canonical form: the ports opened only by
+    desired and the ports opened only by current. Order, duplicates and
+    how ports are split into rules do not count as differences.
+    """
+    current_groups = to_intervals(current)
+    desired_groups = to_intervals(desired)
+    added, removed = {}, {}
+    for key in set(current_groups) | set(desired_groups):
+        current_intervals = current_groups.get(key, [])
+        desired_intervals = desired_groups.get(key, [])
+        added[key] = _subtract(desired_intervals, current_intervals)
+        removed[key] = _subtract(current_intervals, desired_intervals)
+    return from_intervals(added), from_intervals(removed)
+
+
+def apply_rule_delta(rules, added=(), removed=()):
+    """Return rules with the removed ports closed and the added ports opened, in canonical form."""
+    groups = to_intervals(rules)
+    for key, intervals in to_intervals(removed).items():
+        if key in groups:
+            groups[key] = _subtract(groups[key], intervals)
+    for key, intervals in to_intervals(added).items():
+        groups[key] = _merge(groups.get(key, []) + intervals)
+    return from_intervals(groups)
+
+
+def format_rule(rule):
+    """Format one rule as protocol:ports, followed by the source if it is restricted."""
+    ports = rule["port_range"] if rule.get("port_range") is not None else rule["port"]
+    text = f"{rule['protocol']}:{ports}"
+    if rule.get("source_cidr") is not None:
+        text += f" from {rule['source_cidr']}"
+    return text
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Instance details as reported by instance_info and the inventory plugin.
+
+Lookups are lazy pipelines over the (env_name, vm_name, vm_data) tuples
+returned by the API client: status and attribute filters and pagination
+run on those tuples, so records are only built for the instances that are
+returned, and only the fields that were asked for are computed.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+from datetime import datetime, timezone
+from fnmatch import fnmatchcase
+from itertools import islice
+
+DEFAULT_CREATED_AT = "2024-01-01T00:00:00Z"
+
+
+# How each reported field is computed from (env_name, vm_name, vm_data), in reporting order. Addresses
+# are assigned from the environment's IP pools when a VM is created, so they are only read here.
+_FIELDS = (
+    ("name", lambda env_name, vm_name, vm_data: vm_name),
+    ("state", lambda env_name, vm_name, vm_data: vm_data.get("status", "unknown")),
+    ("public_ip", lambda env_name, vm_name, vm_data: vm_data.get("public_ip")),
+    ("private_ip", lambda env_name, vm_name, vm_data: vm_data.get("private_ip")),
+    ("size", lambda env_name, vm_name, vm_data: vm_data.get("size", "unknown")),
+    ("image", lambda env_name, vm_name, vm_data: vm_data.get("image", "unknown")),
+    ("environment", lambda env_name, vm_name, vm_data: env_name),
+    ("created_at", lambda env_name, vm_name, vm_data: vm_data.get("created_at", DEFAULT_CREATED_AT)),
+    ("last_seen", lambda env_name, vm_name, vm_data: run_timestamp()),
+)
+
+FIELDS = tuple(name for name, _ in _FIELDS)
+
+# Fields that identify an instance and are reported whatever the projection
+KEY_FIELDS = ("name", "environment")
+
+_run_timestamp = None
+
+
+def run_timestamp(refresh=False):
+    """
+    Return the last_seen timestamp of this run. It is formatted once and
+    shared by every record; refresh starts a new run in a long-lived
+    process such as the inventory plugin.
+    """
+    global _run_timestamp
+    if _run_timestamp is None or refresh:
+        _run_timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    return _run_timestamp
+
+
+class InstanceRecord(object):
+    """
+    The reported details of one VM.
+
+    Only the given fields (all by default) are computed; the slots of the
+    others stay empty. Records only reference the values of the VM data and
+    the run's shared timestamp, and are converted to a dict by as_dict()
+    when the results are serialized.
+    """
+
+    __slots__ = FIELDS + ("_fields",)
+
+    def __init__(self, env_name, vm_name, vm_data, fields=FIELDS):
+        self._fields = fields
+        for name, getter in _FIELDS:
+            if name in fields:
+                setattr(self, name, getter(env_name, vm_name, vm_data))
+
+    def as_dict(self):
+        """Return the computed fields as a dict, in reporting order."""
+        return dict((name, getattr(self, name)) for name in self._fields)
+
+
+def _projection(fields):
+    """Return the requested fields plus the key fields, in reporting order."""
+    if not fields:
+        return FIELDS
+    unknown = set(fields) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}. Valid fields: {', '.join(FIELDS)}")
+    wanted = set(fields) | set(KEY_FIELDS)
+    return tuple(name for name in FIELDS if name in wanted)
+
+
+def instance_details(env_name, vm_name, vm_data, fields=None):
+    """Return the reported details of one VM, or only the given fields (and the key fields)."""
+    return InstanceRecord(env_name, vm_name, vm_data, _projection(fields)).as_dict()
+
+
+def iter_records(vms, fields=FIELDS):
+    """Yield an InstanceRecord of the given fields for each (env_name, vm_name, vm_data) tuple."""
+    for env_name, vm_name, vm_data in vms:
+        yield InstanceRecord(env_name, vm_name, vm_data, fields)
+
+
+def iter_details(vms, fields=None):
+    """Yield the details of each (env_name, vm_name, vm_data) tuple, projected on fields if given."""
+    for record in iter_records(vms, _projection(fields)):
+        yield record.as_dict()
+
+
+def filter_vms_by_status(vms, statuses):
+    """Yield the (env_name, vm_name, vm_data) tuples whose status is one of statuses, or all if it is empty."""
+    if not statuses:
+        return iter(vms)
+    return (vm for vm in vms if vm[2].get("status", "unknown") in statuses)
+
+
+def _timestamp(value):
+    """Parse an ISO 8601 timestamp; one without a timezone is taken as UTC. Raises ValueError if it is invalid."""
+    text = str(value).strip()
+    if text.endswith(("Z", "z")):
+        text = text[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def vm_filter(filters):
+    """
+    Return a predicate on (env_name, vm_name, vm_data) tuples for instance_info's filters, or None if there
+    are none. Lists match any of their values, environment is a glob pattern, and created_before and
+    created_after are ISO 8601 timestamps. Raises ValueError on invalid timestamps.
+    """
+    filters = dict((key, value) for key, value in (filters or {}).items() if value not in (None, []))
+    if not filters:
+        return None
+    sizes = set(filters.get("size") or ())
+    images = set(filters.get("image") or ())
+    pattern = filters.get("environment")
+    before = _timestamp(filters["created_before"]) if filters.get("created_before") else None
+    after = _timestamp(filters["created_after"]) if filters.get("created_after") else None
+
+    def match(vm):
+        env_name, _, vm_data = vm
+        if sizes and vm_data.get("size", "unknown") not in sizes:
+            return False
+        if images and vm_data.get("image", "unknown") not in images:
+            return False
+        if pattern and not fnmatchcase(env_name, pattern):
+            return False
+        if before or after:
+            try:
+                created = _timestamp(vm_data.get("created_at", DEFAULT_CREATED_AT))
+            except ValueError:
+                return False
+            if before and created >= before:
+                return False
+            if after and created <= after:
+                return False
+        return True
+
+    return match
+
+
+def filter_vms(vms, filters):
+    """Yield the (env_name, vm_name, vm_data) tuples matching instance_info's filters."""
+    match = vm_filter(filters)
+    if match is None:
+        return iter(vms)
+    return (vm for vm in vms if match(vm))
+
+
+def paginate(items, offset=0, limit=None):
+    """
+    Return (page, total): the items from offset on, at most limit of them
+    (all if limit is None), and the total number of items. Only the page
+    is kept; the items before and after it are just counted.
+    """
+    iterator = iter(items)
+    skipped = sum(1 for _ in islice(iterator, offset))
+    page = list(iterator if limit is None else islice(iterator, limit))
+    return page, skipped + len(page) + sum(1 for _ in iterator)
+
+
+def iter_instance_details(client, env_name=None, statuses=None):
+    """Yield the details of every VM, optionally limited to one environment and/or to the given statuses."""
+    return iter_details(client.iter_vms(env_name, statuses=statuses or None))
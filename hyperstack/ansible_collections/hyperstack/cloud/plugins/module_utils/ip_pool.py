@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Deterministic IP address allocation for the mock cloud.
+
+Every environment gets one public and one private subnet. The subnet an
+environment's name points to (through a digest) is tried first and the
+following ones after it, skipping subnets that a SubnetRegistry already
+assigned to another environment, so no two environments ever share one.
+A VM created without addresses is given the lowest free address of each
+subnet when the creation is applied to the state, and keeps it until it
+is deleted; the addresses of deleted VMs go back to a free list and are
+handed out again first.
+
+The pools are stored in the environment under "ip_pools" as
+{"subnet", "next", "free"}: next is the lowest offset in the subnet that
+was never handed out and free the sorted offsets below it that were
+released. Because allocation happens when operations are replayed under
+the environment's lock, forks creating VMs in the same environment never
+receive the same address.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import bisect
+import hashlib
+import ipaddress
+
+# Address kinds, the network each kind's subnets are carved from, and the subnet size
+POOLS = (
+    ("public_ip", ipaddress.ip_network("100.64.0.0/10"), 22),
+    ("private_ip", ipaddress.ip_network("10.0.0.0/8"), 20),
+)
+
+# Offset of the first address handed out; .1 is left for the gateway
+FIRST_OFFSET = 2
+
+
+class IpPoolExhausted(Exception):
+    """Raised when a subnet has no free address left."""
+
+
+class SubnetRegistry(object):
+    """
+    Which environment each subnet is assigned to, as {kind: {subnet: env_name}}.
+
+    The state stores persist these claims; a registry that is not
+    persisted only keeps the environments it serves apart.
+    """
+
+    def __init__(self, claims=None):
+        self.claims = claims if claims is not None else {}
+        self.changed = False
+
+    def claim_subnet(self, env_name, kind, candidates):
+        """Return the subnet of the given kind assigned to env_name, assigning it the first free candidate."""
+        owners = self.claims.setdefault(kind, {})
+        for subnet, owner in owners.items():
+            if owner == env_name:
+                return subnet
+        for subnet in candidates:
+            subnet = str(subnet)
+            if subnet not in owners:
+                owners[subnet] = env_name
+                self.changed = True
+                return subnet
+        raise IpPoolExhausted(f"No free {kind.replace('_', ' ')} subnet left")
+
+    def release_subnets(self, env_name):
+        """Free the subnets of a deleted environment."""
+        for owners in self.claims.values():
+            for subnet in [subnet for subnet, owner in owners.items() if owner == env_name]:
+                del owners[subnet]
+                self.changed = True
+
+
+def candidate_subnets(env_name, network, prefix):
+    """Yield every subnet of network of the given prefix length, starting with the one env_name points to."""
+    count = 2 ** (prefix - network.prefixlen)
+    size = 2 ** (network.max_prefixlen - prefix)
+    start = int(hashlib.sha256(env_name.encode("utf-8")).hexdigest(), 16) % count
+    for index in range(count):
+        address = int(network.network_address) + (start + index) % count * size
+        yield ipaddress.ip_network((address, prefix))
+
+
+def subnet_for(env_name, network, prefix):
+    """Return the subnet of network (of the given prefix length) that env_name tries first."""
+    return next(candidate_subnets(env_name, network, prefix))
+
+
+def _new_pool(subnet, key, vms):
+    """Create the pool for one address kind, treating the addresses existing VMs already use as taken."""
+    subnet = ipaddress.ip_network(subnet)
+    used = set()
+    for vm_data in vms.values():
+        offset = _offset(subnet, vm_data.get(key))
+        if offset is not None:
+            used.add(offset)
+    next_offset = max(used | {FIRST_OFFSET - 1}) + 1
+    free = [offset for offset in range(FIRST_OFFSET, next_offset) if offset not in used]
+    return {"subnet": str(subnet), "next": next_offset, "free": free}
+
+
+def _offset(subnet, address):
+    """Return the offset of address in subnet, or None if it is not a host address of the subnet."""
+    if not address:
+        return None
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return None
+    if address not in subnet:
+        return None
+    offset = int(address) - int(subnet.network_address)
+    if offset < FIRST_OFFSET or offset >= subnet.num_addresses - 1:
+        return None
+    return offset
+
+
+def _pool(env_name, env, key, network, prefix, registry):
+    pools = env.setdefault("ip_pools", {})
+    if key not in pools:
+        candidates = candidate_subnets(env_name, network, prefix)
+        subnet = (registry or SubnetRegistry()).claim_subnet(env_name, key, candidates)
+        pools[key] = _new_pool(subnet, key, env.get("vms", {}))
+    return pools[key]
+
+
+def _take(pool, key):
+    subnet = ipaddress.ip_network(pool["subnet"])
+    if pool["free"]:
+        offset = pool["free"].pop(0)
+    elif pool["next"] < subnet.num_addresses - 1:
+        offset = pool["next"]
+        pool["next"] += 1
+    else:
+        raise IpPoolExhausted(f"No free {key.replace('_', ' ')} left in {subnet}")
+    return str(subnet.network_address + offset)
+
+
+def _reserve(pool, address):
+    """Mark an address chosen by the caller as taken, so it is never handed out."""
+    subnet = ipaddress.ip_network(pool["subnet"])
+    offset = _offset(subnet, address)
+    if offset is None:
+        return
+    if offset >= pool["next"]:
+        pool["free"].extend(range(pool["next"], offset))
+        pool["next"] = offset + 1
+    else:
+        index = bisect.bisect_left(pool["free"], offset)
+        if index < len(pool["free"]) and pool["free"][index] == offset:
+            del pool["free"][index]
+
+
+def _release(pool, address):
+    """Return an address to the free list."""
+    subnet = ipaddress.ip_network(pool["subnet"])
+    offset = _offset(subnet, address)
+    if offset is None or offset >= pool["next"]:
+        return
+    index = bisect.bisect_left(pool["free"], offset)
+    if index == len(pool["free"]) or pool["free"][index] != offset:
+        pool["free"].insert(index, offset)
+
+
+def assign_addresses(env_name, env, vm_data, previous=None, registry=None):
+    """
+    Give vm_data an address of each kind it does not have, in place.
+
+    A VM replacing previous (the same VM before the change) keeps the
+    previous addresses; previous addresses it no longer uses are released.
+    Addresses set by the caller are reserved. Subnets are claimed from
+    registry. Raises IpPoolExhausted.
+    """
+    previous = previous or {}
+    for key, network, prefix in POOLS:
+        pool = _pool(env_name, env, key, network, prefix, registry)
+        if key not in vm_data and previous.get(key):
+            vm_data[key] = previous[key]
+        if previous.get(key) and previous[key] != vm_data.get(key):
+            _release(pool, previous[key])
+        if key in vm_data:
+            _reserve(pool, vm_data[key])
+        else:
+            vm_data[key] = _take(pool, key)
+
+
+def backfill_addresses(env_name, env, registry=None):
+    """
+    Give the VMs that have no address of some kind (those created before
+    addresses were allocated) one from the pools, in the order of their
+    names. Raises IpPoolExhausted.
+    """
+    vms = env.get("vms", {})
+    for key, network, prefix in POOLS:
+        missing = sorted(vm_name for vm_name, vm_data in vms.items() if key not in vm_data)
+        if missing:
+            pool = _pool(env_name, env, key, network, prefix, registry)
+            for vm_name in missing:
+                vms[vm_name][key] = _take(pool, key)
+
+
+def update_addresses(env_name, env, vm_data, fields):
+    """Keep the pools in step with an update of vm_data to fields (before fields are applied)."""
+    pools = env.get("ip_pools", {})
+    for key, network, prefix in POOLS:
+        if key in pools and key in fields and fields[key] != vm_data.get(key):
+            _release(pools[key], vm_data.get(key))
+            _reserve(pools[key], fields[key])
+
+
+def release_addresses(env_name, env, vm_data):
+    """Return the addresses of a deleted VM to the pools."""
+    pools = env.get("ip_pools", {})
+    for key, network, prefix in POOLS:
+        if key in pools and vm_data.get(key):
+            _release(pools[key], vm_data[key])
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Client-side rate limiting for API requests, shared between forks.
+
+A token bucket holds up to burst tokens and refills at rate tokens per
+second; every request takes one token and waits while the bucket is
+empty. The bucket lives in a small file guarded by a FileLock, so every
+task on the controller host that talks to the same API draws from one
+budget instead of each fork sending at the full rate.
+
+When the API answers 429 (or 503) the bucket is paused until the
+Retry-After time has passed, so the other forks hold off as well instead
+of adding to the overload.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import hashlib
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.file_lock import FileLock
+
+# Statuses that mean "slow down and try again"
+RETRY_STATUSES = (429, 503)
+
+DEFAULT_MAX_RETRIES = 5
+
+# Upper bound for a single Retry-After wait, so a misbehaving server cannot stall a task indefinitely
+MAX_RETRY_AFTER = 60.0
+
+# Extra random wait added to a pause, as a fraction of it, so paused forks do not resume in lockstep
+RETRY_AFTER_JITTER = 0.1
+
+
+def bucket_path(api_url):
+    """Return the bucket file shared by every task that talks to api_url."""
+    digest = hashlib.sha256(api_url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"hyperstack_api_{digest}.bucket")
+
+
+def parse_retry_after(value, now=None):
+    """
+    Return the delay in seconds requested by a Retry-After header, either
+    a number of seconds or an HTTP date, or None if it is missing or
+    invalid. The delay is clamped to 0..MAX_RETRY_AFTER.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - (time.time() if now is None else now)
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return None
+    if math.isnan(delay):
+        return None
+    return min(max(delay, 0.0), MAX_RETRY_AFTER)
+
+
+class TokenBucket(object):
+    """
+    Token bucket persisted in path, or kept in memory when path is None.
+
+    rate is the number of requests per second; None disables the limit but
+    still honors pauses. burst defaults to one second's worth of tokens.
+
+    Without a rate there are no tokens to share, so acquire() neither locks
+    nor rewrites the file: it only checks whether the file changed since it
+    last read the pause from it.
+    """
+
+    def __init__(self, rate=None, burst=None, path=None):
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        if burst is not None and burst < 1:
+            raise ValueError("burst must be at least 1")
+        self.rate = rate
+        self.burst = burst or max(1, int(math.ceil(rate or 1)))
+        self.path = path
+        self._lock = FileLock(path + ".lock") if path else None
+        self._mutex = threading.Lock()
+        self._memory = None
+        # Pause read from the file by an unlimited bucket, and the (mtime, size) it was read at
+        self._paused_until = 0.0
+        self._seen = None
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def _read(self, now):
+        if self.path is None:
+            state = self._memory
+        else:
+            try:
+                with open(self.path, "r") as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                # Missing or torn: start over with a full bucket
+                state = None
+        if not isinstance(state, dict):
+            state = {}
+        return {
+            "tokens": float(state.get("tokens", self.burst)),
+            "updated": float(state.get("updated", now)),
+            "paused_until": float(state.get("paused_until", 0.0)),
+        }
+
+    def _write(self, state):
+        if self.path is None:
+            self._memory = state
+            return
+        try:
+            with open(self.path, "w") as f:
+                json.dump(state, f)
+        except OSError:
+            # An unwritable temp directory only loses sharing between forks
+            self.path = None
+            self._memory = state
+
+    def _update(self, change):
+        """Apply change(state, now) to the refilled state while holding the locks and return its result."""
+        with self._mutex:
+            if self._lock is None:
+                return self._locked_update(change)
+            with self._lock.exclusive():
+                return self._locked_update(change)
+
+    def _locked_update(self, change):
+        now = time.time()
+        state = self._read(now)
+        if self.rate is not None:
+            elapsed = max(now - state["updated"], 0.0)
+            state["tokens"] = min(float(self.burst), state["tokens"] + elapsed * self.rate)
+        state["updated"] = now
+        result = change(state, now)
+        self._write(state)
+        return result
+
+    @staticmethod
+    def _pause_wait(paused_until, now):
+        """Return the time left of a pause, plus jitter, or 0 if it is over."""
+        if now >= paused_until:
+            return 0
+        remaining = paused_until - now
+        return remaining + random.uniform(0, remaining * RETRY_AFTER_JITTER)
+
+    def _take(self, state, now):
+        """Take a token; returns 0 on success or the time to wait before trying again."""
+        wait = self._pause_wait(state["paused_until"], now)
+        if wait:
+            return wait
+        if state["tokens"] >= 1:
+            state["tokens"] -= 1
+            return 0
+        return (1 - state["tokens"]) / self.rate
+
+    def _check_pause(self):
+        """Return the time an unlimited bucket must wait for a pause, re-reading the file only if it changed."""
+        now = time.time()
+        with self._mutex:
+            if self.path is None:
+                return self._pause_wait(self._read(now)["paused_until"], now)
+            try:
+                stat = os.stat(self.path)
+                seen = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                seen = None
+            if seen != self._seen:
+                self._seen = seen
+                self._paused_until = self._read(now)["paused_until"] if seen else 0.0
+            return self._pause_wait(self._paused_until, now)
+
+    def acquire(self):
+        """Wait until a request may be sent. Returns the time waited."""
+        waited = 0.0
+        while True:
+            delay = self._check_pause() if self.rate is None else self._update(self._take)
+            if not delay:
+                if waited:
+                    self.waits += 1
+                    self.wait_time += waited
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        """Hold off every request drawing from this bucket for the given number of seconds."""
+
+        def _pause(state, now):
+            state["paused_until"] = max(state["paused_until"], now + seconds)
+
+        self._update(_pause)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+On-disk cache for read-only query results.
+
+Entries are JSON files keyed by a hash of the query, and expire after the
+TTL they were stored with. Every write made through the API client
+replaces a generation token in the cache directory (see invalidate());
+entries stored under an older token are ignored, so a cached result never
+outlives a change made by the instance or cloud_manager modules.
+
+The token must be read before the query runs: a write that lands while
+the query is running then makes the new entry stale instead of letting it
+hide the write.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "hyperstack_info_cache")
+
+# Environment variable overriding the cache directory
+CACHE_DIR_ENV = "HYPERSTACK_CACHE_DIR"
+
+GENERATION_FILE = "generation"
+ENTRY_SUFFIX = ".json"
+
+
+def cache_dir():
+    """Return the cache directory shared by every task on this host."""
+    return os.environ.get(CACHE_DIR_ENV) or CACHE_DIR
+
+
+def cache_key(*parts):
+    """Return a key for the given JSON-serializable query parts."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_file(path, payload):
+    """Atomically replace path with payload. Returns False if the cache directory is not writable."""
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".hyperstack_cache.", dir=directory)
+    except OSError:
+        return False
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def invalidate(directory=None):
+    """Make every entry in the cache stale. Called after the API client made changes."""
+    _write_file(os.path.join(directory or cache_dir(), GENERATION_FILE), uuid.uuid4().hex)
+
+
+class ReadCache(object):
+    """
+    Query results cached in directory for ttl seconds.
+
+    A cache with a ttl of 0 or less is disabled: get() always misses and
+    put() stores nothing. Unreadable entries count as misses and an
+    unwritable directory only disables storing, so the cache never fails a
+    query.
+    """
+
+    def __init__(self, ttl, directory=None):
+        self.ttl = ttl
+        self.directory = directory or cache_dir()
+        self.generation = None
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def _current_generation(self):
+        try:
+            with open(os.path.join(self.directory, GENERATION_FILE), "r") as f:
+                return f.read().strip()
+        except OSError:
+            return ""
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss. Also records the
+        current generation for the put() that follows a miss.
+        """
+        if not self.enabled:
+            return None
+        self.generation = self._current_generation()
+        path = self._path(key)
+        entry = _read_json(path)
+        if not isinstance(entry, dict):
+            return None
+        if entry.get("generation") != self.generation or entry.get("expires", 0) <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry.get("value")
+
+    def put(self, key, value):
+        """Store value under key, tagged with the generation read by the preceding get()."""
+        if not self.enabled:
+            return
+        generation = self.generation if self.generation is not None else self._current_generation()
+        entry = {"generation": generation, "expires": time.time() + self.ttl, "value": value}
+        _write_file(self._path(key), json.dumps(entry))
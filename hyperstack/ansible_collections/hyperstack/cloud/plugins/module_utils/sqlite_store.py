@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+SQLite backend for the Hyperstack Cloud mock state.
+
+Environments and VMs live in two tables of a single database opened in WAL
+mode, so readers never block the writer and a flush is one transaction.
+VMs are indexed by name, environment, public and private IP and status, so
+lookups read only the environments that can contain a match instead of
+every environment in the state.
+
+The database is created on first use and seeded from the json backend,
+which makes switching backends transparent for existing state.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import sqlite3
+
+    HAS_SQLITE = True
+except ImportError:
+    HAS_SQLITE = False
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.file_lock import LockStats
+from ansible_collections.hyperstack.cloud.plugins.module_utils.ip_pool import SubnetRegistry
+from ansible_collections.hyperstack.cloud.plugins.module_utils.state_store import (
+    JsonStateStore,
+    StateStore,
+    StateStoreError,
+    _replay,
+)
+
+# Default location of the state database
+STATE_DB = os.path.join(tempfile.gettempdir(), "hyperstack_mock_state.db")
+
+# Environment variable that overrides the location of the state database
+STATE_DB_ENV = "HYPERSTACK_STATE_DB"
+
+# Bumped whenever the schema changes
+SCHEMA_VERSION = 2
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS environments (name TEXT PRIMARY KEY, data TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS vms ("
+    " environment TEXT NOT NULL,"
+    " name TEXT NOT NULL,"
+    " status TEXT,"
+    " public_ip TEXT,"
+    " private_ip TEXT,"
+    " data TEXT NOT NULL,"
+    " PRIMARY KEY (environment, name))",
+    "CREATE INDEX IF NOT EXISTS vms_name ON vms (name)",
+    "CREATE INDEX IF NOT EXISTS vms_public_ip ON vms (public_ip)",
+    "CREATE INDEX IF NOT EXISTS vms_private_ip ON vms (private_ip)",
+    "CREATE INDEX IF NOT EXISTS vms_status ON vms (status)",
+    "CREATE TABLE IF NOT EXISTS subnets ("
+    " kind TEXT NOT NULL,"
+    " subnet TEXT NOT NULL,"
+    " environment TEXT NOT NULL,"
+    " PRIMARY KEY (kind, subnet))",
+]
+
+
+class SQLiteStateStore(StateStore):
+    """
+    State store backed by an SQLite database in WAL mode.
+
+    flush() replays the operation log inside a single BEGIN IMMEDIATE
+    transaction, so concurrent forks merge their updates exactly like they
+    do with the json backend.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path=None, lock_timeout=None):
+        if not HAS_SQLITE:
+            raise StateStoreError("The sqlite state backend requires the Python sqlite3 module")
+        super(SQLiteStateStore, self).__init__(lock_timeout=lock_timeout)
+        self.path = path or os.environ.get(STATE_DB_ENV) or STATE_DB
+        self.location = self.path
+        self._conn = None
+        self._stats = LockStats()
+
+    @property
+    def connection(self):
+        """Return the database connection, creating and seeding the database on first use."""
+        if self._conn is None:
+            try:
+                # The base store serializes access, so worker threads may share the connection
+                conn = sqlite3.connect(
+                    self.path, timeout=self.lock_timeout, isolation_level=None, check_same_thread=False
+                )
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            except sqlite3.Error as e:
+                raise StateStoreError(f"Unable to open state database '{self.path}': {e}")
+            self._conn = conn
+            if self._query_one("PRAGMA user_version")[0] < SCHEMA_VERSION:
+                with self._transaction():
+                    self._create_schema()
+        return self._conn
+
+    def close(self):
+        """Close the database connection."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _create_schema(self):
+        """
+        Create the tables missing from the database, and seed a new database
+        from the json backend. Runs inside a transaction.
+        """
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        # Another fork may have created the schema while we waited for the write lock
+        if version >= SCHEMA_VERSION:
+            return
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        if version == 0:
+            for name, env in JsonStateStore(lock_timeout=self.lock_timeout).environments().items():
+                self._write_env(name, None, env)
+        self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @contextmanager
+    def _transaction(self):
+        """Hold the database write lock for the duration of a transaction, timing the wait."""
+        conn = self.connection
+        start = time.monotonic()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            self._stats.timeouts += 1
+            raise StateStoreError(f"Timed out waiting for state database '{self.path}': {e}")
+        waited = time.monotonic() - start
+        # The busy handler hides individual retries; a measurable wait means another writer held the lock
+        self._stats.record(waited, waited > 0.01)
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            _rollback(conn)
+            raise StateStoreError(f"Unable to write state database '{self.path}': {e}")
+        except Exception:
+            _rollback(conn)
+            raise
+
+    def _query(self, sql, params=()):
+        try:
+            return self.connection.execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            raise StateStoreError(f"Unable to read state database '{self.path}': {e}")
+
+    def _query_one(self, sql, params=()):
+        rows = self._query(sql, params)
+        return rows[0] if rows else None
+
+    # Backend hooks
+
+    def _read_env(self, name):
+        row = self._query_one("SELECT data FROM environments WHERE name = ?", (name,))
+        if row is None:
+            return None
+        env = json.loads(row[0])
+        if "vms" in env:
+            env["vms"] = dict(
+                (vm_name, json.loads(data))
+                for vm_name, data in self._query("SELECT name, data FROM vms WHERE environment = ?", (name,))
+            )
+        return env
+
+    def _list_names(self):
+        return [row[0] for row in self._query("SELECT name FROM environments")]
+
+    def _lookup_name(self, vm_name):
+        return [row[0] for row in self._query("SELECT DISTINCT environment FROM vms WHERE name = ?", (vm_name,))]
+
+    def _lookup_ip(self, ip_address):
+        return [
+            row[0] for row in self._query(
+                "SELECT DISTINCT environment FROM vms WHERE public_ip = ? OR private_ip = ?",
+                (ip_address, ip_address),
+            )
+        ]
+
+    def _lookup_status(self, statuses):
+        statuses = list(statuses)
+        placeholders = ", ".join("?" * len(statuses))
+        return [
+            row[0] for row in self._query(
+                f"SELECT DISTINCT environment FROM vms WHERE status IN ({placeholders})", statuses
+            )
+        ]
+
+    def _commit(self, by_env):
+        """Replay the operations on top of the database in one write transaction."""
+        results = {}
+        with self._transaction():
+            for name in sorted(by_env):
+                current = self._read_env(name)
+                env = _replay(name, current, by_env[name], subnets=self)
+                if env != current:
+                    self._write_env(name, current, env)
+                results[name] = env
+        return results
+
+    def claim_subnet(self, env_name, kind, candidates):
+        """Runs inside the flush transaction, which holds the database write lock."""
+        rows = self._query("SELECT subnet, environment FROM subnets WHERE kind = ?", (kind,))
+        registry = SubnetRegistry({kind: dict(rows)})
+        subnet = registry.claim_subnet(env_name, kind, candidates)
+        if registry.changed:
+            self._conn.execute(
+                "INSERT INTO subnets (kind, subnet, environment) VALUES (?, ?, ?)", (kind, subnet, env_name)
+            )
+        return subnet
+
+    def release_subnets(self, env_name):
+        """Runs inside the flush transaction, which holds the database write lock."""
+        self._conn.execute("DELETE FROM subnets WHERE environment = ?", (env_name,))
+
+    def _write_env(self, name, current, env):
+        """Write the rows that differ between the current and the new data of an environment."""
+        old_vms = (current or {}).get("vms", {})
+        if env is None:
+            self._conn.execute("DELETE FROM vms WHERE environment = ?", (name,))
+            self._conn.execute("DELETE FROM environments WHERE name = ?", (name,))
+            return
+
+        new_vms = env.get("vms", {})
+        header = dict(env)
+        if "vms" in header:
+            # Keep an empty marker so an environment without VMs reads back unchanged
+            header["vms"] = {}
+        self._conn.execute(
+            "INSERT OR REPLACE INTO environments (name, data) VALUES (?, ?)",
+            (name, json.dumps(header, sort_keys=True)),
+        )
+        for vm_name in set(old_vms) - set(new_vms):
+            self._conn.execute("DELETE FROM vms WHERE environment = ? AND name = ?", (name, vm_name))
+        for vm_name, vm in new_vms.items():
+            if old_vms.get(vm_name) != vm:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO vms (environment, name, status, public_ip, private_ip, data)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, vm_name, vm.get("status"), vm.get("public_ip"), vm.get("private_ip"),
+                     json.dumps(vm, sort_keys=True)),
+                )
+
+    def _watch_target(self):
+        directory, filename = os.path.split(os.path.abspath(self.path))
+        # Commits land in the write-ahead log; checkpoints rewrite the database file
+        return directory, lambda name: name in (filename, filename + "-wal")
+
+    def lock_stats(self):
+        """Return counters for the time spent waiting for the database write lock."""
+        return self._stats.as_dict()
+
+
+def _rollback(conn):
+    """Roll back the current transaction, if the failure left one open."""
+    if conn.in_transaction:
+        conn.execute("ROLLBACK")
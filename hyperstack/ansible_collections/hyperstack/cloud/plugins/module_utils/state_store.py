@@ -0,0 +1,917 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Shared state store for the Hyperstack Cloud mock backend.
+
+The store loads only the environments a module run touches, hands out an
+in-memory working copy, and writes the changes back with a single flush
+when the module is done. Two backends are available: the default json
+backend below, and the sqlite backend in sqlite_store.
+
+The json backend persists the simulated cloud as one JSON document per
+environment (a shard) inside a state directory.
+
+Writes go to a temporary file that is fsync'ed and renamed over the shard,
+so readers only ever see a complete document. With the optional write-ahead
+journal, the new document is first made durable next to the shard and
+replayed on the next load if the rename never happened.
+
+Each shard has its own lock file: reads hold a shared lock and flushes an
+exclusive one, so forks working on different environments never contend
+and forks working on the same environment can still read in parallel.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import copy
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from urllib.parse import quote, unquote
+
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible_collections.hyperstack.cloud.plugins.module_utils.change_watch import ChangeWatcher
+from ansible_collections.hyperstack.cloud.plugins.module_utils.file_lock import (
+    DEFAULT_LOCK_TIMEOUT,
+    FileLock,
+    LockStats,
+    LockTimeout,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.firewall import apply_rule_delta
+from ansible_collections.hyperstack.cloud.plugins.module_utils.ip_pool import (
+    IpPoolExhausted,
+    SubnetRegistry,
+    assign_addresses,
+    backfill_addresses,
+    release_addresses,
+    update_addresses,
+)
+
+# Directory-based persistence for mock state (needed for idempotency testing)
+STATE_DIR = os.path.join(tempfile.gettempdir(), "hyperstack_mock_state")
+
+# Environment variable that overrides the location of the state directory
+STATE_DIR_ENV = "HYPERSTACK_STATE_DIR"
+
+# Environment variable that enables the write-ahead journal
+STATE_JOURNAL_ENV = "HYPERSTACK_STATE_JOURNAL"
+
+# Environment variable that selects the state backend (json or sqlite)
+STATE_BACKEND_ENV = "HYPERSTACK_STATE_BACKEND"
+
+# Available state backends; the first one is the default
+STATE_BACKENDS = ["json", "sqlite"]
+
+# Environment variable that sets how long to wait for the state lock (seconds)
+STATE_LOCK_TIMEOUT_ENV = "HYPERSTACK_STATE_LOCK_TIMEOUT"
+
+# Suffix of the write-ahead journal kept next to a document
+JOURNAL_SUFFIX = ".journal"
+
+# Suffix of the lock file kept next to a document
+LOCK_SUFFIX = ".lock"
+
+# File name prefix and suffix of environment shards
+SHARD_PREFIX = "env-"
+SHARD_SUFFIX = ".json"
+
+# File name of the lookup index kept next to the shards
+INDEX_FILE = "index.json"
+
+# File name of the registry of the subnets assigned to each environment
+SUBNETS_FILE = "subnets.json"
+
+# Bumped whenever the kinds of keys in the index change, to force a rebuild
+INDEX_VERSION = 2
+
+
+def default_state():
+    """Return the state used when no state exists yet."""
+    return {"production": {"id": "env-123", "status": "active"}}
+
+
+class StateStoreError(Exception):
+    """Raised when the state store cannot be read or written."""
+
+
+class JsonDocument(object):
+    """
+    A JSON document on disk with atomic replacement, an optional write-ahead
+    journal and a shared/exclusive lock.
+    """
+
+    def __init__(self, path, journal=False, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.path = path
+        self.journal = journal
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.lock = FileLock(path + LOCK_SUFFIX, timeout=lock_timeout)
+
+    @contextmanager
+    def locked(self, exclusive):
+        """Hold the document lock, reporting timeouts as StateStoreError."""
+        try:
+            with self.lock.exclusive() if exclusive else self.lock.shared():
+                yield
+        except LockTimeout as e:
+            raise StateStoreError(str(e))
+
+    def load(self, default=None):
+        """Read the document under a shared lock, replaying a pending journal first."""
+        if os.path.exists(self.journal_path):
+            with self.locked(exclusive=True):
+                self.recover()
+        with self.locked(exclusive=False):
+            return self.read(default)
+
+    def read(self, default=None):
+        """Read the document. The caller must hold the lock."""
+        if not os.path.exists(self.path):
+            return default
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except ValueError as e:
+            # Never fall back to a default here: that would silently drop data
+            raise StateStoreError(f"State file '{self.path}' is corrupt: {e}")
+        except (IOError, OSError) as e:
+            raise StateStoreError(f"Unable to read state file '{self.path}': {e}")
+
+    def recover(self):
+        """Roll a complete journal entry forward. The caller must hold the exclusive lock."""
+        if not os.path.exists(self.journal_path):
+            return
+        try:
+            with open(self.journal_path, "r") as f:
+                payload = f.read()
+            json.loads(payload)
+        except (ValueError, IOError, OSError):
+            # The writer died before the journal entry was durable; the document is intact
+            _remove_quietly(self.journal_path)
+            return
+        _replace_file(self.path, payload)
+        _remove_quietly(self.journal_path)
+
+    def write(self, doc):
+        """Replace the document without exposing a partial file. The caller must hold the exclusive lock."""
+        payload = json.dumps(doc)
+        if self.journal:
+            _replace_file(self.journal_path, payload)
+        _replace_file(self.path, payload)
+        if self.journal:
+            _remove_quietly(self.journal_path)
+
+    def remove(self):
+        """Delete the document. The caller must hold the exclusive lock."""
+        _remove_quietly(self.journal_path)
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            if os.path.exists(self.path):
+                raise StateStoreError(f"Unable to remove state file '{self.path}': {e}")
+
+
+class StateStore(object):
+    """
+    In-memory working copy of the mock cloud state.
+
+    Environments are read lazily from the backend the first time they are
+    accessed. Changes are applied to the working copy immediately and
+    recorded in an operation log; flush() hands the log to the backend,
+    which replays it on top of the current persisted state so concurrent
+    forks do not lose each other's updates.
+
+    Backends implement _read_env(), _list_names() and _commit(), and may
+    override the _lookup_*() hooks to answer queries from an index instead
+    of scanning every environment. They also keep the registry of the
+    subnets assigned to each environment: _commit() passes the store to
+    _replay(), which calls claim_subnet() and release_subnets() while the
+    environment is locked.
+
+    Reads, changes and flushes hold a reentrant lock, so a module may run
+    VM operations on several threads against the same store.
+    """
+
+    backend = None
+
+    # Where the backend keeps the state (a directory or database path)
+    location = None
+
+    def __init__(self, lock_timeout=None):
+        if lock_timeout is None:
+            lock_timeout = float(os.environ.get(STATE_LOCK_TIMEOUT_ENV, DEFAULT_LOCK_TIMEOUT))
+        self.lock_timeout = lock_timeout
+        self._envs = {}
+        self._listing = None
+        self._touched = set()
+        self._pending = []
+        self._ip_maps = {}
+        # Serializes the working copy and backend access for modules that run operations on threads
+        self._mutex = threading.RLock()
+
+    # Backend hooks
+
+    def _read_env(self, name):
+        """Read one environment from the backend, or None if it does not exist."""
+        raise NotImplementedError
+
+    def _list_names(self):
+        """Return the names of all persisted environments."""
+        raise NotImplementedError
+
+    def _commit(self, by_env):
+        """Persist the operations grouped by environment and return the new data of each environment."""
+        raise NotImplementedError
+
+    def _reset(self):
+        """Drop backend caches on reload()."""
+
+    def _lookup_name(self, vm_name):
+        """Return the names of the environments that may contain a VM called vm_name."""
+        return self._names()
+
+    def _lookup_ip(self, ip_address):
+        """Return the names of the environments that may contain a VM with the given IP."""
+        return self._names()
+
+    def _lookup_status(self, statuses):
+        """Return the names of the environments that may contain VMs in one of the given states."""
+        return self._names()
+
+    def _watch_target(self):
+        """Return (directory, match) describing the files that change when the state is written."""
+        return None, None
+
+    def claim_subnet(self, env_name, kind, candidates):
+        """Return the subnet of the given kind assigned to env_name, assigning it the first free candidate."""
+        raise NotImplementedError
+
+    def release_subnets(self, env_name):
+        """Free the subnets of a deleted environment."""
+        raise NotImplementedError
+
+    def lock_stats(self):
+        """Return lock contention counters for this store."""
+        return LockStats().as_dict()
+
+    def watch(self):
+        """Return a ChangeWatcher that wakes when another task writes the persisted state."""
+        directory, match = self._watch_target()
+        return ChangeWatcher(directory, match)
+
+    # Working copy
+
+    def _load_env(self, name):
+        """Return an environment from the working copy, reading it on first use."""
+        with self._mutex:
+            if name not in self._envs:
+                self._envs[name] = self._read_env(name)
+            return self._envs[name]
+
+    def _names(self):
+        """Return the sorted names of all environments in the working copy."""
+        with self._mutex:
+            if self._listing is None:
+                self._listing = set(self._list_names())
+            names = set(self._listing)
+            for name, env in self._envs.items():
+                if env is None:
+                    names.discard(name)
+                else:
+                    names.add(name)
+            return sorted(names)
+
+    @property
+    def dirty(self):
+        """Whether the working copy has changes that were not flushed yet."""
+        return bool(self._pending)
+
+    def flush(self):
+        """Persist pending changes with a single commit."""
+        with self._mutex:
+            if not self._pending:
+                return
+            by_env = {}
+            for op in self._pending:
+                by_env.setdefault(op[1], []).append(op)
+            self._envs.update(self._commit(by_env))
+            self._pending = []
+            self._touched = set()
+
+    def reload(self):
+        """Flush pending changes and drop the working copy so the next access re-reads the backend."""
+        with self._mutex:
+            self.flush()
+            self._envs = {}
+            self._listing = None
+            self._ip_maps = {}
+            self._reset()
+
+    def _record(self, *op):
+        """Apply an operation to the working copy and queue it for the next flush."""
+        with self._mutex:
+            self._load_env(op[1])
+            _apply(self._envs, op)
+            self._pending.append(op)
+            self._touched.add(op[1])
+            self._ip_maps.pop(op[1], None)
+
+    def _candidates(self, env_names):
+        """Combine backend lookup results with environments changed in this run."""
+        return sorted(set(env_names) | self._touched)
+
+    # Environments
+
+    def environments(self):
+        """Return the mapping of environment name to environment data for every environment."""
+        return dict((name, self._load_env(name)) for name in self._names())
+
+    def get_environment(self, name):
+        """Return the data for an environment, or None if it does not exist."""
+        return self._load_env(name)
+
+    def put_environment(self, name, data):
+        """Create or replace an environment."""
+        self._record("put_environment", name, data)
+
+    def delete_environment(self, name):
+        """Delete an environment. Returns True if it existed."""
+        if self._load_env(name) is None:
+            return False
+        self._record("delete_environment", name)
+        return True
+
+    def set_rules(self, env_name, rules):
+        """Replace the firewall rules of an environment. Returns True if the environment exists."""
+        if self.get_environment(env_name) is None:
+            return False
+        self._record("set_rules", env_name, rules)
+        return True
+
+    def update_rules(self, env_name, added=(), removed=()):
+        """
+        Open the ports of the added rules and close those of the removed
+        rules, leaving the other rules in place; the result is stored as
+        merged intervals. Returns True if the environment exists.
+        """
+        if self.get_environment(env_name) is None:
+            return False
+        self._record("update_rules", env_name, list(added), list(removed))
+        return True
+
+    def mark_converged(self, env_name, spec_hash):
+        """
+        Record that the environment matches the desired spec with the given
+        hash. The mark holds the content hash of the working copy; if other
+        tasks changed the environment before this flush, the mark is
+        dropped instead. Returns True if the environment exists.
+        """
+        env = self.get_environment(env_name)
+        if env is None:
+            return False
+        self._record("mark_converged", env_name, spec_hash, content_hash(env))
+        return True
+
+    # Virtual machines
+
+    def iter_vms(self, env_name=None, statuses=None):
+        """
+        Yield (env_name, vm_name, vm_data) for every VM, optionally limited to
+        one environment and/or to VMs whose status is in statuses.
+        """
+        if env_name is not None:
+            names = [env_name]
+        elif statuses:
+            names = self._candidates(self._lookup_status(statuses))
+        else:
+            names = self._names()
+        for name in names:
+            env_data = self._load_env(name)
+            if env_data is None:
+                continue
+            for vm_name, vm_data in env_data.get("vms", {}).items():
+                if not statuses or vm_data.get("status") in statuses:
+                    yield name, vm_name, vm_data
+
+    def find_vms(self, vm_name):
+        """Return every (env_name, vm_name, vm_data) for VMs called vm_name, ordered by environment."""
+        found = []
+        for env_name in self._candidates(self._lookup_name(vm_name)):
+            vm_data = self.get_vm(env_name, vm_name)
+            if vm_data is not None:
+                found.append((env_name, vm_name, vm_data))
+        return found
+
+    def find_vms_by_ip(self, ip_address):
+        """Return every (env_name, vm_name, vm_data) whose public or private IP is ip_address."""
+        found = []
+        for env_name in self._candidates(self._lookup_ip(ip_address)):
+            for vm_name in self._ip_map(env_name).get(ip_address, []):
+                found.append((env_name, vm_name, self.get_vm(env_name, vm_name)))
+        return found
+
+    def _ip_map(self, env_name):
+        """Return the IP address to VM names mapping of an environment, built once per change."""
+        ip_map = self._ip_maps.get(env_name)
+        if ip_map is None:
+            ip_map = self._ip_maps[env_name] = {}
+            for _, vm_name, vm_data in self.iter_vms(env_name):
+                for ip_address in _vm_ips(vm_data):
+                    ip_map.setdefault(ip_address, []).append(vm_name)
+        return ip_map
+
+    def get_vm(self, env_name, vm_name):
+        """Return the data for a VM, or None if it does not exist."""
+        env = self.get_environment(env_name)
+        if env is None:
+            return None
+        return env.get("vms", {}).get(vm_name)
+
+    def put_vm(self, env_name, vm_name, data):
+        """Create or replace a VM. Returns True if the environment exists."""
+        if self.get_environment(env_name) is None:
+            return False
+        self._record("put_vm", env_name, vm_name, data)
+        return True
+
+    def update_vm(self, env_name, vm_name, **fields):
+        """Update fields of an existing VM. Returns True if the VM exists."""
+        if self.get_vm(env_name, vm_name) is None:
+            return False
+        self._record("update_vm", env_name, vm_name, fields)
+        return True
+
+    def delete_vm(self, env_name, vm_name):
+        """Delete a VM. Returns True if it existed."""
+        if self.get_vm(env_name, vm_name) is None:
+            return False
+        self._record("delete_vm", env_name, vm_name)
+        return True
+
+
+class JsonStateStore(StateStore):
+    """
+    State store that keeps one JSON document (a shard) per environment.
+
+    Each shard has its own lock: reads take it shared and flush() takes it
+    exclusive while replaying that environment's operations, so forks
+    working on different environments never contend.
+
+    When the state directory does not exist yet, the store starts from the
+    legacy single-file state (if present) or the default state, and writes
+    it out as shards on the first flush.
+
+    An index document maps VM names and IP addresses to the environments
+    that contain them, so lookups read only matching shards. It is updated
+    under the shard lock of every flushed environment: new entries are added
+    before the shard is written and stale ones removed after, so a crash can
+    leave an entry that points at nothing (lookups skip those) but never
+    hide a VM. An index that is missing, incomplete or from an older version
+    is rebuilt on the next lookup.
+    """
+
+    backend = "json"
+
+    def __init__(self, directory=None, journal=None, lock_timeout=None):
+        super(JsonStateStore, self).__init__(lock_timeout=lock_timeout)
+        self.directory = (directory or os.environ.get(STATE_DIR_ENV) or STATE_DIR).rstrip(os.sep)
+        self.location = self.directory
+        self.legacy_path = self.directory + ".json"
+        if journal is None:
+            journal = boolean(os.environ.get(STATE_JOURNAL_ENV, False), strict=False)
+        self.journal = journal
+        self._shards = {}
+        self._seed = None
+        self._index = None
+        self.index = JsonDocument(
+            os.path.join(self.directory, INDEX_FILE), journal=self.journal, lock_timeout=self.lock_timeout
+        )
+        self.subnets = JsonDocument(
+            os.path.join(self.directory, SUBNETS_FILE), journal=self.journal, lock_timeout=self.lock_timeout
+        )
+
+    def shard(self, name):
+        """Return the document that stores an environment."""
+        doc = self._shards.get(name)
+        if doc is None:
+            path = os.path.join(self.directory, SHARD_PREFIX + quote(name, safe="") + SHARD_SUFFIX)
+            doc = self._shards[name] = JsonDocument(path, journal=self.journal, lock_timeout=self.lock_timeout)
+        return doc
+
+    def _seed_state(self):
+        """Return the initial state if the state directory does not exist yet, else None."""
+        if self._seed is None:
+            if os.path.isdir(self.directory):
+                self._seed = False
+            else:
+                legacy = JsonDocument(self.legacy_path, lock_timeout=self.lock_timeout)
+                self._seed = legacy.load(default=None)
+                if self._seed is None:
+                    self._seed = default_state()
+        return None if self._seed is False else self._seed
+
+    def _read_env(self, name):
+        seed = self._seed_state()
+        if seed is not None:
+            return copy.deepcopy(seed.get(name))
+        return self.shard(name).load()
+
+    def _list_names(self):
+        seed = self._seed_state()
+        if seed is not None:
+            return list(seed)
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError as e:
+            raise StateStoreError(f"Unable to list state directory '{self.directory}': {e}")
+        return [
+            unquote(filename[len(SHARD_PREFIX):-len(SHARD_SUFFIX)])
+            for filename in filenames
+            if filename.startswith(SHARD_PREFIX) and filename.endswith(SHARD_SUFFIX)
+        ]
+
+    def _initialize(self, seed):
+        """Create the state directory with the seed environments as its first shards."""
+        parent = os.path.dirname(self.directory) or "."
+        try:
+            tmp_dir = tempfile.mkdtemp(prefix=".hyperstack_state.", dir=parent)
+        except (IOError, OSError) as e:
+            raise StateStoreError(f"Unable to create state directory '{self.directory}': {e}")
+        try:
+            index = {"version": INDEX_VERSION, "complete": True}
+            for name, env in seed.items():
+                JsonDocument(os.path.join(tmp_dir, os.path.basename(self.shard(name).path))).write(env)
+                _index_update(index, name, added=_index_keys(env))
+            JsonDocument(os.path.join(tmp_dir, INDEX_FILE)).write(index)
+            os.rename(tmp_dir, self.directory)
+        except OSError:
+            # Another fork initialized the directory first; its seed wins
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.isdir(self.directory):
+                raise StateStoreError(f"Unable to create state directory '{self.directory}'")
+        _fsync_directory(parent)
+
+    def _commit(self, by_env):
+        """Replay the operations shard by shard, one shard lock at a time."""
+        seed = self._seed_state()
+        if seed is not None:
+            self._initialize(seed)
+            self._seed = False
+
+        results = {}
+        for name in sorted(by_env):
+            doc = self.shard(name)
+            with doc.locked(exclusive=True):
+                doc.recover()
+                current = doc.read()
+                state = {name: _replay(name, current, by_env[name], subnets=self)}
+                old_keys = _index_keys(current)
+                new_keys = _index_keys(state[name])
+                self._update_index(name, added=_keys_difference(new_keys, old_keys))
+                if state[name] is None:
+                    if current is not None:
+                        doc.remove()
+                elif state[name] != current:
+                    doc.write(state[name])
+                self._update_index(name, removed=_keys_difference(old_keys, new_keys))
+            results[name] = state[name]
+        return results
+
+    def _reset(self):
+        self._seed = None
+        self._index = None
+
+    def claim_subnet(self, env_name, kind, candidates):
+        with self.subnets.locked(exclusive=True):
+            self.subnets.recover()
+            registry = SubnetRegistry(self.subnets.read(default={}))
+            subnet = registry.claim_subnet(env_name, kind, candidates)
+            if registry.changed:
+                self.subnets.write(registry.claims)
+        return subnet
+
+    def release_subnets(self, env_name):
+        with self.subnets.locked(exclusive=True):
+            self.subnets.recover()
+            registry = SubnetRegistry(self.subnets.read(default={}))
+            registry.release_subnets(env_name)
+            if registry.changed:
+                self.subnets.write(registry.claims)
+
+    def _watch_target(self):
+        return self.directory, lambda name: name.startswith(SHARD_PREFIX) and name.endswith(SHARD_SUFFIX)
+
+    # Lookup index
+
+    def _read_index(self):
+        """Read the index document. The caller must hold the index lock. A corrupt index counts as missing."""
+        try:
+            return self.index.read()
+        except StateStoreError:
+            return None
+
+    def _update_index(self, env_name, added=None, removed=None):
+        """Add and remove index entries of one environment. The caller must hold its shard lock."""
+        if not any((added or {}).values()) and not any((removed or {}).values()):
+            return
+        with self.index.locked(exclusive=True):
+            self.index.recover()
+            index = self._read_index() or {"version": INDEX_VERSION, "complete": False}
+            _index_update(index, env_name, added=added, removed=removed)
+            self.index.write(index)
+        self._index = index
+
+    def _rebuild_index(self):
+        """Index every shard and merge the result into the current index."""
+        rebuilt = {}
+        for name in self._list_names():
+            _index_update(rebuilt, name, added=_index_keys(self.shard(name).load()))
+        with self.index.locked(exclusive=True):
+            self.index.recover()
+            index = self._read_index() or {}
+            # Entries added by concurrent flushes while the shards were read must survive
+            for kind, entries in rebuilt.items():
+                for key, env_names in entries.items():
+                    merged = set(index.setdefault(kind, {}).get(key, [])) | set(env_names)
+                    index[kind][key] = sorted(merged)
+            index["version"] = INDEX_VERSION
+            index["complete"] = True
+            self.index.write(index)
+        return index
+
+    def _lookup(self, kind, key):
+        """Return the environments the index lists for a key, or every environment without an index."""
+        if self._seed_state() is not None:
+            return self._names()
+        if self._index is None:
+            with self.index.locked(exclusive=False):
+                index = self._read_index()
+            if not index or not index.get("complete") or index.get("version") != INDEX_VERSION:
+                index = self._rebuild_index()
+            self._index = index
+        return self._index.get(kind, {}).get(key, [])
+
+    def _lookup_name(self, vm_name):
+        return self._lookup("names", vm_name)
+
+    def _lookup_ip(self, ip_address):
+        return self._lookup("ips", ip_address)
+
+    def lock_stats(self):
+        """Return lock contention counters summed over every shard this store used."""
+        totals = LockStats()
+        for doc in list(self._shards.values()) + [self.index, self.subnets]:
+            stats = doc.lock.stats
+            totals.acquired += stats.acquired
+            totals.contended += stats.contended
+            totals.timeouts += stats.timeouts
+            totals.wait_time += stats.wait_time
+            totals.max_wait = max(totals.max_wait, stats.max_wait)
+        return totals.as_dict()
+
+
+def content_hash(env):
+    """Return a digest of the firewall rules and VMs (specs and statuses) of an environment."""
+    content = {"rules": env.get("rules", []), "vms": env.get("vms", {})}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _replay(env_name, current, ops, subnets=None):
+    """
+    Return an environment after replaying ops on top of current, with its
+    content hash refreshed. Subnets are claimed from and released to
+    subnets, the store's registry; VMs still without addresses are given
+    some.
+    """
+    state = {env_name: copy.deepcopy(current)}
+    for op in ops:
+        _apply(state, copy.deepcopy(op), replaying=True, subnets=subnets)
+    env = state[env_name]
+    if env is not None:
+        try:
+            backfill_addresses(env_name, env, subnets)
+        except IpPoolExhausted:
+            pass
+        env["content_hash"] = content_hash(env)
+    return env
+
+
+def _apply(state, op, replaying=False, subnets=None):
+    """
+    Apply one recorded operation to a mapping of environment name to data.
+
+    Deleted environments are kept as None so that callers can tell them
+    apart from environments that were never loaded. Operations whose target
+    disappeared in the meantime (for example an environment deleted by
+    another task) are skipped.
+
+    When replaying, putting an environment that already exists merges
+    into it (see _merge_environment) instead of replacing it, so forks
+    creating the same environment keep each other's VMs and rules.
+
+    VMs put without addresses are given some from the environment's IP
+    pools (see ip_pool), whose subnets are claimed from subnets. The
+    recorded operation is left without them, so the flush allocates again
+    against the persisted pools and registry; a pool that ran out in the
+    meantime leaves the VM without that address instead of failing the
+    flush.
+    """
+    kind, env_name = op[0], op[1]
+    if kind == "put_environment":
+        current = state.get(env_name)
+        if replaying and current is not None:
+            # Another task created the environment first: keep what it committed
+            state[env_name] = _merge_environment(current, op[2])
+        else:
+            # A copy, so later changes to the working copy do not leak into the recorded operation
+            state[env_name] = copy.deepcopy(op[2])
+        return
+    if kind == "delete_environment":
+        if subnets is not None and state.get(env_name) is not None:
+            subnets.release_subnets(env_name)
+        state[env_name] = None
+        return
+
+    env = state.get(env_name)
+    if env is None:
+        return
+    if kind == "set_rules":
+        env["rules"] = op[2]
+    elif kind == "update_rules":
+        env["rules"] = apply_rule_delta(env.get("rules", []), op[2], op[3])
+    elif kind == "mark_converged":
+        if content_hash(env) == op[3]:
+            env["converged"] = {"spec": op[2], "content": op[3]}
+        else:
+            env.pop("converged", None)
+    elif kind == "put_vm":
+        vm_data = dict(op[3])
+        try:
+            assign_addresses(env_name, env, vm_data, env.get("vms", {}).get(op[2]), subnets)
+        except IpPoolExhausted:
+            if not replaying:
+                raise
+        env.setdefault("vms", {})[op[2]] = vm_data
+    elif kind == "update_vm":
+        vm_data = env.get("vms", {}).get(op[2])
+        if vm_data is not None:
+            update_addresses(env_name, env, vm_data, op[3])
+            vm_data.update(op[3])
+    elif kind == "delete_vm":
+        vm_data = env.get("vms", {}).pop(op[2], None)
+        if vm_data is not None:
+            release_addresses(env_name, env, vm_data)
+
+
+def _merge_environment(current, data):
+    """
+    Return the persisted environment current with the data of a
+    put_environment on top. VMs are added to the persisted ones and rules
+    opened on top of the persisted rules; the IP pools, convergence mark
+    and content hash stay those of the persisted environment.
+    """
+    merged = dict(current)
+    for key, value in data.items():
+        if key == "vms":
+            vms = dict(current.get("vms", {}))
+            vms.update(value)
+            merged["vms"] = vms
+        elif key == "rules":
+            merged["rules"] = apply_rule_delta(current.get("rules", []), value, [])
+        elif key not in ("ip_pools", "converged", "content_hash"):
+            merged[key] = value
+    return merged
+
+
+def _index_keys(env):
+    """Return the index keys of an environment by kind."""
+    vms = (env or {}).get("vms", {})
+    return {
+        "names": set(vms),
+        "ips": set(ip_address for vm in vms.values() for ip_address in _vm_ips(vm)),
+    }
+
+
+def _vm_ips(vm):
+    """Return the IP addresses assigned to a VM."""
+    return [vm[key] for key in ("public_ip", "private_ip") if vm.get(key)]
+
+
+def _keys_difference(keys, other):
+    """Return the index keys in keys but not in other, by kind."""
+    return dict((kind, values - other.get(kind, set())) for kind, values in keys.items())
+
+
+def _index_update(index, env_name, added=None, removed=None):
+    """Add env_name to the index entries of the added keys and drop it from the removed ones."""
+    for kind, keys in (added or {}).items():
+        entries = index.setdefault(kind, {})
+        for key in keys:
+            entries[key] = sorted(set(entries.get(key, [])) | {env_name})
+    for kind, keys in (removed or {}).items():
+        entries = index.setdefault(kind, {})
+        for key in keys:
+            remaining = [name for name in entries.get(key, []) if name != env_name]
+            if remaining:
+                entries[key] = remaining
+            else:
+                entries.pop(key, None)
+
+
+def _replace_file(path, payload):
+    """Atomically replace path with payload (write temp file, fsync, rename)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=".hyperstack_state.", dir=directory)
+    except (IOError, OSError) as e:
+        raise StateStoreError(f"Unable to write state file '{path}': {e}")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except (IOError, OSError) as e:
+        _remove_quietly(tmp_path)
+        raise StateStoreError(f"Unable to write state file '{path}': {e}")
+    _fsync_directory(directory)
+
+
+def _file_mode(path):
+    """Return the permission bits for a replacement of path."""
+    try:
+        return os.stat(path).st_mode & 0o777
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _fsync_directory(directory):
+    """Make a rename inside directory durable. Not every platform supports this."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _remove_quietly(path):
+    """Remove a file, ignoring errors if it is already gone."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def open_store(backend=None):
+    """Create a state store for the given backend (defaults to HYPERSTACK_STATE_BACKEND, then json)."""
+    backend = backend or os.environ.get(STATE_BACKEND_ENV) or STATE_BACKENDS[0]
+    if backend == "json":
+        return JsonStateStore()
+    if backend == "sqlite":
+        from ansible_collections.hyperstack.cloud.plugins.module_utils.sqlite_store import SQLiteStateStore
+
+        return SQLiteStateStore()
+    raise StateStoreError(f"Unknown state backend '{backend}'. Valid backends: {', '.join(STATE_BACKENDS)}")
+
+
+_STORE = None
+
+
+def get_store():
+    """Return the state store shared by the current module run."""
+    global _STORE
+    if _STORE is None:
+        _STORE = open_store()
+    return _STORE
+
+
+def configure_store(backend=None):
+    """Select the backend for this module run, keeping the current store if it already uses it."""
+    global _STORE
+    if backend is not None and (_STORE is None or _STORE.backend != backend):
+        _STORE = open_store(backend)
+    return get_store()
+
+
+def set_store(store):
+    """Replace the shared state store (mainly useful for tests)."""
+    global _STORE
+    _STORE = store
+    return store
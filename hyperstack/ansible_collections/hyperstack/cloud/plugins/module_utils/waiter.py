@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Your Name <your.email@example.com>
+# GNU General Public License v3.0+ (see LICENSES/GPL-3.0-or-later.txt or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+"""
+Wait for many VMs to reach their desired states in one polling loop.
+
+Every tick refreshes the API client's view of the state once and checks all
+pending VMs against it, so waiting for N VMs costs one state read per tick
+instead of N.
+With notify=True the waiter sleeps on change notifications from the store
+instead, and the backoff delay only caps how long it goes without checking.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import time
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.api_client import get_client
+from ansible_collections.hyperstack.cloud.plugins.module_utils.backoff import Backoff
+
+
+class Waiter(object):
+    """
+    Tracks VMs until each reaches its desired state or the timeout expires.
+
+    lookup(env_name, vm_name) returns the current VM data, or None if the VM
+    does not exist; it defaults to asking the shared API client. A VM that
+    disappears counts as reaching "terminated" and as failing any other
+    state.
+
+    With notify=True, ticks are triggered by writes to the persisted state
+    (see StateStore.watch()) rather than by the backoff alone; where
+    notifications are unavailable this behaves exactly like polling.
+    """
+
+    def __init__(self, lookup=None, backoff=None, notify=False):
+        self.lookup = lookup or (lambda env_name, vm_name: get_client().get_vm(env_name, vm_name))
+        self.backoff = backoff or Backoff()
+        self.notify = notify
+        self.results = {}
+        self.wakeups = 0
+
+    def add(self, env_name, vm_name, desired_state):
+        """Start tracking a VM."""
+        self.results[(env_name, vm_name)] = {
+            "environment": env_name,
+            "name": vm_name,
+            "state": desired_state,
+            "status": None,
+            "reached": False,
+            "elapsed": None,
+        }
+
+    @property
+    def polls(self):
+        """Number of ticks made so far."""
+        return self.backoff.polls
+
+    def pending(self):
+        """Return the results of the VMs that are still being waited for."""
+        return [result for result in self.results.values() if result["elapsed"] is None]
+
+    def _check(self, result, elapsed):
+        """Update one VM from the current state. Returns True once the VM is done."""
+        vm_data = self.lookup(result["environment"], result["name"])
+        result["status"] = vm_data.get("status") if vm_data else "terminated"
+        if result["status"] == result["state"] or not vm_data:
+            result["reached"] = result["status"] == result["state"]
+            result["elapsed"] = round(elapsed, 2)
+            return True
+        return False
+
+    def wait(self, timeout):
+        """
+        Poll until every VM is done or timeout seconds have passed.
+
+        Returns the results keyed by (env_name, vm_name). Each result says
+        whether the VM reached its state and after how many seconds; VMs
+        that timed out have reached=False and elapsed=None.
+        """
+        # Watch before the first check so that no change goes unnoticed
+        watcher = get_client().watch() if self.notify else None
+        try:
+            return self._wait(timeout, watcher)
+        finally:
+            if watcher is not None:
+                watcher.close()
+
+    def _wait(self, timeout, watcher):
+        start_time = time.time()
+        while True:
+            pending = self.pending()
+            if not pending:
+                break
+            elapsed = time.time() - start_time
+            if elapsed >= timeout:
+                break
+            self.backoff.poll()
+            for result in pending:
+                self._check(result, elapsed)
+            if not self.pending():
+                break
+
+            delay = min(self.backoff.next_delay(), timeout - elapsed)
+            if watcher is None:
+                time.sleep(delay)
+            elif watcher.wait(delay):
+                self.wakeups += 1
+            # Pick up changes made by other tasks since the last poll
+            get_client().refresh()
+
+        return self.results
+
+    def failed(self):
+        """Return the results of the VMs that did not reach their state."""
+        return [result for result in self.results.values() if not result["reached"]]
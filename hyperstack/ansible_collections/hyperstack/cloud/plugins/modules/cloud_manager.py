@@ -39,6 +39,7 @@ options:
         description:
             - A list of firewall rules to apply to the environment.
             - Any rules not in this list will be removed.
+            - Rules are compared as port intervals, so only the ports that are opened or closed are changed.
         type: list
         elements: dict
         suboptions:
@@ -48,9 +49,20 @@ options:
                 choices: [ tcp, udp ]
                 required: true
             port:
-                description: The port number.
+                description:
+                    - A single port number.
+                    - Exactly one of O(firewall_rules[].port) and O(firewall_rules[].port_range) is required.
                 type: int
-                required: true
+            port_range:
+                description:
+                    - An inclusive range of ports written as C(low-high), for example C(30000-32767).
+                    - Overlapping and adjacent ports of the same protocol and source are merged into one interval.
+                type: str
+            source_cidr:
+                description:
+                    - Only allow traffic from this network, for example C(10.0.0.0/8).
+                    - If not set, traffic from any source is allowed.
+                type: str
     vms:
         description:
             - A list of virtual machines to manage within the environment.
@@ -74,6 +86,37 @@ options:
                 type: str
                 default: running
                 choices: [ present, running, stopped, absent ]
+    wait:
+        description:
+            - Whether to wait until every VM changed by this task reports its desired state.
+            - All VMs are tracked in a single polling loop.
+        type: bool
+        default: false
+    wait_timeout:
+        description:
+            - Maximum time to wait for the VMs (in seconds).
+        type: int
+        default: 300
+    wait_strategy:
+        description:
+            - How to detect state changes while waiting.
+            - C(poll) re-reads the state after every backoff delay.
+            - C(notify) sleeps until the state store is written (inotify on Linux), re-checking at least every
+              backoff delay. Where notifications are unavailable it behaves like C(poll).
+        type: str
+        default: poll
+        choices: [ poll, notify ]
+    parallelism:
+        description:
+            - Maximum number of VM operations (create, start, stop, delete) to run at the same time.
+            - Operations are planned in the order of O(vms) and reported in that order whatever the order in which they
+              finish.
+            - A failed operation does not stop the others; all failures are reported together once every operation
+              has finished.
+        type: int
+        default: 1
+extends_documentation_fragment:
+    - hyperstack.cloud.hyperstack
 author:
     - Your Name (@yourgithubhandle)
 """
@@ -101,6 +144,17 @@ EXAMPLES = r"""
       - protocol: udp
         port: 53
 
+- name: Open the Kubernetes NodePort range to the internal network only
+  hyperstack.cloud.cloud_manager:
+    name: k8s
+    state: present
+    firewall_rules:
+      - protocol: tcp
+        port: 6443
+      - protocol: tcp
+        port_range: 30000-32767
+        source_cidr: 10.0.0.0/8
+
 - name: Update firewall rules (remove HTTP, keep HTTPS and DNS)
   hyperstack.cloud.cloud_manager:
     name: web-server
@@ -155,6 +209,13 @@ EXAMPLES = r"""
         image: ubuntu-22.04
         state: absent
 
+- name: Create many VMs, four at a time
+  hyperstack.cloud.cloud_manager:
+    name: batch
+    state: present
+    parallelism: 4
+    vms: "{{ batch_vms }}"
+
 - name: Complex environment with firewall and VMs
   hyperstack.cloud.cloud_manager:
     name: full-stack
@@ -215,6 +276,16 @@ diff:
             description: Desired firewall rules after changes
             type: str
             returned: when firewall rules change
+        added:
+            description: Rules that are added; the other rules are left in place
+            type: list
+            elements: dict
+            returned: when firewall rules change
+        removed:
+            description: Rules that are removed
+            type: list
+            elements: dict
+            returned: when firewall rules change
 vms:
     description: Details of VMs in the environment after operations
     type: list
@@ -253,161 +324,408 @@ vms:
             description: Last activity timestamp
             type: str
             returned: always
+plan:
+    description:
+        - Every change needed to reach the desired state, computed against one snapshot of the environment.
+        - In check mode this is what would be done; otherwise it is what was applied.
+    type: dict
+    returned: always
+    contains:
+        environment:
+            description: The name of the environment
+            type: str
+            returned: always
+        environment_action:
+            description: C(create) or C(delete) if the environment itself changes, else null
+            type: str
+            returned: always
+        firewall:
+            description: The firewall rules to add (C(added)) and remove (C(removed)), or null if they do not change
+            type: dict
+            returned: always
+        vms:
+            description: The VMs to change in the order of O(vms), each with its C(name), C(action) and C(spec)
+            type: list
+            elements: dict
+            returned: always
+        warnings:
+            description: Warnings raised while planning
+            type: list
+            elements: str
+            returned: always
+vm_operations:
+    description: The VM operations that were run, in the order of O(vms)
+    type: list
+    returned: when VM operations were run
+    elements: dict
+    contains:
+        name:
+            description: The name of the VM
+            type: str
+            returned: always
+        operation:
+            description: One of C(created), C(started), C(stopped) or C(deleted)
+            type: str
+            returned: always
+        failed:
+            description: Whether the operation failed
+            type: bool
+            returned: always
+        msg:
+            description: Why the operation failed
+            type: str
+            returned: when failed
+vm_wait:
+    description: How long each changed VM took to reach its desired state
+    type: list
+    returned: when wait is true and VMs were changed
+    elements: dict
+    contains:
+        name:
+            description: The name of the VM
+            type: str
+            returned: always
+        state:
+            description: The state that was waited for
+            type: str
+            returned: always
+        reached:
+            description: Whether the VM reached the state before the timeout
+            type: bool
+            returned: always
+        elapsed:
+            description: Seconds until the VM reached the state, or null if it did not
+            type: float
+            returned: always
+lock_stats:
+    description:
+        - Contention counters of the state store locks taken during this run.
+        - Not returned when O(api_url) is set, because the server's locks are not visible.
+    type: dict
+    returned: when the local mock state is used
+    contains:
+        acquired:
+            description: Number of times a lock was taken
+            type: int
+            returned: always
+        contended:
+            description: Number of times a lock was held by another task and had to be waited for
+            type: int
+            returned: always
+        timeouts:
+            description: Number of times waiting for a lock timed out
+            type: int
+            returned: always
+        wait_time:
+            description: Total seconds spent waiting for locks
+            type: float
+            returned: always
+        max_wait:
+            description: Longest single wait for a lock in seconds
+            type: float
+            returned: always
 failed:
     description: Indicates if the module failed
     type: bool
     returned: when module encounters an error
 """
 
-import os
+import hashlib
 import json
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.hyperstack.cloud.plugins.module_utils.api_client import (
+    ApiError,
+    add_lock_stats,
+    configure_client_from_params,
+    get_client,
+    hyperstack_argument_spec,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.instances import FIELDS, iter_records
+from ansible_collections.hyperstack.cloud.plugins.module_utils.state_store import (
+    StateStoreError,
+    configure_store,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.firewall import (
+    diff_rules,
+    format_rule,
+    merge_rules,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.waiter import Waiter
 
 # Set of valid images to simulate an API constraint
 _VALID_IMAGES = {"ubuntu-22.04", "rhel-9"}
 
-# File-based persistence for mock state (needed for idempotency testing)
-_STATE_FILE = os.path.join(tempfile.gettempdir(), "hyperstack_mock_state.json")
-
-
-def _load_state():
-    """Load mock state from file."""
-    if os.path.exists(_STATE_FILE):
-        try:
-            with open(_STATE_FILE, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    return {"production": {"id": "env-123", "status": "active"}}
-
-
-def _save_state(state):
-    """Save mock state to file."""
-    try:
-        with open(_STATE_FILE, 'w') as f:
-            json.dump(state, f)
-    except IOError:
-        pass
-
-
-def _generate_mock_ip():
-    """Generate a mock IP address for demonstration."""
-    import random
-    return f"192.168.{random.randint(1, 255)}.{random.randint(1, 254)}"
-
-
-def _generate_vm_details(env_name, vm_name, vm_data):
-    """Generate detailed VM information for response."""
-    return {
-        "name": vm_name,
-        "state": vm_data.get("status", "unknown"),
-        "public_ip": vm_data.get("public_ip", _generate_mock_ip()),
-        "private_ip": vm_data.get("private_ip", f"10.0.{hash(vm_name) % 255}.{hash(env_name) % 254}"),
-        "size": vm_data.get("size", "unknown"),
-        "image": vm_data.get("image", "unknown"),
-        "created_at": vm_data.get("created_at", "2024-01-01T00:00:00Z"),
-        "last_seen": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    }
+# Details reported for the VMs of the managed environment
+_VM_FIELDS = tuple(name for name in FIELDS if name != "environment")
 
 
 def _get_environment_vms(env_name):
     """Get detailed information about all VMs in an environment."""
-    state = _load_state()
-    vms = []
-    
-    if env_name in state and "vms" in state[env_name]:
-        for vm_name, vm_data in state[env_name]["vms"].items():
-            vms.append(_generate_vm_details(env_name, vm_name, vm_data))
-    
-    return vms
+    return [record.as_dict() for record in iter_records(get_client().iter_vms(env_name), _VM_FIELDS)]
 
 
 def get_environment(name):
-    """Simulates fetching an environment from the cloud API."""
-    state = _load_state()
-    return state.get(name)
+    """Fetch an environment from the cloud API."""
+    return get_client().get_environment(name)
 
 
 def create_environment(name):
-    """Simulates creating a new environment."""
-    # In a real module, this would be an API call
-    state = _load_state()
-    state[name] = {"id": f"env-{hash(name)}", "status": "active"}
-    _save_state(state)
+    """Create a new environment through the cloud API."""
+    get_client().create_environment(name, {"id": f"env-{hash(name)}", "status": "active"})
 
 
 def delete_environment(name):
-    """Simulates deleting an environment."""
-    # In a real module, this would be an API call
-    state = _load_state()
-    if name in state:
-        del state[name]
-    _save_state(state)
+    """Delete an environment through the cloud API."""
+    get_client().delete_environment(name)
 
 
 def _normalize_rules(rules):
     """Sorts a list of rule dictionaries to allow for consistent comparison."""
     if not rules:
         return []
-    # Sort by a tuple of values to ensure a deterministic order
-    return sorted(rules, key=lambda r: (r["protocol"], r["port"]))
+    # Merge into sorted port intervals to ensure a deterministic form
+    return merge_rules(rules)
 
 
 def format_rules_for_display(rules):
     """Format rules for display in diff output."""
     if not rules:
         return ""
-    return ", ".join([f"{rule['protocol']}:{rule['port']}" for rule in rules])
+    return ", ".join([format_rule(rule) for rule in rules])
 
 
 def create_vm(env_name, vm_spec):
-    """Simulates creating a VM, with potential for failure."""
+    """Create a VM through the cloud API, with potential for failure."""
     if vm_spec["image"] not in _VALID_IMAGES:
         raise ValueError(f"Image '{vm_spec['image']}' not found.")
 
-    state = _load_state()
-    if env_name in state:
-        if "vms" not in state[env_name]:
-            state[env_name]["vms"] = {}
-        state[env_name]["vms"][vm_spec["name"]] = {
-            "name": vm_spec["name"],
-            "size": vm_spec["size"],
-            "image": vm_spec["image"],
-            "status": "running",
-            "public_ip": _generate_mock_ip(),
-            "private_ip": f"10.0.{hash(vm_spec['name']) % 255}.{hash(env_name) % 254}",
-            "created_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-        }
-        _save_state(state)
+    get_client().put_vm(env_name, vm_spec["name"], {
+        "name": vm_spec["name"],
+        "size": vm_spec["size"],
+        "image": vm_spec["image"],
+        "status": "running",
+        "created_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    })
 
 
 def delete_vm(env_name, vm_name):
-    """Simulates deleting a VM."""
-
-    state = _load_state()
-    if env_name in state and "vms" in state[env_name] and vm_name in state[env_name]["vms"]:
-        del state[env_name]["vms"][vm_name]
-        _save_state(state)
+    """Delete a VM through the cloud API."""
+    get_client().delete_vm(env_name, vm_name)
 
 
 def start_vm(env_name, vm_name):
-    """Simulates starting a VM."""
-
-    state = _load_state()
-    if env_name in state and "vms" in state[env_name] and vm_name in state[env_name]["vms"]:
-        state[env_name]["vms"][vm_name]["status"] = "running"
-        _save_state(state)
+    """Start a VM through the cloud API."""
+    get_client().update_vm(env_name, vm_name, status="running")
 
 
 def stop_vm(env_name, vm_name):
-    """Simulates stopping a VM."""
+    """Stop a VM through the cloud API."""
+    get_client().update_vm(env_name, vm_name, status="stopped")
 
-    state = _load_state()
-    if env_name in state and "vms" in state[env_name] and vm_name in state[env_name]["vms"]:
-        state[env_name]["vms"][vm_name]["status"] = "stopped"
-        _save_state(state)
+
+def _other_environments_with_vm(env_name, vm_name):
+    """Return the names of other environments that have a VM called vm_name."""
+    return [env for env, _, _ in get_client().find_vms(vm_name) if env != env_name]
+
+
+# State each VM action leaves the VM in, for the waiter
+_SETTLED_STATES = {"create": "running", "start": "running", "stop": "stopped", "delete": "terminated"}
+
+# How each VM action is reported in messages and vm_operations
+_DONE = {"create": "created", "start": "started", "stop": "stopped", "delete": "deleted"}
+
+
+def _vm_action(desired_state, current_vm):
+    """Return the action that moves a VM from current_vm (None if missing) to desired_state, or None."""
+    if desired_state in ["present", "running"] and current_vm is None:
+        return "create"
+    if desired_state == "running" and current_vm and current_vm.get("status") != "running":
+        return "start"
+    if desired_state == "stopped" and current_vm and current_vm.get("status") != "stopped":
+        return "stop"
+    if desired_state == "absent" and current_vm is not None:
+        return "delete"
+    return None
+
+
+def spec_hash(state, desired_rules=None, desired_vms=None):
+    """Return a digest of the desired spec of an environment. Raises ValueError on invalid rules."""
+    spec = {
+        "state": state,
+        "rules": None if desired_rules is None else merge_rules(desired_rules),
+        "vms": desired_vms,
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def is_converged(env, desired_hash):
+    """
+    Whether a run with the spec hashed as desired_hash converged env and
+    nothing changed it since: the mark left by that run must name both this
+    spec and the content hash the environment still has.
+    """
+    converged = (env or {}).get("converged") or {}
+    return converged.get("spec") == desired_hash and converged.get("content") == env.get("content_hash")
+
+
+def _empty_plan(name):
+    """Return a plan without changes."""
+    return {"environment": name, "environment_action": None, "firewall": None, "vms": [], "warnings": []}
+
+
+def build_plan(name, state, current_env, desired_rules=None, desired_vms=None):
+    """
+    Compute every change needed to bring an environment to the desired state.
+
+    The plan is computed against a single snapshot, current_env (None if the
+    environment does not exist), and nothing is changed. It is a plain dict
+    that can be returned to the user and applied later with apply_plan():
+
+    - environment: the environment name
+    - environment_action: "create", "delete" or None
+    - firewall: {"added": rules, "removed": rules} if the rules change, else None
+    - vms: {"name", "action", "spec"} for every VM to change, in the order of desired_vms
+    - warnings: messages for the user
+    """
+    plan = _empty_plan(name)
+    if state == "absent":
+        if current_env is not None:
+            plan["environment_action"] = "delete"
+        return plan
+
+    if current_env is None:
+        plan["environment_action"] = "create"
+
+    if desired_rules is not None:
+        added, removed = diff_rules(current_env.get("rules", []) if current_env else [], desired_rules)
+        if added or removed:
+            plan["firewall"] = {"added": added, "removed": removed}
+
+    current_vms = current_env.get("vms", {}) if current_env else {}
+    for vm_spec in desired_vms or []:
+        vm_name = vm_spec["name"]
+        action = _vm_action(vm_spec.get("state", "running"), current_vms.get(vm_name))
+        if action is None:
+            continue
+        if action == "create":
+            others = _other_environments_with_vm(name, vm_name)
+            if others:
+                plan["warnings"].append(
+                    f"VM name '{vm_name}' is also used in environment(s) {', '.join(others)}; "
+                    "the instance module needs the environment option to address it"
+                )
+        plan["vms"].append({"name": vm_name, "action": action, "spec": vm_spec})
+    return plan
+
+
+def plan_changes(plan):
+    """Whether applying the plan changes anything."""
+    return bool(plan["environment_action"] or plan["firewall"] or plan["vms"])
+
+
+def plan_message(plan):
+    """Describe the first change of a plan, the way the module reports it."""
+    name = plan["environment"]
+    if plan["environment_action"] == "create":
+        return f"Environment '{name}' created successfully."
+    if plan["environment_action"] == "delete":
+        return f"Environment '{name}' deleted successfully."
+    if plan["firewall"]:
+        return f"Firewall rules updated for environment '{name}'."
+    if plan["vms"]:
+        vm = plan["vms"][0]
+        where = "from" if vm["action"] == "delete" else "in"
+        return f"VM '{vm['name']}' {_DONE[vm['action']]} {where} environment '{name}'."
+    return f"Environment '{name}' is in desired state."
+
+
+def _run_vm_action(env_name, vm_spec, action):
+    """Run one VM action and return an error message, or None if it succeeded."""
+    vm_name = vm_spec["name"]
+    try:
+        if action == "create":
+            create_vm(env_name, vm_spec)
+        elif action == "start":
+            start_vm(env_name, vm_name)
+        elif action == "stop":
+            stop_vm(env_name, vm_name)
+        elif action == "delete":
+            delete_vm(env_name, vm_name)
+        else:
+            raise ValueError(f"unknown action '{action}'")
+    except ValueError as e:
+        # Catch specific expected errors and provide tailored messages
+        return f"Failed to manage VM '{vm_name}': {e}"
+    except Exception as e:
+        # Generic catch-all for unexpected errors
+        return f"An unexpected error occurred while managing VM '{vm_name}': {e}"
+    return None
+
+
+def run_vm_operations(env_name, operations, parallelism=1):
+    """
+    Run (vm_spec, action) pairs on up to parallelism threads.
+
+    Returns one error message (or None) per operation, in the order of
+    operations. Failures never cancel the remaining operations.
+    """
+    if parallelism <= 1 or len(operations) <= 1:
+        return [_run_vm_action(env_name, vm_spec, action) for vm_spec, action in operations]
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(operations))) as executor:
+        futures = [executor.submit(_run_vm_action, env_name, vm_spec, action) for vm_spec, action in operations]
+        return [future.result() for future in futures]
+
+
+def apply_plan(plan, parallelism=1):
+    """
+    Make every change of a plan through the API client.
+
+    With the mock backend the changes are only staged; the caller persists
+    them with one flush.
+    Returns one vm_operations entry per planned VM, in plan order.
+    """
+    name = plan["environment"]
+    if plan["environment_action"] == "delete":
+        delete_environment(name)
+        return []
+    if plan["environment_action"] == "create":
+        create_environment(name)
+    if plan["firewall"]:
+        get_client().update_rules(name, plan["firewall"]["added"], plan["firewall"]["removed"])
+
+    errors = run_vm_operations(name, [(vm["spec"], vm["action"]) for vm in plan["vms"]], parallelism)
+    operations = []
+    for vm, error in zip(plan["vms"], errors):
+        entry = {"name": vm["name"], "operation": _DONE[vm["action"]], "failed": error is not None}
+        if error is not None:
+            entry["msg"] = error
+        operations.append(entry)
+    return operations
+
+
+def _wait_for_vms(module, waiter, result):
+    """Wait for every changed VM in one polling loop and fail if any did not settle."""
+    _flush_state(module)
+    waiter.wait(module.params["wait_timeout"])
+    result["vm_wait"] = [
+        dict((key, entry[key]) for key in ("name", "state", "reached", "elapsed"))
+        for entry in waiter.results.values()
+    ]
+    failed = waiter.failed()
+    if failed:
+        names = ", ".join(f"'{entry['name']}'" for entry in failed)
+        result["msg"] = f"VMs {names} did not reach their desired state"
+        module.fail_json(**result)
+
+
+def _flush_state(module):
+    """Persist every change staged during this run with a single write."""
+    try:
+        get_client().flush()
+    except (StateStoreError, ApiError) as e:
+        module.fail_json(msg=f"Failed to save state: {e}")
 
 
 def main():
@@ -421,8 +739,12 @@ def main():
                 elements="dict",
                 options=dict(
                     protocol=dict(type="str", required=True, choices=["tcp", "udp"]),
-                    port=dict(type="int", required=True),
+                    port=dict(type="int"),
+                    port_range=dict(type="str"),
+                    source_cidr=dict(type="str"),
                 ),
+                required_one_of=[["port", "port_range"]],
+                mutually_exclusive=[["port", "port_range"]],
                 default=None,
             ),
             vms=dict(
@@ -440,6 +762,11 @@ def main():
                 ),
                 default=None,
             ),
+            wait=dict(type="bool", default=False),
+            wait_timeout=dict(type="int", default=300),
+            wait_strategy=dict(type="str", default="poll", choices=["poll", "notify"]),
+            parallelism=dict(type="int", default=1),
+            **hyperstack_argument_spec(),
         ),
         supports_check_mode=True,
     )
@@ -448,106 +775,90 @@ def main():
     state = module.params["state"]
     desired_rules = module.params["firewall_rules"]
     desired_vms = module.params["vms"]
+    parallelism = module.params.get("parallelism", 1)
 
     result = dict(changed=False, name=name, state=state)
 
-    # Environment State Management (from Mission 2)
-    current_env = get_environment(name)
-    if state == "present" and current_env is None:
-        if not module.check_mode:
-            create_environment(name)
-        result["changed"] = True
-        result["msg"] = f"Environment '{name}' created successfully."
-    elif state == "present" and current_env is not None:
-        # Environment already exists, no change needed
-        pass
-    elif state == "absent" and current_env is not None:
-        if not module.check_mode:
-            delete_environment(name)
-        result["changed"] = True
-        result["msg"] = f"Environment '{name}' deleted successfully."
-        module.exit_json(**result)  # Exit early if deleting
-
-    # If we are ensuring presence, check firewall rules
-    if state == "present" and desired_rules is not None:
-        # In a real module, this would be another API call
-        current_rules = current_env.get("rules", []) if current_env else []
+    if parallelism < 1:
+        module.fail_json(msg="parallelism must be at least 1")
 
-        # Normalize for comparison
-        norm_current = _normalize_rules(current_rules)
-        norm_desired = _normalize_rules(desired_rules)
-
-        if norm_current != norm_desired:
-            result["changed"] = True
-            result["diff"] = {
-                "before": "\n".join([f"{r['protocol']}:{r['port']}" for r in norm_current]),
-                "after": "\n".join([f"{r['protocol']}:{r['port']}" for r in norm_desired]),
-            }
-            if not module.check_mode:
-                # In a real module, this would be an API call to set the rules
-                state = _load_state()
-                if name in state:
-                    state[name]["rules"] = desired_rules
-                    _save_state(state)
-            if not result.get("msg"):
-                result["msg"] = f"Firewall rules updated for environment '{name}'."
-
-    # VM Management (Mission 4)
-    if state == "present" and desired_vms is not None:
-        # In a real module, get the current list of VMs via an API call
-        current_vms = current_env.get("vms", {}) if current_env else {}
-
-        for vm_spec in desired_vms:
-            vm_name = vm_spec["name"]
-            vm_state = vm_spec.get("state", "running")
-            current_vm = current_vms.get(vm_name)
-
-            try:
-                if vm_state in ["present", "running"] and current_vm is None:
-                    # Create new VM
-                    if not module.check_mode:
-                        create_vm(name, vm_spec)
-                    result["changed"] = True
-                    if not result.get("msg"):
-                        result["msg"] = f"VM '{vm_name}' created in environment '{name}'."
-
-                elif vm_state == "running" and current_vm and current_vm.get("status") != "running":
-                    # Start existing VM
-                    if not module.check_mode:
-                        start_vm(name, vm_name)
-                    result["changed"] = True
-                    if not result.get("msg"):
-                        result["msg"] = f"VM '{vm_name}' started in environment '{name}'."
-
-                elif vm_state == "stopped" and current_vm and current_vm.get("status") != "stopped":
-                    # Stop existing VM
-                    if not module.check_mode:
-                        stop_vm(name, vm_name)
-                    result["changed"] = True
-                    if not result.get("msg"):
-                        result["msg"] = f"VM '{vm_name}' stopped in environment '{name}'."
-
-                elif vm_state == "absent" and current_vm is not None:
-                    # Delete VM
-                    if not module.check_mode:
-                        delete_vm(name, vm_name)
-                    result["changed"] = True
-                    if not result.get("msg"):
-                        result["msg"] = f"VM '{vm_name}' deleted from environment '{name}'."
-
-            except ValueError as e:
-                # Catch specific expected errors and provide tailored messages
-                module.fail_json(msg=f"Failed to manage VM '{vm_name}': {e}")
-            except Exception as e:
-                # Generic catch-all for unexpected errors
-                module.fail_json(msg=f"An unexpected error occurred while managing VM '{vm_name}': {e}")
-
-    if not result.get("msg"):
-        result["msg"] = f"Environment '{name}' is in desired state."
-
-    if state == "present" and (desired_vms is not None or current_env):
-        result["vms"] = _get_environment_vms(name)
+    try:
+        configure_client_from_params(module.params)
+    except ValueError as e:
+        module.fail_json(msg=f"Invalid API settings: {e}")
 
+    try:
+        configure_store(module.params.get("state_backend"))
+        # Every decision below is made against this one snapshot
+        current_env = get_environment(name)
+        desired_hash = spec_hash(state, desired_rules, desired_vms)
+        if state == "present" and is_converged(current_env, desired_hash):
+            # This exact spec converged before and nothing changed since: skip the diff
+            result["msg"] = f"Environment '{name}' is in desired state."
+            result["plan"] = _empty_plan(name)
+            result["vms"] = _get_environment_vms(name)
+            add_lock_stats(result)
+            module.exit_json(**result)
+            return
+        plan = build_plan(name, state, current_env, desired_rules, desired_vms)
+    except (StateStoreError, ApiError) as e:
+        module.fail_json(msg=f"Failed to load state: {e}")
+    except ValueError as e:
+        module.fail_json(msg=f"Invalid firewall_rules: {e}")
+
+    for warning in plan["warnings"]:
+        module.warn(warning)
+    result["changed"] = plan_changes(plan)
+    result["msg"] = plan_message(plan)
+    result["plan"] = plan
+    if plan["firewall"]:
+        current_rules = current_env.get("rules", []) if current_env else []
+        result["diff"] = {
+            "before": "\n".join([format_rule(r) for r in _normalize_rules(current_rules)]),
+            "after": "\n".join([format_rule(r) for r in _normalize_rules(desired_rules)]),
+            "added": plan["firewall"]["added"],
+            "removed": plan["firewall"]["removed"],
+        }
+
+    waiter = Waiter(notify=module.params.get("wait_strategy") == "notify")
+    try:
+        if not module.check_mode:
+            operations = apply_plan(plan, parallelism)
+            if operations:
+                result["vm_operations"] = operations
+            for vm, entry in zip(plan["vms"], operations):
+                if not entry["failed"]:
+                    waiter.add(name, vm["name"], _SETTLED_STATES[vm["action"]])
+
+            errors = [entry["msg"] for entry in operations if entry["failed"]]
+            if errors:
+                # Keep the operations that succeeded
+                _flush_state(module)
+                add_lock_stats(result)
+                result["msg"] = "; ".join(errors)
+                module.fail_json(**result)
+
+        if plan["environment_action"] == "delete":
+            _flush_state(module)
+            add_lock_stats(result)
+            module.exit_json(**result)  # Exit early if deleting
+
+        if module.params.get("wait") and waiter.results:
+            _wait_for_vms(module, waiter, result)
+
+        if state == "present" and not module.check_mode:
+            # Let the next run with the same spec take the fast path
+            get_client().mark_converged(name, desired_hash)
+
+        _flush_state(module)
+
+        if state == "present" and (desired_vms is not None or current_env):
+            # Read after the flush, which assigns the addresses of new VMs
+            result["vms"] = _get_environment_vms(name)
+        add_lock_stats(result)
+    except (StateStoreError, ApiError) as e:
+        result["msg"] = f"Failed to apply changes: {e}"
+        module.fail_json(**result)
     module.exit_json(**result)
 
 
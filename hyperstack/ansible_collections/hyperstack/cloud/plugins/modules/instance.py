@@ -22,12 +22,38 @@ description:
     - Manages the state of individual virtual machine instances in Hyperstack Cloud.
     - Provides direct instance control for start, stop, restart, and termination operations.
     - Useful for dynamic instance lifecycle management and hibernated instance revival.
+    - Many instances can be managed in one task with O(names) or O(environment). The state is loaded once, all
+      transitions are saved together and a single wait covers every instance.
 options:
     name:
         description:
             - The name of the instance to manage.
+            - One of O(name), O(names) or O(environment) is required.
         type: str
-        required: true
+        required: false
+    names:
+        description:
+            - The names of several instances to manage in one task.
+            - Mutually exclusive with O(name).
+        type: list
+        elements: str
+        required: false
+    environment:
+        description:
+            - The environment that contains the instance.
+            - Required when the instance name is used in more than one environment.
+            - Without O(name) or O(names), every instance in the environment is managed; the module fails if the
+              environment does not exist.
+        type: str
+        required: false
+    instance_states:
+        description:
+            - Only manage instances that are currently in one of these states.
+            - Applies to O(names) and O(environment); mutually exclusive with O(name).
+        type: list
+        elements: str
+        choices: [ running, stopped, hibernated, pending, terminated ]
+        default: []
     state:
         description:
             - The desired state of the instance.
@@ -48,12 +74,40 @@ options:
             - Maximum time to wait for the operation to complete (in seconds).
         type: int
         default: 300
+    wait_interval:
+        description:
+            - Initial delay between status polls while waiting (in seconds).
+            - Each delay is randomized between half and all of the current interval.
+        type: float
+        default: 0.5
+    wait_max_interval:
+        description:
+            - Upper bound for the delay between status polls (in seconds).
+        type: float
+        default: 10.0
+    wait_backoff:
+        description:
+            - Factor by which the poll interval grows after every poll.
+            - Use V(1) to poll at a fixed interval.
+        type: float
+        default: 2.0
+    wait_strategy:
+        description:
+            - How to detect state changes while waiting.
+            - C(poll) re-reads the state after every backoff delay.
+            - C(notify) sleeps until the state store is written (inotify on Linux), re-checking at least every
+              backoff delay. Where notifications are unavailable it behaves like C(poll).
+        type: str
+        default: poll
+        choices: [ poll, notify ]
     force:
         description:
             - Force the operation even if the instance is in an unexpected state.
             - Use with caution as this may cause data loss.
         type: bool
         default: false
+extends_documentation_fragment:
+    - hyperstack.cloud.hyperstack
 author:
     - Your Name (@yourgithubhandle)
 """
@@ -80,6 +134,27 @@ EXAMPLES = r"""
     state: terminated
     force: true
 
+- name: Stop an instance whose name is also used in another environment
+  dsmello.cloud.instance:
+    name: "web-server-01"
+    environment: staging
+    state: stopped
+
+- name: Stop every running instance in the GPU environment overnight
+  dsmello.cloud.instance:
+    environment: gpu-fleet
+    instance_states: [ running ]
+    state: stopped
+
+- name: Start several instances with one combined wait
+  dsmello.cloud.instance:
+    names:
+      - "web-server-01"
+      - "web-server-02"
+      - "worker-01"
+    state: running
+  register: started
+
 - name: Start instance without waiting for completion
   dsmello.cloud.instance:
     name: "web-server-01"
@@ -116,7 +191,7 @@ changed:
 instance:
     description: Instance information after the operation
     type: dict
-    returned: always
+    returned: when name is used
     contains:
         name:
             description: The name of the instance
@@ -146,148 +221,399 @@ operation:
     description: The operation that was performed
     type: str
     returned: always
+instances:
+    description: Per-instance results of a bulk operation
+    type: list
+    elements: dict
+    returned: when names or environment is used without name
+    contains:
+        name:
+            description: The name of the instance
+            type: str
+            returned: always
+        environment:
+            description: Environment the instance belongs to
+            type: str
+            returned: always
+        changed:
+            description: Whether the instance was changed
+            type: bool
+            returned: unless the instance could not be found
+        operation:
+            description: The operation performed on the instance
+            type: str
+            returned: unless the operation was not allowed
+        state:
+            description: State of the instance after the operation
+            type: str
+            returned: unless the instance could not be found
+        previous_state:
+            description: State of the instance before the operation
+            type: str
+            returned: unless the instance could not be found
+        failed:
+            description: Whether the operation failed for this instance
+            type: bool
+            returned: when the operation failed
+        wait_time:
+            description: Seconds until the instance reached its state, or null if it timed out
+            type: float
+            returned: when the module waited for the instance
+        msg:
+            description: Why the operation failed for this instance
+            type: str
+            returned: when the operation failed
+summary:
+    description: Counts of instances in a bulk operation
+    type: dict
+    returned: when names or environment is used without name
+    contains:
+        total:
+            description: Number of targeted instances
+            type: int
+            returned: always
+        changed:
+            description: Number of instances that were changed
+            type: int
+            returned: always
+        failed:
+            description: Number of instances whose operation failed
+            type: int
+            returned: always
+        ok:
+            description: Number of instances whose operation succeeded
+            type: int
+            returned: always
 duration:
     description: Time taken for the operation in seconds
     type: float
     returned: when wait is true
+polls:
+    description: Number of times the instance status was checked while waiting
+    type: int
+    returned: when wait is true
+lock_stats:
+    description:
+        - Contention counters of the state store locks taken during this run.
+        - Not returned when O(api_url) is set, because the server's locks are not visible.
+    type: dict
+    returned: when the local mock state is used
+    contains:
+        acquired:
+            description: Number of times a lock was taken
+            type: int
+            returned: always
+        contended:
+            description: Number of times a lock was held by another task and had to be waited for
+            type: int
+            returned: always
+        timeouts:
+            description: Number of times waiting for a lock timed out
+            type: int
+            returned: always
+        wait_time:
+            description: Total seconds spent waiting for locks
+            type: float
+            returned: always
+        max_wait:
+            description: Longest single wait for a lock in seconds
+            type: float
+            returned: always
 msg:
     description: A message describing what happened
     type: str
     returned: always
 """
 
-import os
-import json
 import time
-import tempfile
-from datetime import datetime
 from ansible.module_utils.basic import AnsibleModule
-
-_STATE_FILE = os.path.join(tempfile.gettempdir(), "hyperstack_mock_state.json")
-
-
-def _load_state():
-    """Load mock state from file."""
-    if os.path.exists(_STATE_FILE):
-        try:
-            with open(_STATE_FILE, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    return {"production": {"id": "env-123", "status": "active"}}
-
-
-def _save_state(state):
-    """Save mock state to file."""
-    try:
-        with open(_STATE_FILE, 'w') as f:
-            json.dump(state, f)
-    except IOError:
-        pass
-
-
-def _generate_mock_ip():
-    """Generate a mock IP address for demonstration."""
-    import random
-    return f"192.168.{random.randint(1, 255)}.{random.randint(1, 254)}"
-
-
-def find_instance_by_name(name):
-    """Find instance by name across all environments."""
-    state = _load_state()
-    for env_name, env_data in state.items():
-        if "vms" in env_data:
-            for vm_name, vm_data in env_data["vms"].items():
-                if vm_name == name:
-                    return env_name, vm_name, vm_data
+from ansible_collections.hyperstack.cloud.plugins.module_utils.api_client import (
+    add_lock_stats,
+    configure_client_from_params,
+    get_client,
+    hyperstack_argument_spec,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.backoff import (
+    DEFAULT_INITIAL_INTERVAL,
+    DEFAULT_MAX_INTERVAL,
+    DEFAULT_MULTIPLIER,
+    Backoff,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.instances import InstanceRecord
+from ansible_collections.hyperstack.cloud.plugins.module_utils.state_store import (
+    configure_store,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.waiter import Waiter
+
+
+def find_instance_by_name(name, env_name=None):
+    """
+    Find instance by name across all environments, or in env_name if given.
+
+    Raises ValueError if the name is used in more than one environment and
+    env_name does not say which one is meant.
+    """
+    if env_name is not None:
+        vm_data = get_client().get_vm(env_name, name)
+        if vm_data is None:
+            return None, None, None
+        return env_name, name, vm_data
+
+    matches = get_client().find_vms(name)
+    if len(matches) > 1:
+        env_names = ", ".join(f"'{env}'" for env, _, _ in matches)
+        raise ValueError(
+            f"Instance name '{name}' is used in environments {env_names}; set environment to choose one"
+        )
+    if matches:
+        return matches[0]
     return None, None, None
 
 
 def get_instance_details(env_name, vm_name, vm_data):
     """Get detailed instance information."""
-    return {
-        "name": vm_name,
-        "state": vm_data.get("status", "unknown"),
-        "public_ip": vm_data.get("public_ip", _generate_mock_ip()),
-        "private_ip": vm_data.get("private_ip", f"10.0.{hash(vm_name) % 255}.{hash(env_name) % 254}"),
-        "size": vm_data.get("size", "unknown"),
-        "image": vm_data.get("image", "unknown"),
-        "environment": env_name,
-        "created_at": vm_data.get("created_at", "2024-01-01T00:00:00Z"),
-        "last_seen": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    }
+    return InstanceRecord(env_name, vm_name, vm_data).as_dict()
 
 
 def start_instance(env_name, vm_name):
     """Start an instance."""
-    state = _load_state()
-    if env_name in state and "vms" in state[env_name] and vm_name in state[env_name]["vms"]:
-        current_status = state[env_name]["vms"][vm_name]["status"]
+    client = get_client()
+    vm_data = client.get_vm(env_name, vm_name)
+    if vm_data is not None:
+        current_status = vm_data["status"]
         if current_status != "running":
-            state[env_name]["vms"][vm_name]["status"] = "running"
-            _save_state(state)
+            client.update_vm(env_name, vm_name, status="running")
             return True, current_status
     return False, None
 
 
 def stop_instance(env_name, vm_name):
     """Stop an instance."""
-    state = _load_state()
-    if env_name in state and "vms" in state[env_name] and vm_name in state[env_name]["vms"]:
-        current_status = state[env_name]["vms"][vm_name]["status"]
+    client = get_client()
+    vm_data = client.get_vm(env_name, vm_name)
+    if vm_data is not None:
+        current_status = vm_data["status"]
         if current_status != "stopped":
-            state[env_name]["vms"][vm_name]["status"] = "stopped"
-            _save_state(state)
+            client.update_vm(env_name, vm_name, status="stopped")
             return True, current_status
     return False, None
 
 
 def restart_instance(env_name, vm_name):
     """Restart an instance."""
-    state = _load_state()
-    if env_name in state and "vms" in state[env_name] and vm_name in state[env_name]["vms"]:
-        current_status = state[env_name]["vms"][vm_name]["status"]
-        state[env_name]["vms"][vm_name]["status"] = "running"
-        _save_state(state)
+    client = get_client()
+    vm_data = client.get_vm(env_name, vm_name)
+    if vm_data is not None:
+        current_status = vm_data["status"]
+        client.update_vm(env_name, vm_name, status="running")
         return True, current_status
     return False, None
 
 
 def terminate_instance(env_name, vm_name):
     """Terminate (delete) an instance."""
-    state = _load_state()
-    if env_name in state and "vms" in state[env_name] and vm_name in state[env_name]["vms"]:
-        current_status = state[env_name]["vms"][vm_name]["status"]
-        del state[env_name]["vms"][vm_name]
-        _save_state(state)
+    client = get_client()
+    vm_data = client.get_vm(env_name, vm_name)
+    if vm_data is not None:
+        current_status = vm_data["status"]
+        client.delete_vm(env_name, vm_name)
         return True, current_status
     return False, None
 
 
-def wait_for_state(env_name, vm_name, desired_state, timeout):
+def _lookup_instance(env_name, vm_name):
+    """Return the current data of an instance for the waiter."""
+    return find_instance_by_name(vm_name, env_name)[2]
+
+
+def wait_for_state(env_name, vm_name, desired_state, timeout, backoff=None, notify=False):
     """Wait for instance to reach desired state."""
+    waiter = Waiter(lookup=_lookup_instance, backoff=backoff, notify=notify)
+    waiter.add(env_name, vm_name, desired_state)
+    waiter.wait(timeout)
+    return not waiter.failed()
+
+
+def transition_instance(env_name, vm_name, vm_data, desired_state, force):
+    """
+    Move one instance towards desired_state.
+
+    Returns (changed, previous_state, operation). Raises ValueError if the
+    transition is not allowed from the current state without force.
+    """
+    current_state = vm_data.get("status", "unknown")
+    previous_state = current_state
+    changed = False
+
+    if desired_state == "running":
+        if current_state in ["stopped", "hibernated"]:
+            changed, previous_state = start_instance(env_name, vm_name)
+            operation = "start"
+        elif current_state == "running":
+            operation = "already_running"
+        else:
+            if not force:
+                raise ValueError(f"Cannot start instance in state '{current_state}'. Use force=true to override.")
+            changed, previous_state = start_instance(env_name, vm_name)
+            operation = "force_start"
+
+    elif desired_state == "stopped":
+        if current_state == "running":
+            changed, previous_state = stop_instance(env_name, vm_name)
+            operation = "stop"
+        elif current_state == "stopped":
+            operation = "already_stopped"
+        else:
+            if not force:
+                raise ValueError(f"Cannot stop instance in state '{current_state}'. Use force=true to override.")
+            changed, previous_state = stop_instance(env_name, vm_name)
+            operation = "force_stop"
+
+    elif desired_state == "restarted":
+        changed, previous_state = restart_instance(env_name, vm_name)
+        operation = "restart"
+        changed = True
+
+    elif desired_state == "terminated":
+        if current_state == "terminated":
+            raise ValueError(f"Instance '{vm_name}' is already terminated")
+
+        if not force and current_state == "running":
+            raise ValueError("Cannot terminate running instance without force=true. This will cause data loss.")
+
+        changed, previous_state = terminate_instance(env_name, vm_name)
+        operation = "terminate"
+
+    return changed, previous_state, operation
+
+
+def _settled_state(desired_state):
+    """Return the status an instance reports once it has reached desired_state."""
+    return "running" if desired_state == "restarted" else desired_state
+
+
+def select_instances(names, environment, instance_states):
+    """
+    Resolve the instances targeted by a bulk operation.
+
+    Returns (targets, errors): targets is a list of (env_name, vm_name, vm_data),
+    errors a list of per-instance failures for names that could not be resolved.
+    """
+    targets = []
+    errors = []
+    if names is not None:
+        for name in dict.fromkeys(names):
+            try:
+                env_name, vm_name, vm_data = find_instance_by_name(name, environment)
+            except ValueError as e:
+                errors.append({"name": name, "environment": environment, "failed": True, "msg": str(e)})
+                continue
+            if not vm_data:
+                where = f" in environment '{environment}'" if environment else ""
+                errors.append({"name": name, "environment": environment, "failed": True,
+                               "msg": f"Instance '{name}' not found{where}"})
+            elif not instance_states or vm_data.get("status") in instance_states:
+                targets.append((env_name, vm_name, vm_data))
+    else:
+        targets = list(get_client().iter_vms(environment, statuses=instance_states or None))
+    return targets, errors
+
+
+def manage_instances(module, targets, errors, backoff):
+    """Apply the desired state to many instances with one flush and one combined wait, then exit."""
+    desired_state = module.params["state"]
+    wait = module.params["wait"]
+    force = module.params["force"]
     start_time = time.time()
-    while time.time() - start_time < timeout:
-        env, vm, vm_data = find_instance_by_name(vm_name)
-        if not vm_data:
-            if desired_state == "terminated":
-                return True
-            return False
-        
-        current_state = vm_data.get("status")
-        if current_state == desired_state:
-            return True
-        
-        time.sleep(2)
-    
-    return False
+
+    results = list(errors)
+    waiting = []
+    for env_name, vm_name, vm_data in targets:
+        current_state = vm_data.get("status", "unknown")
+        entry = {"name": vm_name, "environment": env_name, "previous_state": current_state}
+        if module.check_mode:
+            entry["changed"] = desired_state == "terminated" or current_state != desired_state
+            entry["operation"] = f"would_{desired_state}"
+            entry["state"] = current_state
+            results.append(entry)
+            continue
+        try:
+            changed, previous_state, operation = transition_instance(
+                env_name, vm_name, vm_data, desired_state, force
+            )
+        except ValueError as e:
+            entry.update(changed=False, failed=True, state=current_state, msg=str(e))
+            results.append(entry)
+            continue
+        entry.update(changed=changed, operation=operation, previous_state=previous_state)
+        if wait and changed and desired_state != "terminated":
+            waiting.append((env_name, vm_name, _settled_state(desired_state)))
+        results.append(entry)
+
+    # Persist every transition at once before waiting so other tasks can observe them
+    get_client().flush()
+
+    waited = {}
+    if waiting:
+        waiter = Waiter(
+            lookup=_lookup_instance, backoff=backoff, notify=module.params.get("wait_strategy") == "notify"
+        )
+        for env_name, vm_name, state in waiting:
+            waiter.add(env_name, vm_name, state)
+        waited = waiter.wait(module.params["wait_timeout"])
+    for entry in results:
+        if "state" in entry or entry.get("failed"):
+            continue
+        vm_data = get_client().get_vm(entry["environment"], entry["name"])
+        entry["state"] = vm_data.get("status", "unknown") if vm_data else "terminated"
+        outcome = waited.get((entry["environment"], entry["name"]))
+        if outcome is None:
+            continue
+        entry["wait_time"] = outcome["elapsed"]
+        if outcome["elapsed"] is None:
+            entry["failed"] = True
+            entry["msg"] = f"Timeout waiting for instance '{entry['name']}' to reach state '{desired_state}'"
+        elif not outcome["reached"]:
+            entry["failed"] = True
+            entry["msg"] = f"Instance '{entry['name']}' disappeared while waiting for state '{desired_state}'"
+
+    summary = {
+        "total": len(results),
+        "changed": sum(1 for entry in results if entry.get("changed")),
+        "failed": sum(1 for entry in results if entry.get("failed")),
+    }
+    summary["ok"] = summary["total"] - summary["failed"]
+    result = {
+        "changed": summary["changed"] > 0,
+        "instances": results,
+        "summary": summary,
+        "operation": f"would_{desired_state}" if module.check_mode else f"bulk_{desired_state}",
+    }
+    if wait:
+        result["duration"] = round(time.time() - start_time, 2)
+        result["polls"] = backoff.polls
+
+    add_lock_stats(result)
+
+    if summary["failed"]:
+        module.fail_json(msg=f"{summary['failed']} of {summary['total']} instances failed", **result)
+    result["msg"] = f"{summary['changed']} of {summary['total']} instances changed"
+    module.exit_json(**result)
 
 
 def main():
     """Main execution path of the module."""
     module = AnsibleModule(
         argument_spec=dict(
-            name=dict(type="str", required=True),
+            name=dict(type="str", required=False),
+            names=dict(type="list", elements="str", required=False),
+            environment=dict(type="str", required=False),
+            instance_states=dict(
+                type="list",
+                elements="str",
+                choices=["running", "stopped", "hibernated", "pending", "terminated"],
+                default=[]
+            ),
             state=dict(
                 type="str",
                 default="running",
@@ -295,33 +621,61 @@ def main():
             ),
             wait=dict(type="bool", default=True),
             wait_timeout=dict(type="int", default=300),
+            wait_interval=dict(type="float", default=DEFAULT_INITIAL_INTERVAL),
+            wait_max_interval=dict(type="float", default=DEFAULT_MAX_INTERVAL),
+            wait_backoff=dict(type="float", default=DEFAULT_MULTIPLIER),
+            wait_strategy=dict(type="str", default="poll", choices=["poll", "notify"]),
             force=dict(type="bool", default=False),
+            **hyperstack_argument_spec(),
         ),
+        required_one_of=[["name", "names", "environment"]],
+        mutually_exclusive=[["name", "names"], ["name", "instance_states"]],
         supports_check_mode=True,
     )
 
     name = module.params["name"]
+    environment = module.params.get("environment")
     desired_state = module.params["state"]
     wait = module.params["wait"]
     wait_timeout = module.params["wait_timeout"]
+    notify = module.params.get("wait_strategy") == "notify"
     force = module.params["force"]
 
+    try:
+        backoff = Backoff(
+            module.params.get("wait_interval", DEFAULT_INITIAL_INTERVAL),
+            module.params.get("wait_max_interval", DEFAULT_MAX_INTERVAL),
+            module.params.get("wait_backoff", DEFAULT_MULTIPLIER),
+        )
+    except ValueError as e:
+        module.fail_json(msg=f"Invalid wait settings: {e}")
+
     start_time = time.time()
 
     try:
-        env_name, vm_name, vm_data = find_instance_by_name(name)
+        configure_store(module.params.get("state_backend"))
+        configure_client_from_params(module.params)
+
+        if name is None:
+            if environment is not None and get_client().get_environment(environment) is None:
+                # Otherwise a misspelled environment would select no instances and report success
+                module.fail_json(msg=f"Environment '{environment}' not found")
+            targets, errors = select_instances(
+                module.params.get("names"), environment, module.params.get("instance_states")
+            )
+            manage_instances(module, targets, errors, backoff)
+            return
+
+        env_name, vm_name, vm_data = find_instance_by_name(name, environment)
         
         if not vm_data:
-            module.fail_json(msg=f"Instance '{name}' not found")
+            where = f" in environment '{environment}'" if environment else ""
+            module.fail_json(msg=f"Instance '{name}' not found{where}")
 
         current_state = vm_data.get("status", "unknown")
-        previous_state = current_state
-        changed = False
-        operation = "none"
 
         if module.check_mode:
-            if desired_state == "terminated" or current_state != desired_state:
-                changed = True
+            changed = desired_state == "terminated" or current_state != desired_state
             result = {
                 "changed": changed,
                 "instance": get_instance_details(env_name, vm_name, vm_data),
@@ -330,60 +684,25 @@ def main():
             }
             module.exit_json(**result)
 
-        if desired_state == "running":
-            if current_state in ["stopped", "hibernated"]:
-                changed, previous_state = start_instance(env_name, vm_name)
-                operation = "start"
-            elif current_state == "running":
-                operation = "already_running"
-            else:
-                if not force:
-                    module.fail_json(
-                        msg=f"Cannot start instance in state '{current_state}'. Use force=true to override."
-                    )
-                changed, previous_state = start_instance(env_name, vm_name)
-                operation = "force_start"
-
-        elif desired_state == "stopped":
-            if current_state == "running":
-                changed, previous_state = stop_instance(env_name, vm_name)
-                operation = "stop"
-            elif current_state == "stopped":
-                operation = "already_stopped"
-            else:
-                if not force:
-                    module.fail_json(
-                        msg=f"Cannot stop instance in state '{current_state}'. Use force=true to override."
-                    )
-                changed, previous_state = stop_instance(env_name, vm_name)
-                operation = "force_stop"
-
-        elif desired_state == "restarted":
-            changed, previous_state = restart_instance(env_name, vm_name)
-            operation = "restart"
-            changed = True
+        try:
+            changed, previous_state, operation = transition_instance(
+                env_name, vm_name, vm_data, desired_state, force
+            )
+        except ValueError as e:
+            module.fail_json(msg=str(e))
 
-        elif desired_state == "terminated":
-            if current_state == "terminated":
-                module.fail_json(msg=f"Instance '{name}' is already terminated")
-            
-            if not force and current_state == "running":
-                module.fail_json(
-                    msg="Cannot terminate running instance without force=true. This will cause data loss."
-                )
-            
-            changed, previous_state = terminate_instance(env_name, vm_name)
-            operation = "terminate"
+        # Persist the transition before waiting so other tasks can observe it
+        get_client().flush()
 
         if wait and changed and desired_state != "terminated":
-            if not wait_for_state(env_name, vm_name, desired_state, wait_timeout):
+            if not wait_for_state(env_name, vm_name, _settled_state(desired_state), wait_timeout, backoff, notify):
                 module.fail_json(
                     msg=f"Timeout waiting for instance '{name}' to reach state '{desired_state}'"
                 )
 
         duration = time.time() - start_time
 
-        env_name, vm_name, vm_data = find_instance_by_name(name)
+        env_name, vm_name, vm_data = find_instance_by_name(name, env_name)
         instance_info = {}
         if vm_data:
             instance_info = get_instance_details(env_name, vm_name, vm_data)
@@ -405,6 +724,8 @@ def main():
 
         if wait:
             result["duration"] = round(duration, 2)
+            result["polls"] = backoff.polls
+        add_lock_stats(result)
 
         module.exit_json(**result)
 
@@ -413,4 +734,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
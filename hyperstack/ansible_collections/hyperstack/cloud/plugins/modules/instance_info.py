@@ -21,24 +21,44 @@ version_added: "1.0.0"
 description:
     - Retrieves detailed information about virtual machine instances in Hyperstack Cloud.
     - Can query instances by name, IP address, or retrieve all instances in an environment.
+    - Many names or IP addresses can be resolved in a single call with O(names) or O(ip_addresses), which loads
+      the state once instead of once per host.
     - Useful for dynamic infrastructure discovery and instance state validation.
 options:
     name:
         description:
             - The name of the specific instance to query.
-            - Mutually exclusive with ip_address and environment.
+            - If the name is used in more than one environment, every match is returned with a warning.
+            - Mutually exclusive with names, ip_address, ip_addresses and environment.
         type: str
         required: false
+    names:
+        description:
+            - A list of instance names to query in a single call.
+            - Matches are also returned per name in RV(results).
+            - Mutually exclusive with name, ip_address, ip_addresses and environment.
+        type: list
+        elements: str
+        required: false
     ip_address:
         description:
             - The public or private IP address of the instance to query.
-            - Mutually exclusive with name and environment.
+            - If more than one instance uses the address, every match is returned with a warning.
+            - Mutually exclusive with name, names, ip_addresses and environment.
         type: str
         required: false
+    ip_addresses:
+        description:
+            - A list of public or private IP addresses to query in a single call.
+            - Matches are also returned per address in RV(results).
+            - Mutually exclusive with name, names, ip_address and environment.
+        type: list
+        elements: str
+        required: false
     environment:
         description:
             - The environment name to query all instances from.
-            - Mutually exclusive with name and ip_address.
+            - Mutually exclusive with name, names, ip_address and ip_addresses.
         type: str
         required: false
     instance_states:
@@ -49,6 +69,67 @@ options:
         elements: str
         choices: [ running, stopped, hibernated, pending, terminated ]
         default: []
+    cache_ttl:
+        description:
+            - Number of seconds the result of this query is cached on the controller host and reused by later
+              calls with the same query, for example in other plays.
+            - The cache is invalidated whenever the M(hyperstack.cloud.instance) or M(hyperstack.cloud.cloud_manager)
+              modules change anything, so it only serves results that are still current, apart from changes made
+              outside of this collection.
+            - Entries are stored under E(HYPERSTACK_CACHE_DIR), by default C(hyperstack_info_cache) in the temp
+              directory.
+            - V(0) disables the cache.
+        type: int
+        default: 0
+    limit:
+        description:
+            - Return at most this many instances, starting at O(offset).
+            - RV(total) reports the number of matching instances, so pages can be requested until O(offset)
+              reaches it.
+            - Only the returned instances are formatted, which keeps large listings cheap.
+            - With O(names) or O(ip_addresses), RV(results) still holds every match.
+        type: int
+    offset:
+        description:
+            - Number of matching instances to skip before the first one returned.
+        type: int
+        default: 0
+    filters:
+        description:
+            - Only return instances matching all of these attributes.
+            - Filters are applied before any instance details are built, together with O(instance_states).
+        type: dict
+        suboptions:
+            size:
+                description: Instance sizes to match.
+                type: list
+                elements: str
+            image:
+                description: Images to match.
+                type: list
+                elements: str
+            environment:
+                description: Shell-style pattern the environment name must match, for example C(prod-*).
+                type: str
+            created_before:
+                description:
+                    - Only instances created before this ISO 8601 timestamp, for example C(2024-06-01T00:00:00Z).
+                    - Timestamps without a timezone are taken as UTC.
+                type: str
+            created_after:
+                description: Only instances created after this ISO 8601 timestamp.
+                type: str
+    fields:
+        description:
+            - Only compute and return these fields of each instance, which keeps the results of large queries
+              small.
+            - C(name) and C(environment) are always returned, as they identify the instance.
+            - By default every field is returned.
+        type: list
+        elements: str
+        choices: [ name, state, public_ip, private_ip, size, image, environment, created_at, last_seen ]
+extends_documentation_fragment:
+    - hyperstack.cloud.hyperstack
 author:
     - Your Name (@yourgithubhandle)
 """
@@ -64,6 +145,16 @@ EXAMPLES = r"""
     ip_address: "192.168.1.100"
   register: instance_by_ip
 
+- name: Resolve many IP addresses to instances in one call
+  dsmello.cloud.instance_info:
+    ip_addresses: "{{ groups['all'] | map('extract', hostvars, 'ansible_host') | list }}"
+  register: hosts_by_ip
+
+- name: Show the instance behind each address
+  ansible.builtin.debug:
+    msg: "{{ item.key }} -> {{ item.value | map(attribute='name') | list }}"
+  loop: "{{ hosts_by_ip.results | dict2items }}"
+
 - name: Get all instances in an environment
   dsmello.cloud.instance_info:
     environment: "production"
@@ -75,6 +166,30 @@ EXAMPLES = r"""
     instance_states: ["running"]
   register: running_instances
 
+- name: Look up the database servers once for all plays in the next 5 minutes
+  dsmello.cloud.instance_info:
+    environment: "production"
+    cache_ttl: 300
+  register: production_instances
+
+- name: Get the second page of 100 running instances
+  dsmello.cloud.instance_info:
+    environment: "production"
+    instance_states: ["running"]
+    limit: 100
+    offset: 100
+  register: running_page
+
+- name: Get the private IPs of the large Ubuntu instances in the prod-* environments
+  dsmello.cloud.instance_info:
+    filters:
+      environment: "prod-*"
+      size: ["large", "xlarge"]
+      image: ["ubuntu-22.04"]
+      created_after: "2024-06-01T00:00:00Z"
+    fields: ["private_ip"]
+  register: ubuntu_hosts
+
 - name: Get hibernated instances across all environments
   dsmello.cloud.instance_info:
     instance_states: ["hibernated"]
@@ -90,7 +205,9 @@ EXAMPLES = r"""
 
 RETURN = r"""
 instances:
-    description: List of instances matching the query criteria
+    description:
+        - List of instances matching the query criteria.
+        - With O(fields), each instance only holds the requested fields plus C(name) and C(environment).
     type: list
     returned: always
     elements: dict
@@ -135,113 +252,205 @@ count:
     description: Number of instances returned
     type: int
     returned: always
+total:
+    description: Number of instances matching the query, before O(limit) and O(offset) are applied
+    type: int
+    returned: always
+results:
+    description:
+        - Instances matching each queried name or IP address, keyed by the query.
+        - Queries without a match map to an empty list.
+    type: dict
+    returned: when names or ip_addresses is used
+not_found:
+    description: Queried names or IP addresses that matched no instance
+    type: list
+    elements: str
+    returned: when names or ip_addresses is used
 query:
     description: The query parameters used
     type: dict
     returned: always
+cached:
+    description: Whether the result was served from the cache (see O(cache_ttl))
+    type: bool
+    returned: always
 """
 
-import os
-import json
-import tempfile
 import ipaddress
-from datetime import datetime
 from ansible.module_utils.basic import AnsibleModule
-
-_STATE_FILE = os.path.join(tempfile.gettempdir(), "hyperstack_mock_state.json")
-
-
-def _load_state():
-    """Load mock state from file."""
-    if os.path.exists(_STATE_FILE):
-        try:
-            with open(_STATE_FILE, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    return {"production": {"id": "env-123", "status": "active"}}
-
-
-def _generate_mock_ip():
-    """Generate a mock IP address for demonstration."""
-    import random
-    return f"192.168.{random.randint(1, 255)}.{random.randint(1, 254)}"
-
-
-def _generate_instance_details(env_name, vm_name, vm_data):
-    """Generate detailed instance information."""
-    return {
-        "name": vm_name,
-        "state": vm_data.get("status", "unknown"),
-        "public_ip": vm_data.get("public_ip", _generate_mock_ip()),
-        "private_ip": vm_data.get("private_ip", f"10.0.{hash(vm_name) % 255}.{hash(env_name) % 254}"),
-        "size": vm_data.get("size", "unknown"),
-        "image": vm_data.get("image", "unknown"),
-        "environment": env_name,
-        "created_at": vm_data.get("created_at", "2024-01-01T00:00:00Z"),
-        "last_seen": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    }
-
-
-def get_instance_by_name(name):
-    """Find instance by name across all environments."""
-    state = _load_state()
-    for env_name, env_data in state.items():
-        if "vms" in env_data:
-            for vm_name, vm_data in env_data["vms"].items():
-                if vm_name == name:
-                    return _generate_instance_details(env_name, vm_name, vm_data)
-    return None
-
-
-def get_instance_by_ip(ip_address):
-    """Find instance by IP address across all environments."""
+from ansible_collections.hyperstack.cloud.plugins.module_utils.api_client import (
+    configure_client_from_params,
+    get_client,
+    hyperstack_argument_spec,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.instances import (
+    FIELDS,
+    filter_vms,
+    filter_vms_by_status,
+    iter_details,
+    paginate,
+    vm_filter,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.read_cache import (
+    ReadCache,
+    cache_key,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.state_store import (
+    configure_store,
+)
+
+
+def _select(vms, instance_states=None, filters=None):
+    """Yield the raw VMs matching the state filter and the attribute filters."""
+    return filter_vms(filter_vms_by_status(vms, instance_states), filters)
+
+
+def get_instances_by_name(name, instance_states=None, filters=None, fields=None):
+    """Find every instance with the given name, one per environment that uses it."""
+    return list(iter_details(_select(get_client().find_vms(name), instance_states, filters), fields))
+
+
+def _single(instances, query):
+    """Return the only instance of a lookup, or None. Raises ValueError if several instances match."""
+    if len(instances) > 1:
+        matches = ", ".join(f"'{instance['environment']}.{instance['name']}'" for instance in instances)
+        raise ValueError(f"{query} matches instances {matches}")
+    return instances[0] if instances else None
+
+
+def get_instance_by_name(name, instance_states=None, filters=None, fields=None):
+    """Find instance by name across all environments. Raises ValueError if the name is used in several."""
+    return _single(get_instances_by_name(name, instance_states, filters, fields), f"Instance name '{name}'")
+
+
+def get_instance_by_ip(ip_address, instance_states=None, filters=None, fields=None):
+    """Find instance by IP address across all environments. Raises ValueError if several instances use it."""
+    return _single(get_instances_by_ip(ip_address, instance_states, filters, fields), f"IP address '{ip_address}'")
+
+
+def _find_vms_by_ip(ip_address):
+    """Return the raw VMs with the given public or private IP address, or none if it is not an IP address."""
     try:
         ipaddress.ip_address(ip_address)
     except ValueError:
-        return None
-    
-    state = _load_state()
-    for env_name, env_data in state.items():
-        if "vms" in env_data:
-            for vm_name, vm_data in env_data["vms"].items():
-                instance_details = _generate_instance_details(env_name, vm_name, vm_data)
-                if instance_details["public_ip"] == ip_address or instance_details["private_ip"] == ip_address:
-                    return instance_details
-    return None
-
-
-def get_instances_in_environment(env_name):
-    """Get all instances in a specific environment."""
-    state = _load_state()
-    instances = []
-    
-    if env_name in state and "vms" in state[env_name]:
-        for vm_name, vm_data in state[env_name]["vms"].items():
-            instances.append(_generate_instance_details(env_name, vm_name, vm_data))
-    
-    return instances
+        return []
+    return get_client().find_vms_by_ip(ip_address)
 
 
-def get_all_instances():
-    """Get all instances across all environments."""
-    state = _load_state()
+def get_instances_by_ip(ip_address, instance_states=None, filters=None, fields=None):
+    """Find every instance with the given public or private IP address."""
+    return list(iter_details(_select(_find_vms_by_ip(ip_address), instance_states, filters), fields))
+
+
+def get_instances_by_queries(queries, lookup):
+    """
+    Resolve many names or IP addresses with one lookup each.
+
+    Returns the matches keyed by query, in query order. An instance matched
+    by several queries is only generated once.
+    """
+    details = {}
+    results = {}
+    for query in queries:
+        if query in results:
+            continue
+        results[query] = []
+        for instance in lookup(query):
+            key = (instance["environment"], instance["name"])
+            results[query].append(details.setdefault(key, instance))
+    return results
+
+
+def flatten_query_results(results):
+    """Return the instances of batch query results without duplicates, in query order."""
+    seen = set()
     instances = []
-    
-    for env_name, env_data in state.items():
-        if "vms" in env_data:
-            for vm_name, vm_data in env_data["vms"].items():
-                instances.append(_generate_instance_details(env_name, vm_name, vm_data))
-    
+    for matches in results.values():
+        for instance in matches:
+            key = (instance["environment"], instance["name"])
+            if key not in seen:
+                seen.add(key)
+                instances.append(instance)
     return instances
 
 
-def filter_instances_by_state(instances, desired_states):
-    """Filter instances by their current state."""
-    if not desired_states:
-        return instances
-    
-    return [instance for instance in instances if instance["state"] in desired_states]
+def iter_environment_vms(env_name=None, instance_states=None, filters=None):
+    """Yield the raw VMs of one environment (of all if env_name is None) matching the state and attribute filters."""
+    return filter_vms(get_client().iter_vms(env_name, statuses=instance_states or None), filters)
+
+
+def get_instances_in_environment(env_name, instance_states=None, filters=None, fields=None):
+    """Get all instances in a specific environment."""
+    return list(iter_details(iter_environment_vms(env_name, instance_states, filters), fields))
+
+
+def get_all_instances(instance_states=None, filters=None, fields=None):
+    """Get all instances across all environments."""
+    return get_instances_in_environment(None, instance_states, filters, fields)
+
+
+def run_query(params):
+    """
+    Run the query described by the module parameters.
+
+    Returns a dict with one page of instances, the total number of matches
+    (and, for names and ip_addresses, the per-query results) plus the
+    warnings to emit, so that it can be cached as a whole.
+
+    Name and environment lookups stay lazy until the page is taken: the
+    state and attribute filters run on the raw VMs, and details are only
+    built for the instances on the page, limited to the requested fields.
+    """
+    name = params.get("name")
+    names = params.get("names")
+    ip_address = params.get("ip_address")
+    ip_addresses = params.get("ip_addresses")
+    environment = params.get("environment")
+    instance_states = params.get("instance_states") or []
+    offset = params.get("offset") or 0
+    limit = params.get("limit")
+    filters = params.get("filters")
+    fields = params.get("fields")
+
+    vms = None
+    instances = []
+    results = None
+    warnings = []
+    if name:
+        found = get_client().find_vms(name)
+        if len(found) > 1:
+            env_names = ", ".join(f"'{env_name}'" for env_name, _, _ in found)
+            warnings.append(f"Instance name '{name}' is used in environments {env_names}; all matches are returned")
+        vms = _select(found, instance_states, filters)
+    elif names is not None:
+        results = get_instances_by_queries(
+            names, lambda query: get_instances_by_name(query, instance_states, filters, fields)
+        )
+    elif ip_address:
+        found = _find_vms_by_ip(ip_address)
+        if len(found) > 1:
+            vm_names = ", ".join(f"'{env_name}.{vm_name}'" for env_name, vm_name, _ in found)
+            warnings.append(f"IP address '{ip_address}' is used by instances {vm_names}; all matches are returned")
+        vms = _select(found, instance_states, filters)
+    elif ip_addresses is not None:
+        results = get_instances_by_queries(
+            ip_addresses, lambda query: get_instances_by_ip(query, instance_states, filters, fields)
+        )
+    else:
+        vms = iter_environment_vms(environment, instance_states, filters)
+
+    value = {"warnings": warnings}
+    if results is not None:
+        instances = flatten_query_results(results)
+        value["results"] = results
+        value["not_found"] = [query for query, matches in results.items() if not matches]
+    if vms is not None:
+        page, value["total"] = paginate(vms, offset, limit)
+        value["instances"] = list(iter_details(page, fields))
+    else:
+        value["instances"], value["total"] = paginate(instances, offset, limit)
+    return value
 
 
 def main():
@@ -249,7 +458,9 @@ def main():
     module = AnsibleModule(
         argument_spec=dict(
             name=dict(type="str", required=False),
+            names=dict(type="list", elements="str", required=False),
             ip_address=dict(type="str", required=False),
+            ip_addresses=dict(type="list", elements="str", required=False),
             environment=dict(type="str", required=False),
             instance_states=dict(
                 type="list",
@@ -257,48 +468,68 @@ def main():
                 choices=["running", "stopped", "hibernated", "pending", "terminated"],
                 default=[]
             ),
+            **hyperstack_argument_spec(),
+            cache_ttl=dict(type="int", default=0),
+            limit=dict(type="int"),
+            offset=dict(type="int", default=0),
+            filters=dict(
+                type="dict",
+                options=dict(
+                    size=dict(type="list", elements="str"),
+                    image=dict(type="list", elements="str"),
+                    environment=dict(type="str"),
+                    created_before=dict(type="str"),
+                    created_after=dict(type="str"),
+                ),
+            ),
+            fields=dict(type="list", elements="str", choices=list(FIELDS)),
         ),
         mutually_exclusive=[
-            ["name", "ip_address", "environment"]
+            ["name", "names", "ip_address", "ip_addresses", "environment"]
         ],
         supports_check_mode=True,
     )
 
-    name = module.params["name"]
-    ip_address = module.params["ip_address"]
-    environment = module.params["environment"]
-    instance_states = module.params["instance_states"]
-
-    instances = []
-    query_params = {
-        "name": name,
-        "ip_address": ip_address,
-        "environment": environment,
-        "instance_states": instance_states
-    }
-
+    query_params = dict(
+        (key, module.params.get(key))
+        for key in (
+            "name", "names", "ip_address", "ip_addresses", "environment", "instance_states", "limit", "offset",
+            "filters", "fields",
+        )
+    )
+    if (query_params["limit"] or 0) < 0 or (query_params["offset"] or 0) < 0:
+        module.fail_json(msg="limit and offset must not be negative")
     try:
-        if name:
-            instance = get_instance_by_name(name)
-            if instance:
-                instances = [instance]
-        elif ip_address:
-            instance = get_instance_by_ip(ip_address)
-            if instance:
-                instances = [instance]
-        elif environment:
-            instances = get_instances_in_environment(environment)
-        else:
-            instances = get_all_instances()
-
-        instances = filter_instances_by_state(instances, instance_states)
+        vm_filter(query_params["filters"])
+    except ValueError as e:
+        module.fail_json(msg=f"Invalid filters: {e}")
 
+    try:
+        configure_store(module.params.get("state_backend"))
+        client = configure_client_from_params(module.params)
+
+        cache = ReadCache(module.params.get("cache_ttl") or 0)
+        key = cache_key(client.scope, query_params)
+        value = cache.get(key)
+        cached = value is not None
+        if not cached:
+            value = run_query(query_params)
+            cache.put(key, value)
+
+        for warning in value["warnings"]:
+            module.warn(warning)
+        instances = value["instances"]
         result = {
             "changed": False,
             "instances": instances,
             "count": len(instances),
-            "query": {k: v for k, v in query_params.items() if v is not None}
+            "total": value["total"],
+            "query": {k: v for k, v in query_params.items() if v is not None},
+            "cached": cached,
         }
+        if "results" in value:
+            result["results"] = value["results"]
+            result["not_found"] = value["not_found"]
 
         module.exit_json(**result)
 
@@ -6,11 +6,52 @@ import os
 import sys
 
 import pytest
+from ansible.utils.collection_loader._collection_finder import _AnsibleCollectionFinder
 
 # Add the plugins directory to the path so we can import modules
 plugins_path = os.path.join(os.path.dirname(__file__), "..", "plugins")
 sys.path.insert(0, plugins_path)
 
+# Make the collection importable as ansible_collections.hyperstack.cloud for module_utils, and its doc
+# fragments loadable by FQCN, through Ansible's collection loader
+collections_root = os.path.join(os.path.dirname(__file__), "..", "..", "..", "..")
+sys.path.insert(0, os.path.abspath(collections_root))
+_AnsibleCollectionFinder(paths=[os.path.abspath(collections_root)])._install()
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.api_client import set_client  # noqa: E402
+from ansible_collections.hyperstack.cloud.plugins.module_utils.read_cache import CACHE_DIR_ENV  # noqa: E402
+from ansible_collections.hyperstack.cloud.plugins.module_utils.state_store import (  # noqa: E402
+    JsonStateStore,
+    set_store,
+)
+
+
+@pytest.fixture(autouse=True)
+def state_store(tmp_path, monkeypatch):
+    """Point the shared state store and the read cache at private directories for every test."""
+    monkeypatch.setenv(CACHE_DIR_ENV, str(tmp_path / "hyperstack_info_cache"))
+    store = set_store(JsonStateStore(directory=str(tmp_path / "hyperstack_mock_state")))
+    yield store
+    set_store(None)
+    # Drop a client a test pointed at an API server
+    set_client(None)
+
+
+@pytest.fixture
+def write_state(state_store):
+    """Replace the persisted state with the given environments."""
+
+    def _write(state):
+        seed = JsonStateStore(directory=state_store.directory)
+        for name in seed.environments():
+            seed.delete_environment(name)
+        for name, env in state.items():
+            seed.put_environment(name, env)
+        seed.flush()
+        return state_store
+
+    return _write
+
 
 @pytest.fixture
 def mock_ansible_module():
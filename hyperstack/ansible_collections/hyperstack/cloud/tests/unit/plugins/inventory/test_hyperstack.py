@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+from ansible import constants as C
+from ansible.errors import AnsibleError
+from ansible.inventory.data import InventoryData
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.loader import fragment_loader
+from ansible.utils.plugin_docs import get_docstring
+
+from ansible_collections.hyperstack.cloud.plugins.inventory import hyperstack
+from ansible_collections.hyperstack.cloud.plugins.inventory.hyperstack import InventoryModule
+
+
+@pytest.fixture(scope="module", autouse=True)
+def plugin_options():
+    """Register the plugin's documented options, as the plugin loader does when it finds the plugin."""
+    doc = get_docstring(hyperstack.__file__, fragment_loader)[0]
+    C.config.initialize_plugin_configuration_definitions("inventory", InventoryModule.NAME, doc["options"])
+
+
+@pytest.fixture
+def fleet(write_state):
+    """Two environments sharing one VM name."""
+    return write_state({
+        "production": {
+            "id": "env-prod",
+            "status": "active",
+            "vms": {
+                "web-01": {"status": "running", "size": "small", "image": "ubuntu-22.04", "public_ip": "1.2.3.4"},
+                "db": {"status": "stopped", "size": "large", "image": "postgres-13", "private_ip": "10.0.0.5"},
+            },
+        },
+        "staging": {
+            "id": "env-staging",
+            "status": "active",
+            "vms": {
+                "db": {"status": "running", "size": "large", "image": "postgres-13", "public_ip": "1.2.3.9"},
+            },
+        },
+    })
+
+
+def _parse(tmp_path, config, cache=True):
+    """Parse an inventory configuration file and return the inventory."""
+    path = tmp_path / "hyperstack.yml"
+    path.write_text(config)
+    inventory = InventoryData()
+    plugin = InventoryModule()
+    plugin._load_name = InventoryModule.NAME
+    assert plugin.verify_file(str(path))
+    plugin.parse(inventory, DataLoader(), str(path), cache=cache)
+    # The inventory manager writes the cache back after parsing
+    if plugin.get_option("cache"):
+        plugin.update_cache_if_changed()
+    return inventory
+
+
+class TestHyperstackInventory:
+    """Test cases for the hyperstack inventory plugin."""
+
+    def test_groups_and_hostvars(self, tmp_path, fleet):
+        """Test that hosts are grouped by environment, status, size and image."""
+        inventory = _parse(tmp_path, "plugin: hyperstack.cloud.hyperstack\n")
+
+        assert sorted(inventory.hosts) == ["production.db", "staging.db", "web-01"]
+        groups = inventory.groups
+        assert sorted(h.name for h in groups["env_production"].get_hosts()) == ["production.db", "web-01"]
+        assert sorted(h.name for h in groups["status_running"].get_hosts()) == ["staging.db", "web-01"]
+        assert sorted(h.name for h in groups["size_large"].get_hosts()) == ["production.db", "staging.db"]
+        assert [h.name for h in groups["image_ubuntu_22_04"].get_hosts()] == ["web-01"]
+
+        web = inventory.get_host("web-01").get_vars()
+        assert web["ansible_host"] == "1.2.3.4"
+        assert web["hyperstack_environment"] == "production"
+        assert web["hyperstack_state"] == "running"
+
+    def test_filters_and_constructed_groups(self, tmp_path, fleet):
+        """Test the environment and state filters together with keyed groups."""
+        inventory = _parse(tmp_path, "\n".join([
+            "plugin: hyperstack.cloud.hyperstack",
+            "environments: [production]",
+            "instance_states: [stopped]",
+            "ansible_host: private_ip",
+            "keyed_groups:",
+            "  - key: hyperstack_size",
+            "    prefix: flavor",
+            "",
+        ]))
+
+        assert list(inventory.hosts) == ["db"]
+        assert inventory.get_host("db").get_vars()["ansible_host"] == "10.0.0.5"
+        assert [h.name for h in inventory.groups["flavor_large"].get_hosts()] == ["db"]
+
+    def test_inventory_cache(self, tmp_path, fleet):
+        """Test that a cached inventory is used without reading the backend."""
+        config = "\n".join([
+            "plugin: hyperstack.cloud.hyperstack",
+            "cache: true",
+            "cache_plugin: jsonfile",
+            f"cache_connection: {tmp_path / 'cache'}",
+            "",
+        ])
+        _parse(tmp_path, config, cache=False)
+        fleet.delete_environment("staging")
+        fleet.flush()
+
+        cached = _parse(tmp_path, config)
+        assert "staging.db" in cached.hosts
+        refreshed = _parse(tmp_path, config, cache=False)
+        assert sorted(refreshed.hosts) == ["db", "web-01"]
+
+    def test_backend_errors(self, tmp_path, fleet):
+        """Test that backend failures are reported as AnsibleError."""
+        with pytest.raises(AnsibleError, match="Failed to read Hyperstack instances"):
+            _parse(tmp_path, "plugin: hyperstack.cloud.hyperstack\napi_url: ftp://example.com\n")
+
+    def test_verify_file(self, tmp_path):
+        """Test that only hyperstack.yml configuration files are accepted."""
+        other = tmp_path / "aws_ec2.yml"
+        other.write_text("plugin: amazon.aws.aws_ec2\n")
+
+        assert not InventoryModule().verify_file(str(other))
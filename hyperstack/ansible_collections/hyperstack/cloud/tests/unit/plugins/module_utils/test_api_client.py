@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import time
+from unittest.mock import MagicMock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.api_client import (
+    ApiError,
+    HTTPTransport,
+    HyperstackClient,
+    StoreTransport,
+    configure_client,
+    get_client,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.rate_limit import TokenBucket
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Serves the API from the state store, like the real API would."""
+
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        self.server.clients.add(self.client_address)
+        self.server.api_keys.append(self.headers.get("api_key"))
+        headers = {}
+        if self.server.throttle:
+            # Reject the request like an overloaded API
+            retry_after = self.server.throttle.pop(0)
+            status, payload = 429, {"message": "Too Many Requests"}
+            if retry_after is not None:
+                headers["Retry-After"] = retry_after
+        else:
+            status, payload = self.server.transport.request(
+                self.command, url.path[len("/v1"):], query=dict(parse_qsl(url.query)), body=body
+            )
+            if self.command != "GET":
+                self.server.transport.flush()
+        # Close without announcing it, like a server timing out an idle keep-alive connection
+        drop = self.server.drop_idle
+        data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        if drop:
+            self.close_connection = True
+
+    do_GET = do_PUT = do_PATCH = do_DELETE = do_POST = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(state_store):
+    """A local stand-in for the Hyperstack API backed by the test state store."""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+    httpd.transport = StoreTransport()
+    httpd.clients = set()
+    httpd.api_keys = []
+    httpd.drop_idle = False
+    httpd.throttle = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _http_client(server, **kwargs):
+    return HyperstackClient(HTTPTransport(f"http://127.0.0.1:{server.server_port}/v1", **kwargs))
+
+
+class TestHyperstackClient:
+    """Test cases for the API client and its transports."""
+
+    @pytest.mark.parametrize("transport", ["store", "http"])
+    def test_calls(self, transport, request):
+        """Test that both transports implement the same API."""
+        if transport == "http":
+            client = _http_client(request.getfixturevalue("server"))
+        else:
+            client = HyperstackClient(StoreTransport())
+
+        client.create_environment("staging", {"id": "env-1", "status": "active", "vms": {}})
+        addresses = {"public_ip": "1.2.3.4", "private_ip": "10.0.0.5"}
+        assert client.put_vm("staging", "web 01", dict(status="running", **addresses)) is True
+        assert client.update_vm("staging", "web 01", status="stopped") is True
+        client.update_rules("staging", added=[{"protocol": "tcp", "port": 22}])
+        client.flush()
+
+        stopped = dict(status="stopped", **addresses)
+        assert client.get_vm("staging", "web 01") == stopped
+        assert client.get_vm("staging", "missing") is None
+        assert client.get_environment("missing") is None
+        assert client.get_environment("staging")["rules"] == [{"protocol": "tcp", "port": 22}]
+        assert client.find_vms("web 01") == [("staging", "web 01", stopped)]
+        assert [vm[1] for vm in client.find_vms_by_ip("1.2.3.4")] == ["web 01"]
+        assert client.iter_vms("staging", statuses=["running"]) == []
+        assert client.delete_vm("staging", "web 01") is True
+        assert client.delete_environment("staging") is True
+        # Only the local store's locks are visible
+        assert (client.lock_stats() is None) == (transport == "http")
+
+    def test_keep_alive_connection_is_reused(self, server):
+        """Test that consecutive requests share one connection."""
+        client = _http_client(server)
+
+        for _ in range(10):
+            client.get_environment("production")
+
+        assert client.transport.stats == {"requests": 10, "connections": 1, "reused": 9, "throttled": 0}
+        assert len(server.clients) == 1
+
+    def test_stale_connection_is_retried(self, server):
+        """Test that a request on a connection the server dropped is retried on a new one."""
+        client = _http_client(server)
+        server.drop_idle = True
+        client.get_environment("production")
+        server.drop_idle = False
+
+        assert client.get_environment("production") is not None
+        assert client.transport.stats["connections"] == 2
+
+    def test_throttled_request_is_retried_after_retry_after(self, server):
+        """Test that a 429 pauses the shared bucket for Retry-After and the request is then retried."""
+        bucket = TokenBucket()
+        client = _http_client(server, bucket=bucket)
+        server.throttle = ["0.2", None]
+
+        start = time.monotonic()
+        assert client.get_environment("production") is not None
+
+        assert time.monotonic() - start >= 0.2
+        assert client.transport.stats["throttled"] == 2
+        assert bucket.waits == 2
+
+    def test_throttling_gives_up_after_max_retries(self, server):
+        """Test that the 429 is returned as an error once the retries are used up."""
+        client = _http_client(server, max_retries=1)
+        server.throttle = ["0", "0", "0"]
+
+        with pytest.raises(ApiError) as error:
+            client.get_environment("production")
+
+        assert error.value.status == 429
+        assert server.throttle == ["0"]
+
+    def test_pool_size_limits_idle_connections(self, server):
+        """Test that connections beyond the pool size are closed when released."""
+        transport = HTTPTransport(f"http://127.0.0.1:{server.server_port}/v1", pool_size=1)
+        first, _ = transport._acquire()
+        second, _ = transport._acquire()
+        transport._release(first)
+        transport._release(second)
+
+        assert transport._idle.qsize() == 1
+
+    def test_errors(self, server):
+        """Test that error responses and unreachable servers raise ApiError."""
+        client = _http_client(server, headers={"api_key": "secret"})
+        with pytest.raises(ApiError) as error:
+            client._call("POST", "/unknown")
+        assert error.value.status == 404
+        assert server.api_keys == ["secret"]
+
+        unreachable = HyperstackClient(HTTPTransport("http://127.0.0.1:9/v1", timeout=1))
+        with pytest.raises(ApiError) as error:
+            unreachable.get_environment("production")
+        assert error.value.status is None
+
+    @pytest.mark.parametrize("status", [404, 405])
+    def test_mark_converged_is_best_effort(self, status):
+        """Test that a server without the converged route only disables the fast path."""
+        transport = MagicMock()
+        transport.request.return_value = (status, {"message": "Not Found"})
+        client = HyperstackClient(transport)
+
+        assert client.mark_converged("staging", "abc") is False
+
+        transport.request.return_value = (500, {"message": "Internal Server Error"})
+        with pytest.raises(ApiError):
+            client.mark_converged("staging", "abc")
+
+    def test_configure_client(self):
+        """Test that the shared client is only replaced when its settings change."""
+        assert isinstance(get_client().transport, StoreTransport)
+        client = configure_client("https://api.example.com/v1", api_key="secret")
+        assert configure_client("https://api.example.com/v1", api_key="secret") is client
+        assert client.transport.headers == {"api_key": "secret"}
+        assert configure_client("https://api.example.com/v1", api_key="secret", rate_limit=5) is not client
+        assert get_client().transport.bucket.rate == 5
+        assert isinstance(configure_client(None).transport, StoreTransport)
+        with pytest.raises(ValueError):
+            configure_client("ftp://api.example.com")
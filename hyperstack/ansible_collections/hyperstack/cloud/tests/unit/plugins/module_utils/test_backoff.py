@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.backoff import Backoff
+
+
+class TestBackoff:
+    """Test cases for exponential backoff with jitter."""
+
+    def test_delays_grow_to_the_maximum(self):
+        """Test that each delay stays within the jittered interval, which doubles up to the maximum."""
+        backoff = Backoff(initial_interval=1.0, max_interval=8.0, multiplier=2.0)
+
+        for interval in [1.0, 2.0, 4.0, 8.0, 8.0, 8.0]:
+            assert interval / 2 <= backoff.next_delay() <= interval
+
+    def test_fixed_interval(self):
+        """Test that a multiplier of 1 polls at a steady interval."""
+        backoff = Backoff(initial_interval=2.0, max_interval=2.0, multiplier=1.0)
+
+        assert all(1.0 <= backoff.next_delay() <= 2.0 for _ in range(10))
+
+    def test_jitter_spreads_delays(self):
+        """Test that concurrent waiters do not all sleep for the same time."""
+        delays = set(Backoff(initial_interval=1.0).next_delay() for _ in range(20))
+
+        assert len(delays) > 1
+
+    def test_polls_and_reset(self):
+        """Test that polls are counted and reset() starts over."""
+        backoff = Backoff(initial_interval=1.0)
+        backoff.poll()
+        backoff.poll()
+        backoff.next_delay()
+
+        assert backoff.polls == 2
+        backoff.reset()
+        assert backoff.polls == 0
+        assert backoff.interval == 1.0
+
+    @pytest.mark.parametrize("kwargs", [
+        {"initial_interval": 0},
+        {"initial_interval": 2.0, "max_interval": 1.0},
+        {"multiplier": 0.5},
+    ])
+    def test_invalid_settings(self, kwargs):
+        """Test that settings that would never poll or shrink the interval are rejected."""
+        with pytest.raises(ValueError):
+            Backoff(**kwargs)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils import change_watch
+from ansible_collections.hyperstack.cloud.plugins.module_utils.change_watch import ChangeWatcher
+from ansible_collections.hyperstack.cloud.plugins.module_utils.state_store import JsonStateStore
+
+needs_inotify = pytest.mark.skipif(not change_watch.HAS_INOTIFY, reason="inotify is not available")
+
+
+def _write_later(path, delay=0.05):
+    """Write path from another thread after a short delay."""
+    def write():
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write("{}")
+        os.replace(tmp, path)
+
+    timer = threading.Timer(delay, write)
+    timer.start()
+    return timer
+
+
+class TestChangeWatcher:
+    """Test cases for waiting on state changes."""
+
+    @needs_inotify
+    def test_wakes_on_matching_change(self, tmp_path):
+        """Test that a matching file written by someone else ends the wait early."""
+        with ChangeWatcher(str(tmp_path), lambda name: name.endswith(".json")) as watcher:
+            assert watcher.notifying
+            timer = _write_later(str(tmp_path / "env.json"))
+            assert watcher.wait(5) is True
+            timer.join()
+
+    @needs_inotify
+    def test_ignores_other_files(self, tmp_path):
+        """Test that changes to files that do not match are ignored."""
+        (tmp_path / "env.lock").write_text("")
+
+        with ChangeWatcher(str(tmp_path), lambda name: name.endswith(".json")) as watcher:
+            assert watcher.wait(0.05) is False
+
+    @needs_inotify
+    def test_changes_before_wait_are_kept(self, tmp_path):
+        """Test that a change made between creating the watcher and waiting is not lost."""
+        with ChangeWatcher(str(tmp_path)) as watcher:
+            (tmp_path / "env.json").write_text("{}")
+            assert watcher.wait(5) is True
+
+    @patch('time.sleep')
+    def test_falls_back_to_sleeping(self, mock_sleep, tmp_path):
+        """Test that the watcher sleeps for the timeout without inotify."""
+        with patch.object(change_watch, 'HAS_INOTIFY', False):
+            watcher = ChangeWatcher(str(tmp_path))
+
+        assert not watcher.notifying
+        assert watcher.wait(2.5) is False
+        mock_sleep.assert_called_once_with(2.5)
+
+    def test_missing_directory(self, tmp_path):
+        """Test that a directory that does not exist yet falls back to sleeping."""
+        assert not ChangeWatcher(str(tmp_path / "missing")).notifying
+
+    @needs_inotify
+    def test_store_watch(self, state_store):
+        """Test that the store watcher wakes when another store persists an environment."""
+        state_store.put_environment("prod", {"status": "active", "vms": {}})
+        state_store.flush()
+        other = JsonStateStore(directory=state_store.directory)
+
+        with state_store.watch() as watcher:
+            other.set_rules("prod", [{"protocol": "tcp", "port": 22}])
+            other.flush()
+            assert watcher.wait(5) is True
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.file_lock import (
+    FileLock,
+    LockTimeout,
+)
+
+
+class TestFileLock:
+    """Test cases for the shared/exclusive file lock."""
+
+    @pytest.fixture
+    def lock_path(self, tmp_path):
+        """Path of the lock file used by the test."""
+        return str(tmp_path / "state.lock")
+
+    def test_readers_share_the_lock(self, lock_path):
+        """Test that shared locks do not block each other."""
+        first = FileLock(lock_path, timeout=0.05)
+        second = FileLock(lock_path, timeout=0.05)
+
+        with first.shared():
+            with second.shared():
+                pass
+
+        assert second.stats.contended == 0
+
+    def test_writer_waits_for_reader(self, lock_path):
+        """Test that an exclusive lock times out while a reader holds the lock."""
+        reader = FileLock(lock_path)
+        writer = FileLock(lock_path, timeout=0.05)
+
+        with reader.shared():
+            with pytest.raises(LockTimeout):
+                with writer.exclusive():
+                    pass
+
+        assert writer.stats.timeouts == 1
+        with writer.exclusive():
+            pass
+        assert writer.stats.acquired == 1
+
+    def test_reader_waits_for_writer(self, lock_path):
+        """Test that a shared lock times out while a writer holds the lock."""
+        writer = FileLock(lock_path)
+        reader = FileLock(lock_path, timeout=0.05)
+
+        with writer.exclusive():
+            with pytest.raises(LockTimeout):
+                with reader.shared():
+                    pass
+
+    def test_stats(self, lock_path):
+        """Test the contention counters."""
+        lock = FileLock(lock_path)
+        with lock.exclusive():
+            pass
+        with lock.shared():
+            pass
+
+        stats = lock.stats.as_dict()
+        assert stats["acquired"] == 2
+        assert stats["contended"] == 0
+        assert stats["timeouts"] == 0
+        assert stats["max_wait"] >= 0
+
+    def test_unwritable_directory(self, tmp_path):
+        """Test that a lock in a missing directory does not block readers."""
+        lock = FileLock(str(tmp_path / "missing" / "state.lock"))
+        with lock.shared():
+            pass
+        assert lock.stats.acquired == 0
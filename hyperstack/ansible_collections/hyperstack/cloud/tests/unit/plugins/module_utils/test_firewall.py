@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.firewall import (
+    apply_rule_delta,
+    diff_rules,
+    format_rule,
+    merge_rules,
+    parse_port_range,
+)
+
+
+class TestFirewallRules:
+    """Test cases for firewall rules stored as port intervals."""
+
+    def test_parse_port_range(self):
+        """Test parsing ranges and single ports."""
+        assert parse_port_range("30000-32767") == (30000, 32767)
+        assert parse_port_range(" 22 ") == (22, 22)
+        assert parse_port_range(443) == (443, 443)
+        for value in ("80-22", "0-10", "1-70000", "http"):
+            with pytest.raises(ValueError):
+                parse_port_range(value)
+
+    def test_merge_coalesces_overlapping_and_adjacent_ports(self):
+        """Test that rules for the same protocol and source collapse into intervals."""
+        rules = [{"protocol": "tcp", "port": port} for port in range(30000, 32768)]
+        rules += [
+            {"protocol": "tcp", "port_range": "32000-33000"},
+            {"protocol": "tcp", "port": 22, "port_range": None, "source_cidr": None},
+            {"protocol": "udp", "port": 22},
+            {"protocol": "tcp", "port": 22, "source_cidr": "10.1.2.3/8"},
+        ]
+
+        assert merge_rules(rules) == [
+            {"protocol": "tcp", "port": 22},
+            {"protocol": "tcp", "port_range": "30000-33000"},
+            {"protocol": "tcp", "port": 22, "source_cidr": "10.0.0.0/8"},
+            {"protocol": "udp", "port": 22},
+        ]
+
+    def test_invalid_rules(self):
+        """Test that incomplete or conflicting rules are rejected."""
+        for rule in ({"protocol": "tcp"}, {"protocol": "tcp", "port": 1, "port_range": "1-2"},
+                     {"protocol": "tcp", "port": 1, "source_cidr": "10.0.0.300/8"}):
+            with pytest.raises(ValueError):
+                merge_rules([rule])
+
+    def test_diff_is_computed_on_intervals(self):
+        """Test that narrowing a range only removes the ports that are no longer open."""
+        current = [{"protocol": "tcp", "port_range": "30000-32767"}, {"protocol": "tcp", "port": 80}]
+        desired = [{"protocol": "tcp", "port_range": "30000-32000"}, {"protocol": "tcp", "port": 80},
+                   {"protocol": "tcp", "port": 443, "source_cidr": "192.168.0.0/16"}]
+
+        added, removed = diff_rules(current, desired)
+
+        assert added == [{"protocol": "tcp", "port": 443, "source_cidr": "192.168.0.0/16"}]
+        assert removed == [{"protocol": "tcp", "port_range": "32001-32767"}]
+        assert diff_rules([{"protocol": "tcp", "port": p} for p in (81, 80)],
+                          [{"protocol": "tcp", "port_range": "80-81"}]) == ([], [])
+
+    def test_apply_rule_delta_splits_ranges(self):
+        """Test that closing ports inside a range splits it."""
+        rules = [{"protocol": "tcp", "port_range": "1000-2000"}]
+
+        result = apply_rule_delta(rules, added=[{"protocol": "tcp", "port": 2001}],
+                                  removed=[{"protocol": "tcp", "port_range": "1200-1299"}])
+
+        assert result == [
+            {"protocol": "tcp", "port_range": "1000-1199"},
+            {"protocol": "tcp", "port_range": "1300-2001"},
+        ]
+
+    def test_format_rule(self):
+        """Test the display form of rules."""
+        assert format_rule({"protocol": "udp", "port": 53}) == "udp:53"
+        assert format_rule({"protocol": "tcp", "port_range": "1-2", "source_cidr": "10.0.0.0/8"}) == \
+            "tcp:1-2 from 10.0.0.0/8"
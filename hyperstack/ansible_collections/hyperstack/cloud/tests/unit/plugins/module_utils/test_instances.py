@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from unittest.mock import Mock, patch
+
+import pytest
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils import instances
+from ansible_collections.hyperstack.cloud.plugins.module_utils.instances import (
+    FIELDS,
+    filter_vms,
+    filter_vms_by_status,
+    instance_details,
+    iter_details,
+    iter_records,
+    paginate,
+    vm_filter,
+)
+
+
+class TestInstancePipeline:
+    """Test cases for the lazy instance lookup pipeline."""
+
+    def test_paginate(self):
+        """Test pages, offsets past the end and the total count."""
+        assert paginate(range(10), 0, 3) == ([0, 1, 2], 10)
+        assert paginate(range(10), 8, 3) == ([8, 9], 10)
+        assert paginate(range(10), 12, 3) == ([], 10)
+        assert paginate(range(10), 4) == ([4, 5, 6, 7, 8, 9], 10)
+        assert paginate(iter([]), 0, 5) == ([], 0)
+
+    def test_details_are_built_for_the_page_only(self):
+        """Test that filtering and paging run before any details are built."""
+        built = []
+
+        def vms():
+            for i in range(1000):
+                yield "production", f"vm-{i}", {"status": "hibernated" if i % 100 == 0 else "running"}
+
+        def details(vms):
+            for vm in iter_details(vms):
+                built.append(vm["name"])
+                yield vm
+
+        page, total = paginate(filter_vms_by_status(vms(), ["hibernated"]), 1, 2)
+
+        assert total == 10
+        assert [vm["name"] for vm in details(page)] == ["vm-100", "vm-200"]
+        assert built == ["vm-100", "vm-200"]
+
+    def test_records_share_the_run_timestamp(self):
+        """Test that last_seen is formatted once per run and records carry no per-instance dict."""
+        vms = [("production", f"vm-{i}", {"status": "running"}) for i in range(3)]
+        instances.run_timestamp(refresh=True)
+
+        with patch.object(instances, "datetime") as clock:
+            records = list(iter_records(vms))
+            details = [record.as_dict() for record in records]
+
+        clock.utcnow.assert_not_called()
+        assert len(set(detail["last_seen"] for detail in details)) == 1
+        assert not hasattr(records[0], "__dict__")
+        assert list(details[0]) == list(FIELDS)
+        record = next(iter_records(vms, ("name", "state")))
+        assert record.as_dict() == {"name": "vm-0", "state": "running"}
+        assert not hasattr(record, "last_seen")
+
+    def test_filter_by_states(self):
+        """Test that VMs are kept if their status is one of the states, and all of them without states."""
+        vms = [
+            ("production", "a", {"status": "running"}),
+            ("production", "b", {}),
+            ("staging", "c", {"status": "stopped"}),
+            ("staging", "d", {"status": "hibernated"}),
+        ]
+
+        assert list(filter_vms_by_status(vms, [])) == vms
+        assert list(filter_vms_by_status(vms, ["running"])) == vms[:1]
+        assert list(filter_vms_by_status(vms, ["stopped", "hibernated"])) == vms[2:]
+        assert list(filter_vms_by_status(vms, ["unknown"])) == [vms[1]]
+
+
+class TestFiltersAndFields:
+    """Test cases for attribute filters and field projection."""
+
+    VMS = [
+        ("prod-eu", "web", {"size": "small", "image": "ubuntu-22.04", "created_at": "2024-03-01T00:00:00Z"}),
+        ("prod-us", "db", {"size": "large", "image": "postgres-13", "created_at": "2024-07-01T12:00:00+02:00"}),
+        ("staging", "db", {"size": "large", "image": "postgres-13"}),
+    ]
+
+    def _names(self, filters):
+        return [(env, name) for env, name, _ in filter_vms(self.VMS, filters)]
+
+    def test_filters(self):
+        """Test each filter and their combination."""
+        assert self._names({"size": ["large"]}) == [("prod-us", "db"), ("staging", "db")]
+        assert self._names({"image": ["ubuntu-22.04", "debian-12"]}) == [("prod-eu", "web")]
+        assert self._names({"environment": "prod-*"}) == [("prod-eu", "web"), ("prod-us", "db")]
+        assert self._names({"created_after": "2024-02-01"}) == [("prod-eu", "web"), ("prod-us", "db")]
+        assert self._names({"created_before": "2024-02-01T00:00:00Z"}) == [("staging", "db")]
+        assert self._names({"environment": "prod-*", "size": ["large"]}) == [("prod-us", "db")]
+        assert self._names({"size": None, "image": []}) == self._names(None)
+
+    def test_invalid_timestamp(self):
+        """Test that an invalid timestamp is rejected."""
+        with pytest.raises(ValueError):
+            vm_filter({"created_before": "last tuesday"})
+
+    def test_projection(self):
+        """Test that only the requested fields, plus the key fields, are computed."""
+        getters = [(name, Mock(wraps=getter)) for name, getter in instances._FIELDS]
+        with patch.object(instances, "_FIELDS", tuple(getters)):
+            details = list(iter_details(self.VMS[:1], ["size"]))
+
+        assert details == [{"name": "web", "size": "small", "environment": "prod-eu"}]
+        assert [name for name, getter in getters if getter.called] == ["name", "size", "environment"]
+        assert set(instance_details("prod-eu", "web", self.VMS[0][2])) == set(FIELDS)
+
+    def test_unknown_field(self):
+        """Test that unknown fields are rejected."""
+        with pytest.raises(ValueError, match="unknown fields: colour"):
+            list(iter_details(self.VMS, ["colour"]))
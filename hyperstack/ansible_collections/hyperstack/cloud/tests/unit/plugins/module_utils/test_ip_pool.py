@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import ipaddress
+import json
+
+import pytest
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.ip_pool import (
+    IpPoolExhausted,
+    SubnetRegistry,
+    assign_addresses,
+    backfill_addresses,
+    candidate_subnets,
+    release_addresses,
+    subnet_for,
+    update_addresses,
+)
+from ansible_collections.hyperstack.cloud.plugins.module_utils.sqlite_store import SQLiteStateStore
+from ansible_collections.hyperstack.cloud.plugins.module_utils.state_store import JsonStateStore
+
+# Two environment names whose digests point to the same subnets
+COLLIDING = ("env-13", "env-23")
+
+
+def _create(env, name, **vm_data):
+    """Add a VM to env the way the state store does and return its data."""
+    assign_addresses("staging", env, vm_data, env.setdefault("vms", {}).get(name))
+    env["vms"][name] = vm_data
+    return vm_data
+
+
+class TestIpPool:
+    """Test cases for the per-environment address pools."""
+
+    def test_subnets_are_deterministic(self):
+        """Test that an environment always gets the same subnet inside the network."""
+        network = ipaddress.ip_network("10.0.0.0/8")
+
+        subnet = subnet_for("staging", network, 20)
+
+        assert subnet == subnet_for("staging", network, 20)
+        assert subnet.prefixlen == 20 and subnet.subnet_of(network)
+        assert subnet != subnet_for("production", network, 20)
+
+    def test_addresses_are_assigned_in_order(self):
+        """Test that VMs get consecutive addresses of their environment's subnets."""
+        env = {}
+        first = _create(env, "web-1")
+        second = _create(env, "web-2")
+
+        for key in ("public_ip", "private_ip"):
+            subnet = ipaddress.ip_network(env["ip_pools"][key]["subnet"])
+            assert ipaddress.ip_address(first[key]) == subnet.network_address + 2
+            assert ipaddress.ip_address(second[key]) == subnet.network_address + 3
+
+    def test_existing_vm_keeps_its_addresses(self):
+        """Test that putting a VM again does not give it new addresses."""
+        env = {}
+        first = _create(env, "web-1")
+
+        again = _create(env, "web-1", status="stopped")
+
+        assert (again["public_ip"], again["private_ip"]) == (first["public_ip"], first["private_ip"])
+        assert env["ip_pools"]["private_ip"]["next"] == 3
+
+    def test_released_addresses_are_reused_first(self):
+        """Test that the address of a deleted VM is handed out before new ones."""
+        env = {}
+        _create(env, "web-1")
+        second = _create(env, "web-2")
+        _create(env, "web-3")
+        release_addresses("staging", env, env["vms"].pop("web-2"))
+
+        fourth = _create(env, "web-4")
+
+        assert fourth["private_ip"] == second["private_ip"]
+        assert _create(env, "web-5")["private_ip"] != second["private_ip"]
+
+    def test_caller_addresses_are_reserved(self):
+        """Test that addresses set by the caller are never handed out again."""
+        env = {}
+        subnet = subnet_for("staging", ipaddress.ip_network("10.0.0.0/8"), 20)
+        _create(env, "db", private_ip=str(subnet.network_address + 3), public_ip="203.0.113.10")
+
+        addresses = [_create(env, f"web-{i}")["private_ip"] for i in range(3)]
+
+        assert addresses == [str(subnet.network_address + offset) for offset in (2, 4, 5)]
+        update_addresses("staging", env, env["vms"]["web-0"], {"private_ip": str(subnet.network_address + 9)})
+        assert env["ip_pools"]["private_ip"]["free"] == [2, 6, 7, 8]
+
+    def test_pool_covers_existing_vms(self):
+        """Test that a pool created for an environment with VMs skips their addresses."""
+        subnet = subnet_for("staging", ipaddress.ip_network("10.0.0.0/8"), 20)
+        env = {"vms": {"db": {"private_ip": str(subnet.network_address + 2)}}}
+
+        assert _create(env, "web")["private_ip"] == str(subnet.network_address + 3)
+
+    def test_exhausted_pool_raises(self):
+        """Test that a full subnet raises IpPoolExhausted."""
+        env = {}
+        _create(env, "web")
+        pool = env["ip_pools"]["public_ip"]
+        pool["next"] = ipaddress.ip_network(pool["subnet"]).num_addresses - 1
+
+        with pytest.raises(IpPoolExhausted, match="No free public ip left"):
+            _create(env, "db")
+
+    def test_concurrent_stores_never_share_addresses(self, tmp_path):
+        """Test that VMs created by two tasks at the same time get different addresses."""
+        directory = str(tmp_path / "state")
+        setup = JsonStateStore(directory=directory)
+        setup.put_environment("staging", {"id": "env-1", "status": "active", "vms": {}})
+        setup.flush()
+
+        first = JsonStateStore(directory=directory)
+        second = JsonStateStore(directory=directory)
+        first.put_vm("staging", "web-1", {"status": "running"})
+        second.put_vm("staging", "web-2", {"status": "running"})
+        first.flush()
+        second.flush()
+
+        vms = JsonStateStore(directory=directory).get_environment("staging")["vms"]
+        assert vms["web-1"]["private_ip"] != vms["web-2"]["private_ip"]
+        assert vms["web-1"]["public_ip"] != vms["web-2"]["public_ip"]
+        assert second.get_vm("staging", "web-2") == vms["web-2"]
+
+    def test_registry_skips_claimed_subnets(self):
+        """Test that an environment whose first subnet is taken gets the next free one, and keeps it."""
+        network = ipaddress.ip_network("10.0.0.0/8")
+        registry = SubnetRegistry()
+        first = registry.claim_subnet(COLLIDING[0], "private_ip", candidate_subnets(COLLIDING[0], network, 20))
+        second = registry.claim_subnet(COLLIDING[1], "private_ip", candidate_subnets(COLLIDING[1], network, 20))
+
+        assert subnet_for(COLLIDING[0], network, 20) == subnet_for(COLLIDING[1], network, 20)
+        assert first != second
+        assert ipaddress.ip_network(second).network_address == ipaddress.ip_network(first).broadcast_address + 1
+        assert registry.claim_subnet(COLLIDING[1], "private_ip", []) == second
+
+        registry.release_subnets(COLLIDING[0])
+        assert registry.claims == {"private_ip": {second: COLLIDING[1]}}
+
+    def test_exhausted_registry_raises(self):
+        """Test that running out of subnets raises IpPoolExhausted."""
+        registry = SubnetRegistry({"public_ip": {"100.64.0.0/22": "other"}})
+
+        with pytest.raises(IpPoolExhausted, match="No free public ip subnet left"):
+            registry.claim_subnet("staging", "public_ip", [ipaddress.ip_network("100.64.0.0/22")])
+
+    def test_backfill(self):
+        """Test that VMs without addresses get them in the order of their names."""
+        subnet = subnet_for("staging", ipaddress.ip_network("10.0.0.0/8"), 20)
+        env = {"vms": {
+            "web": {"status": "running"},
+            "db": {"status": "running", "private_ip": str(subnet.network_address + 2), "public_ip": "203.0.113.1"},
+            "app": {"status": "stopped"},
+        }}
+
+        backfill_addresses("staging", env)
+
+        assert [env["vms"][name]["private_ip"] for name in ("app", "web")] == [
+            str(subnet.network_address + 3), str(subnet.network_address + 4),
+        ]
+        assert env["vms"]["db"]["public_ip"] == "203.0.113.1"
+        assert all(vm["public_ip"] for vm in env["vms"].values())
+
+    @pytest.mark.parametrize("backend", ["json", "sqlite"])
+    def test_colliding_environments_get_different_subnets(self, backend, tmp_path):
+        """Test that environments whose names point to the same subnets never share addresses."""
+        if backend == "json":
+            store = JsonStateStore(directory=str(tmp_path / "state"))
+        else:
+            store = SQLiteStateStore(path=str(tmp_path / "state.db"))
+        for env_name in COLLIDING:
+            store.put_environment(env_name, {"id": env_name, "status": "active", "vms": {}})
+            store.put_vm(env_name, "web", {"status": "running"})
+        store.flush()
+
+        web = [store.get_vm(env_name, "web") for env_name in COLLIDING]
+        assert web[0]["public_ip"] != web[1]["public_ip"]
+        assert web[0]["private_ip"] != web[1]["private_ip"]
+        assert [vm[0] for vm in store.find_vms_by_ip(web[1]["public_ip"])] == [COLLIDING[1]]
+
+        # The subnets of a deleted environment are free again when it is created anew
+        store.delete_environment(COLLIDING[0])
+        store.flush()
+        store.put_environment(COLLIDING[0], {"id": COLLIDING[0], "status": "active", "vms": {}})
+        store.put_vm(COLLIDING[0], "db", {"status": "running"})
+        store.flush()
+        assert store.get_vm(COLLIDING[0], "db") == dict(web[0], status="running")
+
+    def test_existing_vms_are_backfilled_on_flush(self, tmp_path):
+        """Test that VMs stored without addresses get them with the next change to their environment."""
+        directory = str(tmp_path / "state")
+        with open(directory + ".json", "w") as f:
+            json.dump({"staging": {"id": "env-1", "status": "active", "vms": {"old": {"status": "running"}}}}, f)
+        store = JsonStateStore(directory=directory)
+        assert store.get_vm("staging", "old") == {"status": "running"}
+
+        store.update_vm("staging", "old", status="stopped")
+        store.flush()
+
+        old = JsonStateStore(directory=directory).get_vm("staging", "old")
+        assert old["status"] == "stopped"
+        assert old["public_ip"] and old["private_ip"]
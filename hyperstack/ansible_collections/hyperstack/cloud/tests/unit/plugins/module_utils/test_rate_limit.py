@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.rate_limit import (
+    MAX_RETRY_AFTER,
+    TokenBucket,
+    bucket_path,
+    parse_retry_after,
+)
+
+
+class TestTokenBucket:
+    """Test cases for the shared token bucket."""
+
+    def test_burst_then_paced(self):
+        """Test that a full bucket allows a burst and then paces requests at the rate."""
+        bucket = TokenBucket(rate=20, burst=2)
+
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        elapsed = time.monotonic() - start
+
+        # Two tokens are available at once, the other two refill at 20 per second
+        assert 0.09 <= elapsed < 0.5
+        assert bucket.waits == 2
+
+    def test_unlimited_bucket_never_waits(self):
+        """Test that a bucket without a rate does not delay requests."""
+        bucket = TokenBucket()
+
+        for _ in range(100):
+            assert bucket.acquire() == 0
+
+    def test_bucket_file_is_shared(self, tmp_path):
+        """Test that buckets on the same file draw from one budget, like forks do."""
+        path = str(tmp_path / "api.bucket")
+        first = TokenBucket(rate=10, burst=1, path=path)
+        second = TokenBucket(rate=10, burst=1, path=path)
+
+        assert first.acquire() == 0
+        assert second.acquire() > 0.05
+
+    def test_pause_holds_off_every_user(self, tmp_path):
+        """Test that a pause recorded by one bucket delays the others sharing its file."""
+        path = str(tmp_path / "api.bucket")
+        TokenBucket(path=path).pause(0.1)
+
+        # The second bucket waits out what is left of the pause
+        assert TokenBucket(path=path).acquire() > 0.05
+
+    def test_unlimited_bucket_skips_the_file(self, tmp_path):
+        """Test that a bucket without a rate only reads the file again after it changed."""
+        path = str(tmp_path / "api.bucket")
+        bucket = TokenBucket(path=path)
+        for _ in range(10):
+            bucket.acquire()
+        assert not os.path.exists(path) and not os.path.exists(path + ".lock")
+
+        TokenBucket(path=path).pause(0)
+        with patch("builtins.open", wraps=open) as opened:
+            for _ in range(10):
+                assert bucket.acquire() == 0
+        assert opened.call_count == 1
+
+    def test_torn_bucket_file_starts_full(self, tmp_path):
+        """Test that an unreadable bucket file is replaced by a full bucket."""
+        path = tmp_path / "api.bucket"
+        path.write_text("{")
+
+        assert TokenBucket(rate=1, burst=3, path=str(path)).acquire() == 0
+
+    def test_invalid_settings(self):
+        """Test that a non-positive rate or burst is rejected."""
+        with pytest.raises(ValueError):
+            TokenBucket(rate=0)
+        with pytest.raises(ValueError):
+            TokenBucket(rate=1, burst=0)
+
+    def test_bucket_path_per_api(self):
+        """Test that each API URL gets its own bucket."""
+        assert bucket_path("https://a.example.com") != bucket_path("https://b.example.com")
+        assert bucket_path("https://a.example.com") == bucket_path("https://a.example.com")
+
+
+class TestParseRetryAfter:
+    """Test cases for Retry-After parsing."""
+
+    @pytest.mark.parametrize(
+        "value,expected",
+        [
+            ("3", 3.0),
+            ("0.5", 0.5),
+            ("-4", 0.0),
+            ("86400", MAX_RETRY_AFTER),
+            ("Wed, 21 Oct 2015 07:28:10 GMT", 10.0),
+            ("soon", None),
+            ("nan", None),
+            (None, None),
+        ],
+    )
+    def test_values(self, value, expected):
+        """Test delay seconds, HTTP dates and invalid values."""
+        # 2015-10-21 07:28:00 UTC
+        assert parse_retry_after(value, now=1445412480.0) == expected
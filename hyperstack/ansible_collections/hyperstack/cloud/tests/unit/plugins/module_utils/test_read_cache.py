@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils import read_cache
+from ansible_collections.hyperstack.cloud.plugins.module_utils.read_cache import (
+    ReadCache,
+    cache_key,
+    invalidate,
+)
+
+
+class TestReadCache:
+    """Test cases for the on-disk query cache."""
+
+    def test_put_then_get(self, tmp_path):
+        """Test that a stored value is returned for the same key."""
+        cache = ReadCache(60, directory=str(tmp_path))
+        key = cache_key("scope", {"name": "web-01"})
+
+        assert cache.get(key) is None
+        cache.put(key, {"instances": [1, 2]})
+
+        assert ReadCache(60, directory=str(tmp_path)).get(key) == {"instances": [1, 2]}
+
+    def test_keys_differ_by_query(self):
+        """Test that keys depend on every query part but not on dictionary order."""
+        assert cache_key("a", {"x": 1, "y": 2}) == cache_key("a", {"y": 2, "x": 1})
+        assert cache_key("a", {"x": 1}) != cache_key("b", {"x": 1})
+        assert cache_key("a", {"x": 1}) != cache_key("a", {"x": 2})
+
+    def test_entries_expire(self, tmp_path, monkeypatch):
+        """Test that an entry is not served after its TTL and is removed."""
+        cache = ReadCache(60, directory=str(tmp_path))
+        cache.get("key")
+        cache.put("key", "value")
+        now = time.time()
+
+        monkeypatch.setattr(read_cache.time, "time", lambda: now + 30)
+        assert cache.get("key") == "value"
+        monkeypatch.setattr(read_cache.time, "time", lambda: now + 61)
+        assert cache.get("key") is None
+        assert not os.path.exists(os.path.join(str(tmp_path), "key.json"))
+
+    def test_invalidate_makes_entries_stale(self, tmp_path):
+        """Test that entries stored before an invalidation are ignored."""
+        cache = ReadCache(60, directory=str(tmp_path))
+        cache.get("key")
+        cache.put("key", "value")
+
+        invalidate(str(tmp_path))
+
+        assert cache.get("key") is None
+
+    def test_write_during_query_is_not_hidden(self, tmp_path):
+        """Test that a result computed while a write landed is stored as stale."""
+        cache = ReadCache(60, directory=str(tmp_path))
+        assert cache.get("key") is None
+        # A write invalidates the cache between the lookup and the put
+        invalidate(str(tmp_path))
+        cache.put("key", "old value")
+
+        assert cache.get("key") is None
+
+    def test_disabled_cache(self, tmp_path):
+        """Test that a TTL of 0 never stores anything."""
+        cache = ReadCache(0, directory=str(tmp_path))
+        cache.put("key", "value")
+
+        assert cache.get("key") is None
+        assert os.listdir(str(tmp_path)) == []
+
+    def test_unwritable_directory(self, tmp_path):
+        """Test that a cache directory that cannot be created only disables storing."""
+        blocker = tmp_path / "file"
+        blocker.write_text("")
+        cache = ReadCache(60, directory=str(blocker / "cache"))
+
+        cache.put("key", "value")
+
+        assert cache.get("key") is None
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import ipaddress
+import multiprocessing
+import sqlite3
+
+import pytest
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.sqlite_store import SQLiteStateStore
+from ansible_collections.hyperstack.cloud.plugins.module_utils.state_store import (
+    JsonStateStore,
+    StateStoreError,
+    content_hash,
+)
+
+
+def _env(env_id, **extra):
+    """Build environment data for tests."""
+    data = {"id": env_id, "status": "active"}
+    data.update(extra)
+    return data
+
+
+def _flushed(env):
+    """Return environment data the way it reads back after a flush."""
+    env["content_hash"] = content_hash(env)
+    return env
+
+
+class TestSQLiteStateStore:
+    """Test cases for the SQLite state backend."""
+
+    @pytest.fixture(autouse=True)
+    def json_dir(self, tmp_path, monkeypatch):
+        """Seed new databases from a private json state directory."""
+        directory = str(tmp_path / "json-state")
+        monkeypatch.setenv("HYPERSTACK_STATE_DIR", directory)
+        return directory
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        store = SQLiteStateStore(path=str(tmp_path / "state.db"))
+        yield store
+        store.close()
+
+    def test_default_state(self, store):
+        """Test that a new database starts from the default state."""
+        assert store.environments() == {"production": {"id": "env-123", "status": "active"}}
+
+    def test_seeded_from_json_state(self, store, json_dir):
+        """Test that a new database is seeded from the existing json state."""
+        existing = JsonStateStore(directory=json_dir)
+        existing.put_environment("staging", _env("env-1", vms={"web": {"status": "running"}}))
+        existing.flush()
+
+        assert store.get_vm("staging", "web") == existing.get_vm("staging", "web")
+        assert store.get_vm("staging", "web")["status"] == "running"
+
+    def test_schema_upgrade_keeps_data(self, store, json_dir):
+        """Test that a database of an older schema gets the new tables without being seeded again."""
+        store.put_environment("staging", _env("env-1", vms={}))
+        store.flush()
+        store.connection.execute("DROP TABLE subnets")
+        store.connection.execute("PRAGMA user_version = 1")
+        store.close()
+        other = JsonStateStore(directory=json_dir)
+        other.put_environment("json-only", _env("env-9"))
+        other.flush()
+
+        fresh = SQLiteStateStore(path=store.path)
+        fresh.put_vm("staging", "web", {"status": "running"})
+        fresh.flush()
+
+        assert sorted(fresh.environments()) == ["production", "staging"]
+        assert fresh.connection.execute("SELECT COUNT(*) FROM subnets").fetchone()[0] == 2
+
+    def test_wal_mode(self, store):
+        """Test that the database uses write-ahead logging."""
+        assert store.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_indexes(self, store):
+        """Test that VM lookups are backed by indexes."""
+        indexes = set(row[1] for row in store.connection.execute("PRAGMA index_list(vms)"))
+        assert {"vms_name", "vms_public_ip", "vms_private_ip", "vms_status"} <= indexes
+
+        plan = store.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT DISTINCT environment FROM vms WHERE name = ?", ("web",)
+        ).fetchall()
+        assert "vms_name" in str(plan)
+
+    def test_round_trip(self, store):
+        """Test that flushed changes read back unchanged from a fresh store."""
+        store.put_environment("staging", _env("env-1", vms={}))
+        store.put_vm("staging", "web", {"status": "running", "public_ip": "1.1.1.1"})
+        store.set_rules("staging", [{"protocol": "tcp", "port": 22}])
+        store.put_environment("empty", _env("env-2", vms={}))
+        store.flush()
+
+        fresh = SQLiteStateStore(path=store.path)
+        staging = fresh.get_environment("staging")
+        assert staging == store.get_environment("staging")
+        assert staging["rules"] == [{"protocol": "tcp", "port": 22}]
+        # The VM was given a private address from the environment's pool
+        private_ip = staging["vms"]["web"].pop("private_ip")
+        assert ipaddress.ip_address(private_ip) in ipaddress.ip_network(staging["ip_pools"]["private_ip"]["subnet"])
+        assert staging["vms"] == {"web": {"status": "running", "public_ip": "1.1.1.1"}}
+        assert fresh.get_environment("empty") == _flushed(_env("env-2", vms={}))
+        assert sorted(fresh.environments()) == ["empty", "production", "staging"]
+
+    def test_delete(self, store):
+        """Test that deleted VMs and environments are removed from the database."""
+        store.put_environment("staging", _env("env-1", vms={"web": {"status": "running"}, "db": {"status": "running"}}))
+        store.flush()
+        store.delete_vm("staging", "web")
+        store.delete_environment("production")
+        store.flush()
+
+        fresh = SQLiteStateStore(path=store.path)
+        assert sorted(fresh.environments()) == ["staging"]
+        assert list(fresh.get_environment("staging")["vms"]) == ["db"]
+
+    def test_lookups_use_the_index(self, store):
+        """Test that name, IP and status lookups only read matching environments."""
+        for i in range(5):
+            store.put_environment(f"env-{i}", _env(f"id-{i}", vms={f"vm-{i}": {
+                "status": "running" if i == 3 else "stopped",
+                "public_ip": f"1.1.1.{i}",
+                "private_ip": f"10.0.0.{i}",
+            }}))
+        store.flush()
+
+        fresh = SQLiteStateStore(path=store.path)
+        assert [env for env, _, _ in fresh.find_vms("vm-2")] == ["env-2"]
+        assert [env for env, _, _ in fresh.find_vms_by_ip("10.0.0.4")] == ["env-4"]
+        assert [vm for _, vm, _ in fresh.iter_vms(statuses=["running"])] == ["vm-3"]
+        assert sorted(fresh._envs) == ["env-2", "env-3", "env-4"]
+
+    def test_lookups_see_pending_changes(self, store):
+        """Test that lookups include changes that were not flushed yet."""
+        store.put_environment("staging", _env("env-1", vms={"web": {"status": "running"}}))
+
+        assert [env for env, _, _ in store.find_vms("web")] == ["staging"]
+
+    def test_concurrent_updates_merge(self, store):
+        """Test that two stores flushing different changes do not lose updates."""
+        store.environments()
+        first = SQLiteStateStore(path=store.path)
+        second = SQLiteStateStore(path=store.path)
+        first.put_environment("staging", _env("env-1"))
+        second.put_environment("qa", _env("env-2"))
+        first.flush()
+        second.flush()
+
+        assert sorted(SQLiteStateStore(path=store.path).environments()) == ["production", "qa", "staging"]
+
+    def test_many_forked_writers(self, store):
+        """Test that concurrent processes adding VMs to one environment are all kept."""
+        store.put_environment("staging", _env("env-1", vms={}))
+        store.flush()
+
+        def add_vm(index):
+            forked = SQLiteStateStore(path=store.path)
+            forked.put_vm("staging", f"vm-{index}", {"status": "running"})
+            forked.flush()
+
+        ctx = multiprocessing.get_context("fork")
+        procs = [ctx.Process(target=add_vm, args=(i,)) for i in range(16)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+
+        assert all(proc.exitcode == 0 for proc in procs)
+        vms = SQLiteStateStore(path=store.path).get_environment("staging")["vms"]
+        assert sorted(vms) == sorted(f"vm-{i}" for i in range(16))
+
+    def test_lock_timeout(self, store):
+        """Test that a held write lock times out as StateStoreError and keeps changes pending."""
+        store.environments()
+        other = sqlite3.connect(store.path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            blocked = SQLiteStateStore(path=store.path, lock_timeout=0.05)
+            blocked.environments()
+            blocked.put_environment("staging", _env("env-1"))
+            with pytest.raises(StateStoreError, match="Timed out"):
+                blocked.flush()
+        finally:
+            other.execute("ROLLBACK")
+            other.close()
+
+        assert blocked.lock_stats()["timeouts"] == 1
+        assert blocked.dirty
+        blocked.flush()
+        assert blocked.lock_stats()["acquired"] == 1
+
+    def test_open_error(self, tmp_path):
+        """Test that an unusable database path surfaces as StateStoreError."""
+        store = SQLiteStateStore(path=str(tmp_path / "missing-dir" / "state.db"))
+
+        with pytest.raises(StateStoreError):
+            store.environments()
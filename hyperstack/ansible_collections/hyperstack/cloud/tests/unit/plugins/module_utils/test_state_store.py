@@ -0,0 +1,544 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import multiprocessing
+import os
+from unittest.mock import patch
+
+import pytest
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils import state_store
+from ansible_collections.hyperstack.cloud.plugins.module_utils.state_store import (
+    JsonDocument,
+    JsonStateStore,
+    StateStoreError,
+)
+
+
+def _env(env_id, **extra):
+    """Build environment data for tests."""
+    data = {"id": env_id, "status": "active"}
+    data.update(extra)
+    return data
+
+
+class TestJsonDocument:
+    """Test cases for a single JSON document on disk."""
+
+    @pytest.fixture
+    def doc(self, tmp_path):
+        """A document in a private directory."""
+        return JsonDocument(str(tmp_path / "doc.json"))
+
+    def test_missing_document_returns_default(self, doc):
+        """Test that a missing document yields the default value."""
+        assert doc.load(default={"a": 1}) == {"a": 1}
+
+    def test_corrupt_document_raises(self, doc):
+        """Test that a corrupt document is reported instead of being reset."""
+        with open(doc.path, "w") as f:
+            f.write('{"production": {"id": "env-1", "sta')
+
+        with pytest.raises(StateStoreError, match="corrupt"):
+            doc.load()
+
+    def test_write_is_atomic(self, doc, tmp_path):
+        """Test that a failed write leaves the previous document untouched."""
+        with doc.locked(exclusive=True):
+            doc.write({"version": 1})
+            with patch("os.replace", side_effect=OSError("disk full")):
+                with pytest.raises(StateStoreError):
+                    doc.write({"version": 2})
+
+        assert doc.load() == {"version": 1}
+        assert not [p.name for p in tmp_path.iterdir() if p.name.startswith(".hyperstack_state.")]
+
+    def test_write_keeps_file_mode(self, doc):
+        """Test that replacing a document preserves its permissions."""
+        with doc.locked(exclusive=True):
+            doc.write({"version": 1})
+            os.chmod(doc.path, 0o640)
+            doc.write({"version": 2})
+
+        assert os.stat(doc.path).st_mode & 0o777 == 0o640
+
+    def test_journal_is_removed_after_commit(self, tmp_path):
+        """Test that the journal only exists while a write is in flight."""
+        doc = JsonDocument(str(tmp_path / "doc.json"), journal=True)
+        with doc.locked(exclusive=True):
+            doc.write({"version": 1})
+
+        assert not os.path.exists(doc.journal_path)
+        assert doc.load() == {"version": 1}
+
+    def test_journal_is_replayed(self, doc):
+        """Test that a complete journal entry is rolled forward on load."""
+        with open(doc.journal_path, "w") as f:
+            json.dump({"version": 2}, f)
+
+        assert doc.load() == {"version": 2}
+        assert not os.path.exists(doc.journal_path)
+        with open(doc.path) as f:
+            assert json.load(f) == {"version": 2}
+
+    def test_truncated_journal_is_discarded(self, doc):
+        """Test that a partially written journal does not replace the document."""
+        with doc.locked(exclusive=True):
+            doc.write({"version": 1})
+        with open(doc.journal_path, "w") as f:
+            f.write('{"versi')
+
+        assert doc.load() == {"version": 1}
+        assert not os.path.exists(doc.journal_path)
+
+    def test_lock_timeout_raises(self, doc):
+        """Test that a held lock surfaces as StateStoreError after the timeout."""
+        doc.lock.timeout = 0.05
+        other = JsonDocument(doc.path)
+
+        with other.lock.exclusive():
+            with pytest.raises(StateStoreError, match="Timed out"):
+                doc.load()
+
+        assert doc.lock.stats.timeouts == 1
+
+
+class TestJsonStateStore:
+    """Test cases for the shared state store."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        """A store backed by a private state directory."""
+        return JsonStateStore(directory=str(tmp_path / "state"))
+
+    def test_missing_directory_returns_default_state(self, store):
+        """Test that a fresh store yields the default environment."""
+        assert store.environments() == state_store.default_state()
+        assert not store.dirty
+        assert not os.path.exists(store.directory)
+
+    def test_first_flush_persists_default_state(self, store):
+        """Test that the seed environments are written with the first change."""
+        store.put_environment("staging", _env("env-1"))
+        store.flush()
+
+        fresh = JsonStateStore(directory=store.directory)
+        assert sorted(fresh.environments()) == ["production", "staging"]
+
+    def test_legacy_state_file_is_migrated(self, store):
+        """Test that the single-file state is split into shards on the first flush."""
+        with open(store.legacy_path, "w") as f:
+            json.dump({"staging": _env("env-1", vms={"web-01": {"status": "running"}}), "qa": _env("env-2")}, f)
+
+        assert sorted(store.environments()) == ["qa", "staging"]
+        store.update_vm("staging", "web-01", status="stopped")
+        store.flush()
+
+        fresh = JsonStateStore(directory=store.directory)
+        assert sorted(fresh.environments()) == ["qa", "staging"]
+        assert fresh.get_vm("staging", "web-01")["status"] == "stopped"
+
+    def test_deleting_every_environment_persists(self, store):
+        """Test that an empty state is not replaced by the default again."""
+        store.delete_environment("production")
+        store.flush()
+
+        assert JsonStateStore(directory=store.directory).environments() == {}
+
+    def test_environment_names_are_escaped(self, store):
+        """Test that environment names cannot escape the state directory."""
+        store.put_environment("../evil/name", _env("env-1"))
+        store.flush()
+
+        assert os.path.dirname(store.shard("../evil/name").path) == store.directory
+        assert "../evil/name" in JsonStateStore(directory=store.directory).environments()
+
+    def test_only_touched_shards_are_read(self, store):
+        """Test that environment lookups read a single shard."""
+        for i in range(5):
+            store.put_environment(f"env-{i}", _env(f"env-{i}"))
+        store.flush()
+
+        fresh = JsonStateStore(directory=store.directory)
+        with patch.object(JsonDocument, "load", autospec=True, side_effect=JsonDocument.load) as mock_load:
+            fresh.get_environment("env-3")
+            fresh.get_vm("env-3", "web-01")
+            list(fresh.iter_vms("env-3"))
+
+        assert [call.args[0].path for call in mock_load.call_args_list] == [fresh.shard("env-3").path]
+
+    def test_only_touched_shards_are_written(self, store):
+        """Test that a VM change rewrites only its environment's shard."""
+        store.put_environment("staging", _env("env-1", vms={}))
+        store.flush()
+
+        fresh = JsonStateStore(directory=store.directory)
+        fresh.put_vm("staging", "web-01", {"name": "web-01", "status": "running"})
+        with patch.object(JsonDocument, "write", autospec=True, side_effect=JsonDocument.write) as mock_write:
+            fresh.flush()
+
+        written = [call.args[0].path for call in mock_write.call_args_list]
+        # The environment's first VM also claims its public and private subnets
+        assert written == [fresh.subnets.path] * 2 + [fresh.index.path, fresh.shard("staging").path]
+
+    def test_many_changes_single_write(self, store):
+        """Test that a batch of VM changes is persisted with one shard write and one index write."""
+        store.put_environment("staging", _env("env-1"))
+        store.flush()
+        with patch.object(JsonDocument, "write", autospec=True, side_effect=JsonDocument.write) as mock_write:
+            for i in range(40):
+                store.put_vm("staging", f"vm-{i}", {"name": f"vm-{i}", "status": "running"})
+            store.update_vm("staging", "vm-0", status="stopped")
+            store.delete_vm("staging", "vm-1")
+            store.flush()
+            store.flush()
+
+        written = [call.args[0].path for call in mock_write.call_args_list]
+        assert written == [store.subnets.path] * 2 + [store.index.path, store.shard("staging").path]
+        saved = JsonStateStore(directory=store.directory).get_environment("staging")
+        assert len(saved["vms"]) == 39
+        assert saved["vms"]["vm-0"]["status"] == "stopped"
+
+    def test_flush_without_changes_does_not_write(self, store):
+        """Test that a read-only run never touches the state directory."""
+        store.environments()
+        store.flush()
+        assert not os.path.exists(store.directory)
+
+    def test_delete_environment_removes_shard(self, store):
+        """Test that deleting an environment removes its shard."""
+        store.put_environment("staging", _env("env-1"))
+        store.flush()
+        assert os.path.exists(store.shard("staging").path)
+
+        store.delete_environment("staging")
+        assert store.get_environment("staging") is None
+        assert "staging" not in store.environments()
+        store.flush()
+
+        assert not os.path.exists(store.shard("staging").path)
+
+    def test_vm_operations_on_missing_environment(self, store):
+        """Test that VM operations report missing environments and VMs."""
+        assert store.put_vm("missing", "vm", {}) is False
+        assert store.update_vm("production", "missing", status="running") is False
+        assert store.delete_vm("production", "missing") is False
+        assert store.delete_environment("missing") is False
+        assert store.set_rules("missing", []) is False
+        assert store.update_rules("missing", [], []) is False
+        assert not store.dirty
+
+    def test_update_rules_merges_with_other_tasks(self, store):
+        """Test that rule deltas are replayed on top of rules changed by another task."""
+        ssh, http, dns = ({"protocol": "tcp", "port": 22}, {"protocol": "tcp", "port": 80},
+                          {"protocol": "udp", "port": 53})
+        env = _env("env-1")
+        env["rules"] = [ssh, http]
+        store.put_environment("staging", env)
+        store.flush()
+        other = JsonStateStore(directory=store.directory)
+        other.update_rules("staging", added=[dns])
+        other.flush()
+
+        store.update_rules("staging", added=[ssh], removed=[http])
+        store.flush()
+
+        assert JsonStateStore(directory=store.directory).get_environment("staging")["rules"] == [ssh, dns]
+
+    def test_mark_converged(self, store):
+        """Test that the converged mark records the content hash, and is dropped if others changed the environment."""
+        store.put_environment("staging", _env("env-1"))
+        store.flush()
+        store.mark_converged("staging", "spec-1")
+        store.flush()
+
+        env = JsonStateStore(directory=store.directory).get_environment("staging")
+        assert env["converged"] == {"spec": "spec-1", "content": env["content_hash"]}
+
+        other = JsonStateStore(directory=store.directory)
+        other.put_vm("staging", "web", {"status": "running"})
+        store.mark_converged("staging", "spec-2")
+        other.flush()
+        store.flush()
+
+        assert "converged" not in JsonStateStore(directory=store.directory).get_environment("staging")
+
+    def test_iter_vms_by_environment(self, store):
+        """Test iterating the VMs of a single environment."""
+        store.put_environment("staging", _env("env-1"))
+        store.put_vm("staging", "vm-a", {"status": "running"})
+        store.put_vm("production", "vm-b", {"status": "running"})
+
+        assert [vm for _, vm, _ in store.iter_vms("staging")] == ["vm-a"]
+        assert sorted(vm for _, vm, _ in store.iter_vms()) == ["vm-a", "vm-b"]
+        assert list(store.iter_vms("missing")) == []
+
+    def test_reload_picks_up_external_changes(self, store):
+        """Test that reload() flushes and re-reads the shards."""
+        store.put_environment("staging", _env("env-1"))
+        store.reload()
+        assert store.get_environment("staging") is not None
+
+        other = JsonStateStore(directory=store.directory)
+        other.delete_environment("staging")
+        other.flush()
+
+        assert store.get_environment("staging") is not None
+        store.reload()
+        assert store.get_environment("staging") is None
+
+    def test_concurrent_flushes_merge(self, store):
+        """Test that two stores flushing in turn keep each other's changes."""
+        store.put_environment("staging", _env("env-1", vms={}))
+        store.flush()
+
+        first = JsonStateStore(directory=store.directory)
+        second = JsonStateStore(directory=store.directory)
+        first.put_vm("staging", "web-01", {"name": "web-01", "status": "running"})
+        second.put_vm("staging", "web-02", {"name": "web-02", "status": "running"})
+        second.update_vm("staging", "web-02", status="stopped")
+        first.flush()
+        second.flush()
+
+        merged = JsonStateStore(directory=store.directory)
+        assert sorted(vm for _, vm, _ in merged.iter_vms("staging")) == ["web-01", "web-02"]
+        assert merged.get_vm("staging", "web-02")["status"] == "stopped"
+        assert second.get_vm("staging", "web-01") is not None
+
+    def test_parallel_forks_keep_all_updates(self, store):
+        """Test that many forked writers do not lose each other's VMs."""
+        store.put_environment("staging", _env("env-1", vms={}))
+        store.flush()
+
+        def worker(index):
+            forked = JsonStateStore(directory=store.directory)
+            forked.put_vm("staging", f"vm-{index}", {"name": f"vm-{index}", "status": "running"})
+            forked.put_environment(f"env-{index}", _env(f"env-{index}"))
+            forked.flush()
+
+        ctx = multiprocessing.get_context("fork")
+        procs = [ctx.Process(target=worker, args=(i,)) for i in range(16)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+
+        assert all(proc.exitcode == 0 for proc in procs)
+        merged = JsonStateStore(directory=store.directory)
+        assert len(list(merged.iter_vms("staging"))) == 16
+        assert len(merged.environments()) == 18
+
+    def test_parallel_forks_creating_one_environment(self, store):
+        """Test that forks creating the same new environment keep each other's VMs and rules."""
+        def worker(index):
+            forked = JsonStateStore(directory=store.directory)
+            forked.put_environment("newenv", _env("env-new"))
+            forked.update_rules("newenv", added=[{"protocol": "tcp", "port": 8000 + index}])
+            forked.put_vm("newenv", f"vm-{index}", {"name": f"vm-{index}", "status": "running"})
+            forked.flush()
+
+        ctx = multiprocessing.get_context("fork")
+        procs = [ctx.Process(target=worker, args=(i,)) for i in range(16)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+
+        assert all(proc.exitcode == 0 for proc in procs)
+        env = JsonStateStore(directory=store.directory).get_environment("newenv")
+        assert sorted(env["vms"]) == sorted(f"vm-{i}" for i in range(16))
+        assert env["rules"] == [{"protocol": "tcp", "port_range": "8000-8015"}]
+        assert len(set(vm["private_ip"] for vm in env["vms"].values())) == 16
+
+    def test_replay_skips_vanished_targets(self, store):
+        """Test that changes to an environment deleted by another task are dropped."""
+        store.put_environment("staging", _env("env-1"))
+        store.flush()
+
+        other = JsonStateStore(directory=store.directory)
+        other.delete_environment("staging")
+        other.flush()
+
+        store.put_vm("staging", "web-01", {"name": "web-01", "status": "running"})
+        store.flush()
+
+        assert store.get_environment("staging") is None
+
+    def test_flush_locks_each_shard_exclusively(self, store):
+        """Test that flush() takes the exclusive lock of every shard it writes."""
+        store.put_environment("staging", _env("env-1"))
+        store.put_environment("qa", _env("env-2"))
+        store.flush()
+
+        assert store.shard("staging").lock.stats.acquired == 1
+        assert store.shard("qa").lock.stats.acquired == 1
+        assert store.lock_stats()["acquired"] == 2
+
+    def test_lock_timeout_keeps_changes_pending(self, store):
+        """Test that a contended shard surfaces as StateStoreError without losing changes."""
+        store.put_environment("staging", _env("env-1"))
+        store.flush()
+        store.shard("staging").lock.timeout = 0.05
+        store.set_rules("staging", [{"protocol": "tcp", "port": 22}])
+        other = JsonStateStore(directory=store.directory)
+
+        with other.shard("staging").lock.shared():
+            with pytest.raises(StateStoreError, match="Timed out"):
+                store.flush()
+
+        assert store.lock_stats()["timeouts"] == 1
+        assert store.dirty
+
+    def test_write_error_raises(self, tmp_path):
+        """Test that write failures surface as StateStoreError."""
+        store = JsonStateStore(directory=str(tmp_path / "missing-dir" / "state"))
+        store.put_environment("staging", _env("env-1"))
+
+        with pytest.raises(StateStoreError):
+            store.flush()
+
+    def test_settings_from_environment(self, tmp_path, monkeypatch):
+        """Test that environment variables configure the store."""
+        directory = str(tmp_path / "custom")
+        monkeypatch.setenv(state_store.STATE_DIR_ENV, directory)
+        monkeypatch.setenv(state_store.STATE_JOURNAL_ENV, "yes")
+        monkeypatch.setenv(state_store.STATE_LOCK_TIMEOUT_ENV, "2.5")
+
+        store = JsonStateStore()
+        assert store.directory == directory
+        assert store.journal is True
+        assert store.shard("x").lock.timeout == 2.5
+
+    def test_get_store_is_shared(self):
+        """Test that get_store() returns the same store for the whole run."""
+        assert state_store.get_store() is state_store.get_store()
+
+    def test_find_vms(self, store):
+        """Test looking up VMs by name and IP across environments."""
+        store.put_environment("staging", _env("env-1", vms={"web": {"status": "running", "public_ip": "1.1.1.1"}}))
+        store.put_environment("qa", _env("env-2", vms={"web": {"status": "stopped", "private_ip": "10.0.0.1"}}))
+
+        assert [env for env, _, _ in store.find_vms("web")] == ["qa", "staging"]
+        assert store.find_vms("missing") == []
+        assert [env for env, _, _ in store.find_vms_by_ip("10.0.0.1")] == ["qa"]
+        assert [env for env, _, _ in store.iter_vms(statuses=["running"])] == ["staging"]
+
+    def test_name_index_is_persisted(self, store):
+        """Test that flushes keep the name index in sync with the shards."""
+        store.put_environment("staging", _env("env-1", vms={"web": {"status": "running"}}))
+        store.put_environment("qa", _env("env-2", vms={"web": {"status": "running"}, "db": {"status": "running"}}))
+        store.flush()
+        store.delete_vm("qa", "web")
+        store.flush()
+
+        with open(store.index.path) as f:
+            index = json.load(f)
+        assert index["complete"] is True
+        assert index["names"] == {"web": ["staging"], "db": ["qa"]}
+
+    def test_name_lookup_reads_matching_shards_only(self, store):
+        """Test that a name lookup loads only the shard that contains the VM."""
+        for i in range(5):
+            store.put_environment(f"env-{i}", _env(f"env-{i}", vms={f"vm-{i}": {"status": "running"}}))
+        store.flush()
+
+        fresh = JsonStateStore(directory=store.directory)
+        with patch.object(JsonDocument, "load", autospec=True, side_effect=JsonDocument.load) as mock_load:
+            found = fresh.find_vms("vm-3")
+
+        assert [env for env, _, _ in found] == ["env-3"]
+        assert [call.args[0].path for call in mock_load.call_args_list] == [fresh.shard("env-3").path]
+
+    def test_ip_index(self, store):
+        """Test that IP lookups read only the matching shard and follow VM changes."""
+        for i in range(5):
+            store.put_environment(f"env-{i}", _env(f"env-{i}", vms={f"vm-{i}": {
+                "status": "running", "public_ip": f"1.1.1.{i}", "private_ip": f"10.0.0.{i}",
+            }}))
+        store.flush()
+
+        fresh = JsonStateStore(directory=store.directory)
+        with patch.object(JsonDocument, "load", autospec=True, side_effect=JsonDocument.load) as mock_load:
+            assert [vm for _, vm, _ in fresh.find_vms_by_ip("10.0.0.3")] == ["vm-3"]
+            assert [vm for _, vm, _ in fresh.find_vms_by_ip("1.1.1.3")] == ["vm-3"]
+        assert [call.args[0].path for call in mock_load.call_args_list] == [fresh.shard("env-3").path]
+
+        fresh.update_vm("env-3", "vm-3", public_ip="2.2.2.2")
+        assert fresh.find_vms_by_ip("1.1.1.3") == []
+        assert [vm for _, vm, _ in fresh.find_vms_by_ip("2.2.2.2")] == ["vm-3"]
+        fresh.flush()
+
+        with open(store.index.path) as f:
+            ips = json.load(f)["ips"]
+        assert "1.1.1.3" not in ips
+        assert ips["2.2.2.2"] == ["env-3"]
+
+    def test_old_index_version_is_rebuilt(self, store):
+        """Test that an index written before IPs were indexed is rebuilt."""
+        store.put_environment("staging", _env("env-1", vms={"web": {"status": "running", "public_ip": "1.1.1.1"}}))
+        store.flush()
+        with store.index.locked(exclusive=True):
+            store.index.write({"complete": True, "names": {"web": ["staging"]}})
+
+        assert [env for env, _, _ in JsonStateStore(directory=store.directory).find_vms_by_ip("1.1.1.1")] == ["staging"]
+
+    def test_missing_index_is_rebuilt(self, store):
+        """Test that a state directory without an index gets one on the first lookup."""
+        store.put_environment("staging", _env("env-1", vms={"web": {"status": "running"}}))
+        store.flush()
+        os.remove(store.index.path)
+
+        fresh = JsonStateStore(directory=store.directory)
+        assert [env for env, _, _ in fresh.find_vms("web")] == ["staging"]
+        with open(store.index.path) as f:
+            assert json.load(f)["names"] == {"web": ["staging"]}
+
+    def test_stale_index_entries_are_skipped(self, store):
+        """Test that index entries pointing at a missing VM are ignored."""
+        store.put_environment("staging", _env("env-1", vms={}))
+        store.flush()
+        with store.index.locked(exclusive=True):
+            store.index.write({"complete": True, "names": {"ghost": ["staging", "gone"]}})
+
+        assert JsonStateStore(directory=store.directory).find_vms("ghost") == []
+
+    def test_corrupt_index_is_rebuilt(self, store):
+        """Test that a corrupt index is treated as missing rather than failing lookups."""
+        store.put_environment("staging", _env("env-1", vms={"web": {"status": "running"}}))
+        store.flush()
+        with open(store.index.path, "w") as f:
+            f.write("{not json")
+
+        assert [env for env, _, _ in JsonStateStore(directory=store.directory).find_vms("web")] == ["staging"]
+
+
+class TestStoreSelection:
+    """Test cases for choosing the state backend."""
+
+    def test_default_backend_is_json(self, monkeypatch):
+        """Test that the json backend is used unless another one is requested."""
+        monkeypatch.delenv(state_store.STATE_BACKEND_ENV, raising=False)
+        assert isinstance(state_store.open_store(), JsonStateStore)
+
+    def test_backend_from_environment(self, tmp_path, monkeypatch):
+        """Test that HYPERSTACK_STATE_BACKEND selects the backend."""
+        monkeypatch.setenv(state_store.STATE_BACKEND_ENV, "sqlite")
+        monkeypatch.setenv("HYPERSTACK_STATE_DB", str(tmp_path / "state.db"))
+        assert state_store.open_store().backend == "sqlite"
+
+    def test_unknown_backend(self):
+        """Test that an unknown backend is rejected."""
+        with pytest.raises(StateStoreError, match="Unknown state backend"):
+            state_store.open_store("yaml")
+
+    def test_configure_store_keeps_matching_store(self):
+        """Test that configure_store() only replaces the store when the backend changes."""
+        current = state_store.get_store()
+        assert state_store.configure_store("json") is current
+        assert state_store.configure_store(None) is current
+
+    def test_configure_store_switches_backend(self, tmp_path, monkeypatch):
+        """Test that configure_store() opens a store for a different backend."""
+        monkeypatch.setenv("HYPERSTACK_STATE_DB", str(tmp_path / "state.db"))
+        assert state_store.configure_store("sqlite").backend == "sqlite"
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from unittest.mock import patch
+
+from ansible_collections.hyperstack.cloud.plugins.module_utils.backoff import Backoff
+from ansible_collections.hyperstack.cloud.plugins.module_utils.waiter import Waiter
+
+
+def _statuses(sequences):
+    """Build a lookup that returns the next status of each VM on every call (None means deleted)."""
+    iterators = dict((vm, iter(statuses)) for vm, statuses in sequences.items())
+
+    def lookup(env_name, vm_name):
+        status = next(iterators[vm_name])
+        return None if status is None else {"status": status}
+
+    return lookup
+
+
+class TestWaiter:
+    """Test cases for the shared multi-VM waiter."""
+
+    @patch('time.sleep')
+    def test_one_loop_for_many_vms(self, mock_sleep, state_store):
+        """Test that every tick checks all pending VMs and reloads the state once."""
+        lookup = _statuses({"a": ["starting", "running"], "b": ["starting", "starting", "running"]})
+        waiter = Waiter(lookup=lookup, backoff=Backoff(initial_interval=1.0))
+        waiter.add("prod", "a", "running")
+        waiter.add("prod", "b", "running")
+
+        with patch.object(state_store, 'reload') as mock_reload, \
+                patch('time.time', side_effect=[0, 0, 5, 12]):
+            results = waiter.wait(60)
+
+        assert waiter.polls == 3
+        assert mock_sleep.call_count == 2
+        assert mock_reload.call_count == 2
+        assert results[("prod", "a")] == {
+            "environment": "prod", "name": "a", "state": "running", "status": "running", "reached": True, "elapsed": 5,
+        }
+        assert results[("prod", "b")]["elapsed"] == 12
+        assert waiter.failed() == []
+
+    @patch('time.sleep')
+    def test_timeout(self, mock_sleep):
+        """Test that VMs still pending at the timeout are reported as not reached."""
+        waiter = Waiter(lookup=lambda env, vm: {"status": "starting"})
+        waiter.add("prod", "a", "running")
+
+        with patch('time.time', side_effect=[0, 0, 30, 60]):
+            results = waiter.wait(60)
+
+        assert results[("prod", "a")]["reached"] is False
+        assert results[("prod", "a")]["elapsed"] is None
+        assert [result["name"] for result in waiter.failed()] == ["a"]
+
+    def test_deleted_vms(self):
+        """Test that a deleted VM reaches terminated but fails any other state."""
+        waiter = Waiter(lookup=_statuses({"gone": [None], "lost": [None]}))
+        waiter.add("prod", "gone", "terminated")
+        waiter.add("prod", "lost", "running")
+
+        results = waiter.wait(60)
+
+        assert results[("prod", "gone")]["reached"] is True
+        assert results[("prod", "lost")]["reached"] is False
+        assert results[("prod", "lost")]["elapsed"] is not None
+
+    def test_reads_the_state_store(self, write_state):
+        """Test that the default lookup reads the shared state store."""
+        write_state({"prod": {"id": "env-1", "status": "active", "vms": {"a": {"status": "running"}}}})
+        waiter = Waiter()
+        waiter.add("prod", "a", "running")
+
+        assert waiter.wait(1)[("prod", "a")]["reached"] is True
+
+    @patch('time.sleep')
+    def test_notify_waits_on_the_store(self, mock_sleep, state_store):
+        """Test that notify mode waits on store changes instead of sleeping."""
+        lookup = _statuses({"a": ["starting", "running"]})
+        waiter = Waiter(lookup=lookup, backoff=Backoff(initial_interval=1.0), notify=True)
+        waiter.add("prod", "a", "running")
+
+        with patch.object(state_store, 'watch') as mock_watch:
+            mock_watch.return_value.wait.return_value = True
+            results = waiter.wait(60)
+
+        assert results[("prod", "a")]["reached"] is True
+        assert waiter.wakeups == 1
+        mock_sleep.assert_not_called()
+        mock_watch.return_value.close.assert_called_once_with()
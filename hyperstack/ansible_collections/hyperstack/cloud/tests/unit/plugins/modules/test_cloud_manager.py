@@ -6,6 +6,8 @@ import sys
 import os
 import importlib.util
 
+from ansible_collections.hyperstack.cloud.plugins.module_utils.state_store import get_store
+
 # Load the module directly by file path
 module_path = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "..", "..", "..", "..", "plugins", "modules", "cloud_manager.py")
@@ -514,3 +516,308 @@ def test_vm_creation_in_new_environment():
     assert result["changed"] is True
     mock_create.assert_called_once_with("new-env")
     mock_create_vm.assert_called_once()
+
+
+def test_vm_creation_warns_about_duplicate_name(write_state):
+    """Test that creating a VM whose name exists in another environment warns."""
+    write_state({
+        "production": {"id": "env-1", "status": "active", "vms": {"web-01": {"name": "web-01", "status": "running"}}},
+        "staging": {"id": "env-2", "status": "active", "vms": {}},
+    })
+    mock_module = MagicMock()
+    mock_module.params = {
+        "name": "staging",
+        "state": "present",
+        "firewall_rules": None,
+        "vms": [{"name": "web-01", "size": "small", "image": "ubuntu-22.04", "state": "running"}],
+    }
+    mock_module.check_mode = False
+
+    with patch("cloud_manager.AnsibleModule", return_value=mock_module):
+        cloud_manager.main()
+
+    mock_module.warn.assert_called_once()
+    assert "production" in mock_module.warn.call_args[0][0]
+    mock_module.fail_json.assert_not_called()
+
+
+def test_wait_for_vms_reports_completion_times(write_state):
+    """Test that wait=true tracks every changed VM in one waiter and reports how long each took."""
+    write_state({
+        "staging": {"id": "env-2", "status": "active", "vms": {
+            "db-01": {"name": "db-01", "status": "running"},
+            "old-01": {"name": "old-01", "status": "running"},
+        }},
+    })
+    mock_module = MagicMock()
+    mock_module.params = {
+        "name": "staging",
+        "state": "present",
+        "firewall_rules": None,
+        "vms": [
+            {"name": "web-01", "size": "small", "image": "ubuntu-22.04", "state": "running"},
+            {"name": "db-01", "size": "large", "image": "ubuntu-22.04", "state": "stopped"},
+            {"name": "old-01", "size": "small", "image": "ubuntu-22.04", "state": "absent"},
+        ],
+        "wait": True,
+        "wait_timeout": 30,
+    }
+    mock_module.check_mode = False
+
+    waiter_wait = cloud_manager.Waiter.wait
+    with patch("cloud_manager.AnsibleModule", return_value=mock_module):
+        with patch.object(cloud_manager.Waiter, "wait", autospec=True, side_effect=waiter_wait) as mock_wait:
+            cloud_manager.main()
+
+    mock_wait.assert_called_once()
+    mock_module.fail_json.assert_not_called()
+    result = mock_module.exit_json.call_args[1]
+    assert result["vm_wait"] == [
+        {"name": "web-01", "state": "running", "reached": True, "elapsed": 0},
+        {"name": "db-01", "state": "stopped", "reached": True, "elapsed": 0},
+        {"name": "old-01", "state": "terminated", "reached": True, "elapsed": 0},
+    ]
+
+
+def test_lock_stats_are_reported(write_state):
+    """Test that the state store's lock contention counters are returned."""
+    write_state({"staging": {"id": "env-2", "status": "active", "vms": {}}})
+    mock_module = MagicMock()
+    mock_module.params = {
+        "name": "staging",
+        "state": "present",
+        "firewall_rules": None,
+        "vms": [{"name": "web-01", "size": "small", "image": "ubuntu-22.04", "state": "running"}],
+    }
+    mock_module.check_mode = False
+
+    with patch("cloud_manager.AnsibleModule", return_value=mock_module):
+        cloud_manager.main()
+
+    stats = mock_module.exit_json.call_args[1]["lock_stats"]
+    assert set(stats) == {"acquired", "contended", "timeouts", "wait_time", "max_wait"}
+    assert stats["acquired"] >= 1
+    assert stats["timeouts"] == 0
+
+
+def test_parallel_vm_operations_keep_order_and_collect_errors(write_state):
+    """Test that parallel VM operations report results in order and every failure at once."""
+    write_state({"staging": {"id": "env-2", "status": "active", "vms": {}}})
+    mock_module = MagicMock()
+    mock_module.params = {
+        "name": "staging",
+        "state": "present",
+        "firewall_rules": None,
+        "vms": [
+            {"name": "vm-%d" % i, "size": "small", "image": "bad-image" if i in (1, 4) else "ubuntu-22.04",
+             "state": "running"}
+            for i in range(6)
+        ],
+        "parallelism": 3,
+    }
+    mock_module.check_mode = False
+
+    with patch("cloud_manager.AnsibleModule", return_value=mock_module):
+        cloud_manager.main()
+
+    result = mock_module.fail_json.call_args[1]
+    assert [entry["name"] for entry in result["vm_operations"]] == ["vm-%d" % i for i in range(6)]
+    assert [entry["failed"] for entry in result["vm_operations"]] == [False, True, False, False, True, False]
+    assert "Failed to manage VM 'vm-1'" in result["msg"]
+    assert "Failed to manage VM 'vm-4'" in result["msg"]
+    stored = get_store().get_environment("staging")["vms"]
+    assert sorted(stored) == ["vm-0", "vm-2", "vm-3", "vm-5"]
+
+
+def test_run_vm_operations_uses_threads():
+    """Test that operations run concurrently up to the parallelism limit."""
+    import threading
+
+    barrier = threading.Barrier(3, timeout=5)
+    operations = [({"name": "vm-%d" % i}, "start") for i in range(3)]
+
+    with patch.object(cloud_manager, "start_vm", side_effect=lambda env, vm: barrier.wait()) as start_vm:
+        errors = cloud_manager.run_vm_operations("staging", operations, parallelism=3)
+
+    assert errors == [None, None, None]
+    assert start_vm.call_count == 3
+
+
+def test_unknown_vm_action_is_rejected():
+    """Test that an unknown action fails instead of falling through to a delete."""
+    with patch.object(cloud_manager, "delete_vm") as delete_vm:
+        errors = cloud_manager.run_vm_operations("staging", [({"name": "vm-0"}, "started")])
+
+    delete_vm.assert_not_called()
+    assert errors == ["Failed to manage VM 'vm-0': unknown action 'started'"]
+
+
+def test_check_mode_returns_plan(write_state):
+    """Test that check mode returns the full plan without changing the state."""
+    write_state({"staging": {"id": "env-2", "status": "active", "rules": [{"protocol": "tcp", "port": 22}], "vms": {
+        "db-01": {"name": "db-01", "status": "running"},
+    }}})
+    mock_module = MagicMock()
+    mock_module.params = {
+        "name": "staging",
+        "state": "present",
+        "firewall_rules": [{"protocol": "tcp", "port": 443}],
+        "vms": [
+            {"name": "web-01", "size": "small", "image": "ubuntu-22.04", "state": "running"},
+            {"name": "db-01", "size": "large", "image": "ubuntu-22.04", "state": "stopped"},
+        ],
+    }
+    mock_module.check_mode = True
+
+    with patch("cloud_manager.AnsibleModule", return_value=mock_module):
+        cloud_manager.main()
+
+    plan = mock_module.exit_json.call_args[1]["plan"]
+    assert plan["environment_action"] is None
+    assert plan["firewall"] == {
+        "added": [{"protocol": "tcp", "port": 443}],
+        "removed": [{"protocol": "tcp", "port": 22}],
+    }
+    assert [(vm["name"], vm["action"]) for vm in plan["vms"]] == [("web-01", "create"), ("db-01", "stop")]
+    assert not get_store().dirty
+    assert get_store().get_vm("staging", "db-01")["status"] == "running"
+
+
+def test_plan_can_be_applied_later(write_state):
+    """Test that a plan built from one snapshot applies in one flush."""
+    store = write_state({"staging": {"id": "env-2", "status": "active", "vms": {}}})
+    plan = cloud_manager.build_plan(
+        "staging", "present", store.get_environment("staging"),
+        desired_rules=[{"protocol": "udp", "port": 53}],
+        desired_vms=[{"name": "web-01", "size": "small", "image": "rhel-9", "state": "running"}],
+    )
+
+    with patch.object(store, "flush") as mock_flush:
+        operations = cloud_manager.apply_plan(plan)
+
+    mock_flush.assert_not_called()
+    assert operations == [{"name": "web-01", "operation": "created", "failed": False}]
+    assert store.get_environment("staging")["rules"] == [{"protocol": "udp", "port": 53}]
+    assert store.get_vm("staging", "web-01")["status"] == "running"
+
+
+def test_diff_rules_is_set_based():
+    """Test that rule order and duplicates are not differences and only deltas are returned."""
+    current = [{"protocol": "udp", "port": 53}, {"protocol": "tcp", "port": 22}, {"protocol": "tcp", "port": 80}]
+    desired = [{"protocol": "tcp", "port": 443}, {"protocol": "tcp", "port": 22}, {"protocol": "udp", "port": 53},
+               {"protocol": "tcp", "port": 443}]
+
+    added, removed = cloud_manager.diff_rules(current, desired)
+
+    assert added == [{"protocol": "tcp", "port": 443}]
+    assert removed == [{"protocol": "tcp", "port": 80}]
+    assert cloud_manager.diff_rules(current, list(reversed(current))) == ([], [])
+
+
+def test_firewall_applies_only_deltas(write_state):
+    """Test that changed firewall rules are applied as deltas and reported in the diff."""
+    rules = [{"protocol": "tcp", "port": port} for port in range(1000, 1100)]
+    store = write_state({"staging": {"id": "env-2", "status": "active", "rules": rules, "vms": {}}})
+    mock_module = MagicMock()
+    mock_module.params = {
+        "name": "staging",
+        "state": "present",
+        "firewall_rules": rules[1:] + [{"protocol": "udp", "port": 53}],
+        "vms": None,
+    }
+    mock_module.check_mode = False
+
+    with patch("cloud_manager.AnsibleModule", return_value=mock_module), \
+            patch.object(store, "set_rules") as mock_set_rules:
+        cloud_manager.main()
+
+    mock_set_rules.assert_not_called()
+    result = mock_module.exit_json.call_args[1]
+    assert result["diff"]["added"] == [{"protocol": "udp", "port": 53}]
+    assert result["diff"]["removed"] == [{"protocol": "tcp", "port": 1000}]
+    stored = get_store().get_environment("staging")["rules"]
+    assert stored == [{"protocol": "tcp", "port_range": "1001-1099"}, {"protocol": "udp", "port": 53}]
+
+
+def test_invalid_port_range_fails(write_state):
+    """Test that an invalid port range is reported instead of applied."""
+    write_state({"staging": {"id": "env-2", "status": "active", "vms": {}}})
+    mock_module = MagicMock()
+    mock_module.params = {
+        "name": "staging",
+        "state": "present",
+        "firewall_rules": [{"protocol": "tcp", "port": None, "port_range": "9000-80", "source_cidr": None}],
+        "vms": None,
+    }
+    mock_module.fail_json.side_effect = SystemExit
+
+    with patch("cloud_manager.AnsibleModule", return_value=mock_module):
+        try:
+            cloud_manager.main()
+        except SystemExit:
+            pass
+
+    assert "Invalid firewall_rules" in mock_module.fail_json.call_args[1]["msg"]
+    assert not get_store().dirty
+
+
+def test_unchanged_spec_takes_fast_path(write_state):
+    """Test that a repeated run skips the diff until the environment changes."""
+    write_state({"staging": {"id": "env-2", "status": "active", "vms": {}}})
+    params = {
+        "name": "staging",
+        "state": "present",
+        "firewall_rules": [{"protocol": "tcp", "port": 22}],
+        "vms": [{"name": "web-01", "size": "small", "image": "ubuntu-22.04", "state": "running"}],
+    }
+
+    def run():
+        mock_module = MagicMock()
+        mock_module.params = dict(params)
+        mock_module.check_mode = False
+        build_plan = cloud_manager.build_plan
+        with patch("cloud_manager.AnsibleModule", return_value=mock_module), \
+                patch("cloud_manager.build_plan", side_effect=build_plan) as mock_build_plan:
+            cloud_manager.main()
+        return mock_module.exit_json.call_args[1], mock_build_plan.called
+
+    result, planned = run()
+    assert result["changed"] is True and planned
+
+    result, planned = run()
+    assert result["changed"] is False and not planned
+    assert [vm["name"] for vm in result["vms"]] == ["web-01"]
+
+    # A change made by another module invalidates the mark
+    get_store().update_vm("staging", "web-01", status="stopped")
+    get_store().flush()
+    result, planned = run()
+    assert result["changed"] is True and planned
+
+
+def test_api_error_while_applying_fails(write_state):
+    """Test that an API failure after planning is reported with fail_json instead of a traceback."""
+    from ansible_collections.hyperstack.cloud.plugins.module_utils.api_client import ApiError
+
+    write_state({"staging": {"id": "env-2", "status": "active", "vms": {}}})
+    mock_module = MagicMock()
+    mock_module.params = {
+        "name": "staging",
+        "state": "present",
+        "firewall_rules": [{"protocol": "tcp", "port": 22}],
+        "vms": None,
+    }
+    mock_module.check_mode = False
+    mock_module.fail_json.side_effect = SystemExit
+
+    with patch("cloud_manager.AnsibleModule", return_value=mock_module), \
+            patch("cloud_manager.apply_plan", side_effect=ApiError("server error", status=500)):
+        try:
+            cloud_manager.main()
+        except SystemExit:
+            pass
+
+    result = mock_module.fail_json.call_args[1]
+    assert result["msg"] == "Failed to apply changes: server error"
+    assert result["plan"]["firewall"]["added"] == [{"protocol": "tcp", "port": 22}]
+    mock_module.exit_json.assert_not_called()
@@ -46,10 +46,9 @@ class TestInstanceModule:
             }
         }
 
-    @patch('instance._load_state')
-    def test_find_instance_by_name_found(self, mock_load_state, mock_state):
+    def test_find_instance_by_name_found(self, write_state, mock_state):
         """Test finding an instance by name."""
-        mock_load_state.return_value = mock_state
+        write_state(mock_state)
         
         env_name, vm_name, vm_data = instance.find_instance_by_name("web-01")
         
@@ -57,10 +56,9 @@ class TestInstanceModule:
         assert vm_name == "web-01"
         assert vm_data["status"] == "running"
 
-    @patch('instance._load_state')
-    def test_find_instance_by_name_not_found(self, mock_load_state, mock_state):
+    def test_find_instance_by_name_not_found(self, write_state, mock_state):
         """Test searching for non-existent instance."""
-        mock_load_state.return_value = mock_state
+        write_state(mock_state)
         
         env_name, vm_name, vm_data = instance.find_instance_by_name("non-existent")
         
@@ -68,66 +66,76 @@ class TestInstanceModule:
         assert vm_name is None
         assert vm_data is None
 
-    @patch('instance._load_state')
-    @patch('instance._save_state')
-    def test_start_instance(self, mock_save_state, mock_load_state, mock_state):
+    def test_find_instance_by_name_duplicate(self, write_state, mock_state):
+        """Test that a name used in several environments is reported instead of guessed."""
+        mock_state["staging"] = {"id": "env-stg", "status": "active", "vms": {
+            "web-01": dict(mock_state["production"]["vms"]["web-01"], status="stopped")
+        }}
+        write_state(mock_state)
+
+        with pytest.raises(ValueError, match="'production', 'staging'"):
+            instance.find_instance_by_name("web-01")
+
+        env_name, vm_name, vm_data = instance.find_instance_by_name("web-01", "staging")
+        assert env_name == "staging"
+        assert vm_data["status"] == "stopped"
+
+    def test_find_instance_in_environment_not_found(self, write_state, mock_state):
+        """Test looking up an instance in an environment that does not have it."""
+        write_state(mock_state)
+
+        assert instance.find_instance_by_name("web-01", "staging") == (None, None, None)
+
+    def test_start_instance(self, write_state, mock_state):
         """Test starting a stopped/hibernated instance."""
         mock_state["production"]["vms"]["hibernated-vm"]["status"] = "hibernated"
-        mock_load_state.return_value = mock_state
+        store = write_state(mock_state)
         
         changed, previous_state = instance.start_instance("production", "hibernated-vm")
         
         assert changed is True
         assert previous_state == "hibernated"
-        mock_save_state.assert_called_once()
+        assert store.dirty
 
-    @patch('instance._load_state')
-    @patch('instance._save_state')
-    def test_start_already_running_instance(self, mock_save_state, mock_load_state, mock_state):
+    def test_start_already_running_instance(self, write_state, mock_state):
         """Test starting an already running instance."""
-        mock_load_state.return_value = mock_state
+        store = write_state(mock_state)
         
         changed, previous_state = instance.start_instance("production", "web-01")
         
         assert changed is False
         assert previous_state is None
-        mock_save_state.assert_not_called()
+        assert not store.dirty
 
-    @patch('instance._load_state')
-    @patch('instance._save_state')
-    def test_stop_instance(self, mock_save_state, mock_load_state, mock_state):
+    def test_stop_instance(self, write_state, mock_state):
         """Test stopping a running instance."""
-        mock_load_state.return_value = mock_state
+        store = write_state(mock_state)
         
         changed, previous_state = instance.stop_instance("production", "web-01")
         
         assert changed is True
         assert previous_state == "running"
-        mock_save_state.assert_called_once()
+        assert store.dirty
 
-    @patch('instance._load_state')
-    @patch('instance._save_state')
-    def test_restart_instance(self, mock_save_state, mock_load_state, mock_state):
+    def test_restart_instance(self, write_state, mock_state):
         """Test restarting an instance."""
-        mock_load_state.return_value = mock_state
+        store = write_state(mock_state)
         
         changed, previous_state = instance.restart_instance("production", "web-01")
         
         assert changed is True
         assert previous_state == "running"
-        mock_save_state.assert_called_once()
+        assert store.dirty
 
-    @patch('instance._load_state')
-    @patch('instance._save_state')
-    def test_terminate_instance(self, mock_save_state, mock_load_state, mock_state):
+    def test_terminate_instance(self, write_state, mock_state):
         """Test terminating an instance."""
-        mock_load_state.return_value = mock_state
+        store = write_state(mock_state)
         
         changed, previous_state = instance.terminate_instance("production", "web-01")
         
         assert changed is True
         assert previous_state == "running"
-        mock_save_state.assert_called_once()
+        assert store.dirty
 
     @patch('instance.find_instance_by_name')
     @patch('instance.time.sleep')
@@ -185,7 +193,7 @@ class TestInstanceModule:
     @patch('instance.find_instance_by_name')
     @patch('instance.start_instance')
     @patch('instance.wait_for_state')
-    @patch.object(AnsibleModule, 'exit_json')
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
     def test_main_start_hibernated_instance(self, mock_exit_json, mock_wait, mock_start, mock_find):
         """Test main function starting a hibernated instance."""
         mock_find.side_effect = [
@@ -206,8 +214,8 @@ class TestInstanceModule:
             }
             module.check_mode = False
             
-            instance.main.__globals__['module'] = module
-            instance.main()
+            with patch('instance.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance.main()
             
             mock_exit_json.assert_called_once()
             call_args = mock_exit_json.call_args[1]
@@ -216,7 +224,7 @@ class TestInstanceModule:
             assert "duration" in call_args
 
     @patch('instance.find_instance_by_name')
-    @patch.object(AnsibleModule, 'exit_json')
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
     def test_main_check_mode(self, mock_exit_json, mock_find):
         """Test main function in check mode."""
         mock_find.return_value = ("production", "hibernated-vm", {"status": "hibernated"})
@@ -232,8 +240,8 @@ class TestInstanceModule:
             }
             module.check_mode = True
             
-            instance.main.__globals__['module'] = module
-            instance.main()
+            with patch('instance.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance.main()
             
             mock_exit_json.assert_called_once()
             call_args = mock_exit_json.call_args[1]
@@ -241,7 +249,7 @@ class TestInstanceModule:
             assert call_args["operation"] == "would_running"
 
     @patch('instance.find_instance_by_name')
-    @patch.object(AnsibleModule, 'fail_json')
+    @patch.object(AnsibleModule, 'fail_json', side_effect=SystemExit)
     def test_main_instance_not_found(self, mock_fail_json, mock_find):
         """Test main function with non-existent instance."""
         mock_find.return_value = (None, None, None)
@@ -257,15 +265,15 @@ class TestInstanceModule:
             }
             module.check_mode = False
             
-            instance.main.__globals__['module'] = module
-            instance.main()
+            with patch('instance.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance.main()
             
             mock_fail_json.assert_called_once()
             call_args = mock_fail_json.call_args[1]
             assert "not found" in call_args["msg"]
 
     @patch('instance.find_instance_by_name')
-    @patch.object(AnsibleModule, 'fail_json')
+    @patch.object(AnsibleModule, 'fail_json', side_effect=SystemExit)
     def test_main_terminate_without_force(self, mock_fail_json, mock_find):
         """Test terminating running instance without force flag."""
         mock_find.return_value = ("production", "web-01", {"status": "running"})
@@ -281,8 +289,8 @@ class TestInstanceModule:
             }
             module.check_mode = False
             
-            instance.main.__globals__['module'] = module
-            instance.main()
+            with patch('instance.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance.main()
             
             mock_fail_json.assert_called_once()
             call_args = mock_fail_json.call_args[1]
@@ -290,7 +298,7 @@ class TestInstanceModule:
 
     @patch('instance.find_instance_by_name')
     @patch('instance.terminate_instance')
-    @patch.object(AnsibleModule, 'exit_json')
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
     def test_main_force_terminate(self, mock_exit_json, mock_terminate, mock_find):
         """Test force terminating a running instance."""
         mock_find.side_effect = [
@@ -310,11 +318,164 @@ class TestInstanceModule:
             }
             module.check_mode = False
             
-            instance.main.__globals__['module'] = module
-            instance.main()
+            with patch('instance.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance.main()
             
             mock_exit_json.assert_called_once()
             call_args = mock_exit_json.call_args[1]
             assert call_args["changed"] is True
             assert call_args["operation"] == "terminate"
-            assert call_args["instance"]["state"] == "terminated"
\ No newline at end of file
+            assert call_args["instance"]["state"] == "terminated"
+
+
+class TestInstanceBulkOperations:
+    """Test cases for managing many instances in one task."""
+
+    @pytest.fixture
+    def fleet_state(self):
+        """Two environments with instances in different states."""
+        def vm(name, status):
+            return {"name": name, "size": "small", "image": "ubuntu-22.04", "status": status}
+
+        return {
+            "gpu": {"id": "env-gpu", "status": "active", "vms": {
+                "gpu-01": vm("gpu-01", "running"),
+                "gpu-02": vm("gpu-02", "running"),
+                "gpu-03": vm("gpu-03", "stopped"),
+                "gpu-04": vm("gpu-04", "hibernated"),
+            }},
+            "web": {"id": "env-web", "status": "active", "vms": {
+                "web-01": vm("web-01", "running"),
+            }},
+        }
+
+    def run_main(self, params):
+        """Run main() with the given params and return the kwargs of exit_json or fail_json."""
+        defaults = {
+            "name": None, "names": None, "environment": None, "instance_states": [],
+            "state": "running", "wait": True, "wait_timeout": 300, "force": False,
+        }
+        defaults.update(params)
+        with patch.object(AnsibleModule, '__init__', return_value=None), \
+                patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit) as mock_exit, \
+                patch.object(AnsibleModule, 'fail_json', side_effect=SystemExit) as mock_fail:
+            module = AnsibleModule(argument_spec={}, supports_check_mode=True)
+            module.params = defaults
+            module.check_mode = params.get("check_mode", False)
+            with patch('instance.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance.main()
+        if mock_fail.called:
+            return dict(mock_fail.call_args[1], failed=True)
+        return mock_exit.call_args[1]
+
+    def test_stop_environment_with_filter(self, write_state, fleet_state, state_store):
+        """Test stopping every running instance in an environment with one flush."""
+        write_state(fleet_state)
+
+        with patch.object(state_store, 'flush', wraps=state_store.flush) as mock_flush:
+            result = self.run_main({"environment": "gpu", "instance_states": ["running"], "state": "stopped"})
+
+        assert mock_flush.call_count == 1
+        assert result["changed"] is True
+        assert sorted(entry["name"] for entry in result["instances"]) == ["gpu-01", "gpu-02"]
+        assert all(entry["state"] == "stopped" for entry in result["instances"])
+        assert result["summary"] == {"total": 2, "changed": 2, "failed": 0, "ok": 2}
+        assert result["lock_stats"]["acquired"] >= 1
+        assert state_store.get_vm("gpu", "gpu-04")["status"] == "hibernated"
+        assert state_store.get_vm("web", "web-01")["status"] == "running"
+
+    def test_missing_environment_fails(self, write_state, fleet_state):
+        """Test that a bulk operation on an environment that does not exist fails instead of matching nothing."""
+        write_state(fleet_state)
+
+        result = self.run_main({"environment": "gpus", "state": "stopped"})
+
+        assert result["failed"] is True
+        assert result["msg"] == "Environment 'gpus' not found"
+
+    def test_names_single_combined_wait(self, write_state, fleet_state):
+        """Test that all started instances share one wait."""
+        write_state(fleet_state)
+
+        with patch.object(instance.Waiter, 'wait', autospec=True, side_effect=instance.Waiter.wait) as mock_wait:
+            result = self.run_main({"names": ["gpu-03", "gpu-04", "web-01"], "state": "running"})
+
+        mock_wait.assert_called_once()
+        assert sorted(vm for _, vm in mock_wait.call_args[0][0].results) == ["gpu-03", "gpu-04"]
+        waited = dict((entry["name"], entry.get("wait_time")) for entry in result["instances"])
+        assert waited == {"gpu-03": 0, "gpu-04": 0, "web-01": None}
+        assert result["summary"] == {"total": 3, "changed": 2, "failed": 0, "ok": 3}
+        operations = dict((entry["name"], entry["operation"]) for entry in result["instances"])
+        assert operations == {"gpu-03": "start", "gpu-04": "start", "web-01": "already_running"}
+
+    def test_partial_failure(self, write_state, fleet_state, state_store):
+        """Test that per-instance failures are reported without blocking the other instances."""
+        write_state(fleet_state)
+
+        result = self.run_main({"names": ["gpu-01", "gpu-03", "missing"], "state": "terminated"})
+
+        assert result["failed"] is True
+        assert result["summary"] == {"total": 3, "changed": 1, "failed": 2, "ok": 1}
+        by_name = dict((entry["name"], entry) for entry in result["instances"])
+        assert "force=true" in by_name["gpu-01"]["msg"]
+        assert "not found" in by_name["missing"]["msg"]
+        assert by_name["gpu-03"]["state"] == "terminated"
+        assert state_store.get_vm("gpu", "gpu-03") is None
+
+    def test_wait_timeout_marks_instances_failed(self, write_state, fleet_state):
+        """Test that instances that never settle fail with a timeout."""
+        write_state(fleet_state)
+
+        def lookup(env_name, vm_name):
+            # gpu-03 never finishes starting
+            return {"status": "starting"} if vm_name == "gpu-03" else {"status": "running"}
+
+        with patch('instance._lookup_instance', side_effect=lookup), patch('instance.time.sleep'):
+            result = self.run_main({"names": ["gpu-03", "gpu-04"], "state": "running", "wait_timeout": 0.05})
+
+        assert result["summary"]["failed"] == 1
+        assert "Timeout" in result["instances"][0]["msg"]
+        assert result["instances"][0]["wait_time"] is None
+        assert result["instances"][1]["wait_time"] == 0
+
+    def test_check_mode(self, write_state, fleet_state, state_store):
+        """Test that check mode reports what would change without changing anything."""
+        write_state(fleet_state)
+
+        result = self.run_main({"environment": "gpu", "state": "stopped", "check_mode": True})
+
+        assert result["changed"] is True
+        assert result["summary"]["changed"] == 3
+        assert not state_store.dirty
+        assert state_store.get_vm("gpu", "gpu-01")["status"] == "running"
+
+    @patch('instance.find_instance_by_name')
+    @patch('instance.time.sleep')
+    def test_wait_backs_off(self, mock_sleep, mock_find):
+        """Test that poll delays grow up to the maximum and polls are counted."""
+        mock_find.return_value = ("prod", "a", {"status": "starting"})
+        backoff = instance.Backoff(initial_interval=1.0, max_interval=4.0, multiplier=2.0)
+
+        with patch('instance.time.time', side_effect=[0] + list(range(0, 100, 10))):
+            assert instance.wait_for_state("prod", "a", "running", 55, backoff) is False
+
+        delays = [call.args[0] for call in mock_sleep.call_args_list]
+        assert backoff.polls == 6
+        assert 0.5 <= delays[0] <= 1.0
+        assert 1.0 <= delays[1] <= 2.0
+        assert all(2.0 <= delay <= 4.0 for delay in delays[2:])
+
+    def test_polls_reported(self, write_state, fleet_state):
+        """Test that the number of polls is part of the result."""
+        write_state(fleet_state)
+
+        result = self.run_main({"names": ["gpu-03"], "state": "running", "wait_interval": 0.01})
+
+        assert result["polls"] == 1
+
+    def test_invalid_wait_settings(self):
+        """Test that inconsistent backoff options are rejected."""
+        result = self.run_main({"name": "gpu-01", "wait_interval": 5.0, "wait_max_interval": 1.0})
+
+        assert result["failed"] is True
+        assert "Invalid wait settings" in result["msg"]
@@ -11,6 +11,7 @@ from ansible.module_utils.basic import AnsibleModule
 import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../../../plugins/modules'))
 import instance_info
+from ansible_collections.hyperstack.cloud.plugins.module_utils import instances
 
 
 class TestInstanceInfoModule:
@@ -61,10 +62,9 @@ class TestInstanceInfoModule:
             }
         }
 
-    @patch('instance_info._load_state')
-    def test_get_instance_by_name_found(self, mock_load_state, mock_state):
+    def test_get_instance_by_name_found(self, write_state, mock_state):
         """Test finding an instance by name."""
-        mock_load_state.return_value = mock_state
+        write_state(mock_state)
         
         result = instance_info.get_instance_by_name("web-01")
         
@@ -74,19 +74,17 @@ class TestInstanceInfoModule:
         assert result["environment"] == "production"
         assert result["public_ip"] == "192.168.1.100"
 
-    @patch('instance_info._load_state')
-    def test_get_instance_by_name_not_found(self, mock_load_state, mock_state):
+    def test_get_instance_by_name_not_found(self, write_state, mock_state):
         """Test searching for non-existent instance."""
-        mock_load_state.return_value = mock_state
+        write_state(mock_state)
         
         result = instance_info.get_instance_by_name("non-existent")
         
         assert result is None
 
-    @patch('instance_info._load_state')
-    def test_get_instance_by_ip(self, mock_load_state, mock_state):
+    def test_get_instance_by_ip(self, write_state, mock_state):
         """Test finding an instance by IP address."""
-        mock_load_state.return_value = mock_state
+        write_state(mock_state)
         
         result = instance_info.get_instance_by_ip("192.168.1.100")
         
@@ -94,19 +92,26 @@ class TestInstanceInfoModule:
         assert result["name"] == "web-01"
         assert result["public_ip"] == "192.168.1.100"
 
-    @patch('instance_info._load_state')
-    def test_get_instance_by_invalid_ip(self, mock_load_state, mock_state):
+    def test_get_instance_by_private_ip(self, write_state, mock_state):
+        """Test finding an instance by private IP address."""
+        write_state(mock_state)
+
+        result = instance_info.get_instance_by_ip("10.0.1.101")
+
+        assert result["name"] == "web-02"
+        assert instance_info.get_instance_by_ip("10.9.9.9") is None
+
+    def test_get_instance_by_invalid_ip(self, write_state, mock_state):
         """Test searching with invalid IP address."""
-        mock_load_state.return_value = mock_state
+        write_state(mock_state)
         
         result = instance_info.get_instance_by_ip("invalid-ip")
         
         assert result is None
 
-    @patch('instance_info._load_state')
-    def test_get_instances_in_environment(self, mock_load_state, mock_state):
+    def test_get_instances_in_environment(self, write_state, mock_state):
         """Test getting all instances in an environment."""
-        mock_load_state.return_value = mock_state
+        write_state(mock_state)
         
         result = instance_info.get_instances_in_environment("production")
         
@@ -114,19 +119,17 @@ class TestInstanceInfoModule:
         assert any(vm["name"] == "web-01" for vm in result)
         assert any(vm["name"] == "web-02" for vm in result)
 
-    @patch('instance_info._load_state')
-    def test_get_instances_in_empty_environment(self, mock_load_state, mock_state):
+    def test_get_instances_in_empty_environment(self, write_state):
         """Test getting instances from environment without VMs."""
-        mock_load_state.return_value = {"empty": {"id": "env-empty", "status": "active"}}
+        write_state({"empty": {"id": "env-empty", "status": "active"}})
         
         result = instance_info.get_instances_in_environment("empty")
         
         assert len(result) == 0
 
-    @patch('instance_info._load_state')
-    def test_get_all_instances(self, mock_load_state, mock_state):
+    def test_get_all_instances(self, write_state, mock_state):
         """Test getting all instances across environments."""
-        mock_load_state.return_value = mock_state
+        write_state(mock_state)
         
         result = instance_info.get_all_instances()
         
@@ -134,30 +137,14 @@ class TestInstanceInfoModule:
         environments = {vm["environment"] for vm in result}
         assert "production" in environments
         assert "staging" in environments
-
-    def test_filter_instances_by_state(self):
-        """Test filtering instances by state."""
-        instances = [
-            {"name": "vm1", "state": "running"},
-            {"name": "vm2", "state": "stopped"},
-            {"name": "vm3", "state": "hibernated"},
-            {"name": "vm4", "state": "running"}
+        assert [vm["name"] for vm in instance_info.get_all_instances(["stopped", "hibernated"])] == [
+            "web-02", "test-vm",
         ]
-        
-        running_instances = instance_info.filter_instances_by_state(instances, ["running"])
-        assert len(running_instances) == 2
-        
-        stopped_instances = instance_info.filter_instances_by_state(instances, ["stopped", "hibernated"])
-        assert len(stopped_instances) == 2
-        
-        all_instances = instance_info.filter_instances_by_state(instances, [])
-        assert len(all_instances) == 4
 
-    @patch('instance_info._load_state')
-    @patch.object(AnsibleModule, 'exit_json')
-    def test_main_query_by_name(self, mock_exit_json, mock_load_state, mock_state):
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
+    def test_main_query_by_name(self, mock_exit_json, write_state, mock_state):
         """Test main function with name query."""
-        mock_load_state.return_value = mock_state
+        write_state(mock_state)
         
         with patch.object(AnsibleModule, '__init__', return_value=None):
             module = AnsibleModule(argument_spec={}, supports_check_mode=True)
@@ -168,8 +155,8 @@ class TestInstanceInfoModule:
                 "instance_states": []
             }
             
-            instance_info.main.__globals__['module'] = module
-            instance_info.main()
+            with patch('instance_info.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance_info.main()
             
             mock_exit_json.assert_called_once()
             call_args = mock_exit_json.call_args[1]
@@ -178,11 +165,64 @@ class TestInstanceInfoModule:
             assert len(call_args["instances"]) == 1
             assert call_args["instances"][0]["name"] == "web-01"
 
-    @patch('instance_info._load_state')
-    @patch.object(AnsibleModule, 'exit_json')
-    def test_main_query_by_environment(self, mock_exit_json, mock_load_state, mock_state):
+    @patch.object(AnsibleModule, 'warn')
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
+    def test_main_query_duplicate_name(self, mock_exit_json, mock_warn, write_state, mock_state):
+        """Test that a name used in several environments returns every match with a warning."""
+        mock_state["staging"] = {"id": "env-stg", "status": "active", "vms": {
+            "web-01": dict(mock_state["production"]["vms"]["web-01"], public_ip="192.168.3.100")
+        }}
+        write_state(mock_state)
+
+        with patch.object(AnsibleModule, '__init__', return_value=None):
+            module = AnsibleModule(argument_spec={}, supports_check_mode=True)
+            module.params = {
+                "name": "web-01",
+                "ip_address": None,
+                "environment": None,
+                "instance_states": []
+            }
+
+            with patch('instance_info.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance_info.main()
+
+            call_args = mock_exit_json.call_args[1]
+            assert [i["environment"] for i in call_args["instances"]] == ["production", "staging"]
+            mock_warn.assert_called_once()
+            assert "'production', 'staging'" in mock_warn.call_args[0][0]
+
+    @patch.object(AnsibleModule, 'warn')
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
+    def test_main_query_shared_ip(self, mock_exit_json, mock_warn, write_state, mock_state):
+        """Test that an IP address used by several instances returns every match with a warning."""
+        mock_state["staging"]["vms"]["test-vm"]["private_ip"] = "10.0.1.100"
+        write_state(mock_state)
+
+        with patch.object(AnsibleModule, '__init__', return_value=None):
+            module = AnsibleModule(argument_spec={}, supports_check_mode=True)
+            module.params = {
+                "name": None,
+                "ip_address": "10.0.1.100",
+                "environment": None,
+                "instance_states": []
+            }
+
+            with patch('instance_info.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance_info.main()
+
+            call_args = mock_exit_json.call_args[1]
+            assert [i["name"] for i in call_args["instances"]] == ["web-01", "test-vm"]
+            mock_warn.assert_called_once()
+            assert "'production.web-01', 'staging.test-vm'" in mock_warn.call_args[0][0]
+
+        with pytest.raises(ValueError, match="IP address '10.0.1.100' matches instances"):
+            instance_info.get_instance_by_ip("10.0.1.100")
+        assert instance_info.get_instance_by_ip("10.0.1.100", ["running"])["name"] == "web-01"
+
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
+    def test_main_query_by_environment(self, mock_exit_json, write_state, mock_state):
         """Test main function with environment query."""
-        mock_load_state.return_value = mock_state
+        write_state(mock_state)
         
         with patch.object(AnsibleModule, '__init__', return_value=None):
             module = AnsibleModule(argument_spec={}, supports_check_mode=True)
@@ -193,8 +233,8 @@ class TestInstanceInfoModule:
                 "instance_states": []
             }
             
-            instance_info.main.__globals__['module'] = module
-            instance_info.main()
+            with patch('instance_info.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance_info.main()
             
             mock_exit_json.assert_called_once()
             call_args = mock_exit_json.call_args[1]
@@ -202,11 +242,10 @@ class TestInstanceInfoModule:
             assert call_args["count"] == 2
             assert len(call_args["instances"]) == 2
 
-    @patch('instance_info._load_state')
-    @patch.object(AnsibleModule, 'exit_json')
-    def test_main_query_with_state_filter(self, mock_exit_json, mock_load_state, mock_state):
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
+    def test_main_query_with_state_filter(self, mock_exit_json, write_state, mock_state):
         """Test main function with state filtering."""
-        mock_load_state.return_value = mock_state
+        write_state(mock_state)
         
         with patch.object(AnsibleModule, '__init__', return_value=None):
             module = AnsibleModule(argument_spec={}, supports_check_mode=True)
@@ -217,8 +256,8 @@ class TestInstanceInfoModule:
                 "instance_states": ["hibernated"]
             }
             
-            instance_info.main.__globals__['module'] = module
-            instance_info.main()
+            with patch('instance_info.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance_info.main()
             
             mock_exit_json.assert_called_once()
             call_args = mock_exit_json.call_args[1]
@@ -226,11 +265,157 @@ class TestInstanceInfoModule:
             assert call_args["count"] == 1
             assert call_args["instances"][0]["state"] == "hibernated"
 
-    @patch('instance_info._load_state')
-    @patch.object(AnsibleModule, 'fail_json')
-    def test_main_with_exception(self, mock_fail_json, mock_load_state):
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
+    def test_main_query_by_names(self, mock_exit_json, write_state, mock_state):
+        """Test resolving several names in one call."""
+        write_state(mock_state)
+
+        with patch.object(AnsibleModule, '__init__', return_value=None):
+            module = AnsibleModule(argument_spec={}, supports_check_mode=True)
+            module.params = {
+                "name": None,
+                "names": ["web-02", "test-vm", "missing", "web-02"],
+                "ip_address": None,
+                "environment": None,
+                "instance_states": []
+            }
+
+            with patch('instance_info.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance_info.main()
+
+            call_args = mock_exit_json.call_args[1]
+            assert list(call_args["results"]) == ["web-02", "test-vm", "missing"]
+            assert call_args["results"]["test-vm"][0]["environment"] == "staging"
+            assert call_args["results"]["missing"] == []
+            assert call_args["not_found"] == ["missing"]
+            assert [i["name"] for i in call_args["instances"]] == ["web-02", "test-vm"]
+            assert call_args["count"] == 2
+
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
+    def test_main_query_by_ip_addresses(self, mock_exit_json, write_state, mock_state):
+        """Test resolving several IP addresses in one call, with a state filter."""
+        write_state(mock_state)
+
+        with patch.object(AnsibleModule, '__init__', return_value=None):
+            module = AnsibleModule(argument_spec={}, supports_check_mode=True)
+            module.params = {
+                "name": None,
+                "ip_address": None,
+                "ip_addresses": ["192.168.1.100", "10.0.1.100", "10.0.1.101", "not-an-ip"],
+                "environment": None,
+                "instance_states": ["running"]
+            }
+
+            with patch('instance_info.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance_info.main()
+
+            call_args = mock_exit_json.call_args[1]
+            results = call_args["results"]
+            assert results["192.168.1.100"][0]["name"] == "web-01"
+            assert results["10.0.1.100"] == results["192.168.1.100"]
+            assert results["10.0.1.101"] == []
+            assert call_args["not_found"] == ["10.0.1.101", "not-an-ip"]
+            assert [i["name"] for i in call_args["instances"]] == ["web-01"]
+
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
+    def test_main_paginates_before_formatting(self, mock_exit_json, write_state):
+        """Test that only the requested page of matching instances is formatted."""
+        vms = dict(
+            (f"vm-{i:03d}", {"status": "hibernated" if i % 50 == 0 else "running"})
+            for i in range(500)
+        )
+        write_state({"production": {"id": "env-prod", "status": "active", "vms": vms}})
+
+        with patch.object(AnsibleModule, '__init__', return_value=None):
+            module = AnsibleModule(argument_spec={}, supports_check_mode=True)
+            module.params = {
+                "name": None,
+                "ip_address": None,
+                "environment": None,
+                "instance_states": ["hibernated"],
+                "limit": 3,
+                "offset": 2,
+            }
+
+            with patch.object(instances, 'InstanceRecord', wraps=instances.InstanceRecord) as details, \
+                    patch('instance_info.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance_info.main()
+
+        call_args = mock_exit_json.call_args[1]
+        assert [i["name"] for i in call_args["instances"]] == ["vm-100", "vm-150", "vm-200"]
+        assert call_args["count"] == 3
+        assert call_args["total"] == 10
+        assert details.call_count == 3
+
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
+    def test_main_filters_and_fields(self, mock_exit_json, write_state, mock_state):
+        """Test attribute filters and field projection, also for batch queries."""
+        write_state(mock_state)
+
+        with patch.object(AnsibleModule, '__init__', return_value=None):
+            module = AnsibleModule(argument_spec={}, supports_check_mode=True)
+            module.params = {
+                "name": None,
+                "names": ["web-01", "web-02", "test-vm"],
+                "ip_address": None,
+                "environment": None,
+                "instance_states": [],
+                "filters": {"size": ["small"], "environment": "prod*"},
+                "fields": ["state"],
+            }
+
+            with patch('instance_info.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance_info.main()
+
+        call_args = mock_exit_json.call_args[1]
+        assert call_args["instances"] == [
+            {"name": "web-01", "state": "running", "environment": "production"},
+            {"name": "web-02", "state": "stopped", "environment": "production"},
+        ]
+        assert call_args["not_found"] == ["test-vm"]
+
+    @patch.object(AnsibleModule, 'exit_json', side_effect=SystemExit)
+    def test_main_cached_until_write(self, mock_exit_json, write_state, mock_state):
+        """Test that results are served from the cache until the client writes."""
+        write_state(mock_state)
+
+        def run():
+            with patch.object(AnsibleModule, '__init__', return_value=None):
+                module = AnsibleModule(argument_spec={}, supports_check_mode=True)
+                module.params = {
+                    "name": None,
+                    "ip_address": None,
+                    "environment": "production",
+                    "instance_states": ["running"],
+                    "cache_ttl": 300,
+                }
+                with patch('instance_info.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                    instance_info.main()
+            return mock_exit_json.call_args[1]
+
+        first = run()
+        assert first["cached"] is False
+        assert [i["name"] for i in first["instances"]] == ["web-01"]
+
+        with patch('instance_info.iter_environment_vms') as lookup:
+            second = run()
+        lookup.assert_not_called()
+        assert second["cached"] is True
+        assert second["instances"] == first["instances"]
+
+        client = instance_info.get_client()
+        client.update_vm("production", "web-02", status="running")
+        client.flush()
+
+        third = run()
+        assert third["cached"] is False
+        assert [i["name"] for i in third["instances"]] == ["web-01", "web-02"]
+
+    @patch('instance_info.get_client')
+    @patch.object(AnsibleModule, 'fail_json', side_effect=SystemExit)
+    def test_main_with_exception(self, mock_fail_json, mock_get_client):
         """Test main function error handling."""
-        mock_load_state.side_effect = Exception("Test error")
+        mock_get_client.side_effect = Exception("Test error")
         
         with patch.object(AnsibleModule, '__init__', return_value=None):
             module = AnsibleModule(argument_spec={}, supports_check_mode=True)
@@ -241,8 +426,8 @@ class TestInstanceInfoModule:
                 "instance_states": []
             }
             
-            instance_info.main.__globals__['module'] = module
-            instance_info.main()
+            with patch('instance_info.AnsibleModule', return_value=module), pytest.raises(SystemExit):
+                instance_info.main()
             
             mock_fail_json.assert_called_once()
             call_args = mock_fail_json.call_args[1]